@@ -15,10 +15,10 @@ from langchain.chains import LLMChain
 from langchain.chains.summarize import load_summarize_chain
 from langchain.docstore.document import Document
 from langchain.prompts import PromptTemplate
-from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain_groq import ChatGroq
 
 from .config import get_default_model
+from .text_splitter import RecursiveTextSplitter
 
 load_dotenv(".env")
 
@@ -119,7 +119,7 @@ def summarize_video(url, filename="audio"):
             if not text:
                 return "Error: No text was extracted from the video"
 
-            text_splitter = RecursiveCharacterTextSplitter(
+            text_splitter = RecursiveTextSplitter(
                 chunk_size=1000, chunk_overlap=50, separators=[" ", ",", "\\n"]
             )
             texts = text_splitter.split_text(text)
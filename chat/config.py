@@ -72,6 +72,212 @@ MAX_YOUTUBE_RESULTS = 10
 DEFAULT_EMBEDDING_MODEL = "all-MiniLM-L6-v2"
 EMBEDDING_DIMENSIONS = 384
 
+# Embedding backend: "huggingface" (Inference API over HTTP), "local"
+# (all-MiniLM-L6-v2 in-process on CPU through ONNX Runtime, int8 quantised) or
+# "hashing" (deterministic word hashing, for offline tests and benchmarks only)
+EMBEDDING_BACKEND = os.environ.get("EMBEDDING_BACKEND", "huggingface")
+
+# Local backend settings. The default ONNX file is the int8 export published in
+# the sentence-transformers repo; use onnx/model_qint8_avx512.onnx on AVX-512 hosts.
+LOCAL_EMBEDDING_ONNX_FILE = os.environ.get(
+    "LOCAL_EMBEDDING_ONNX_FILE", "onnx/model_quint8_avx2.onnx"
+)
+LOCAL_EMBEDDING_BATCH_SIZE = 32
+LOCAL_EMBEDDING_MAX_LENGTH = 256  # all-MiniLM-L6-v2 max_seq_length
+LOCAL_EMBEDDING_THREADS = int(os.environ.get("LOCAL_EMBEDDING_THREADS", 0))  # 0 = auto
+
+# Persistent chunk embedding cache (EmbeddingCacheEntry). When it grows past
+# the max size the least recently used entries are evicted down to the low-water mark.
+EMBEDDING_CACHE_ENABLED = (
+    os.environ.get("EMBEDDING_CACHE_ENABLED", "True").lower() == "true"
+)
+EMBEDDING_CACHE_MAX_ENTRIES = int(os.environ.get("EMBEDDING_CACHE_MAX_ENTRIES", 500000))
+EMBEDDING_CACHE_EVICT_TO = 0.9  # fraction of max entries kept after eviction
+# The size is checked once per this many new entries in a process, from the
+# planner's row estimate on PostgreSQL, so ingestion never waits on COUNT(*)
+EMBEDDING_CACHE_EVICT_CHECK_ROWS = 5000
+
+# In-process LRU for query embeddings used by retrieve_docs. The optional shared
+# tier stores them in the Django cache so every gunicorn worker benefits
+# (only useful with a shared backend such as Redis or Memcached).
+QUERY_EMBEDDING_CACHE_ENABLED = (
+    os.environ.get("QUERY_EMBEDDING_CACHE_ENABLED", "True").lower() == "true"
+)
+QUERY_EMBEDDING_CACHE_SIZE = int(os.environ.get("QUERY_EMBEDDING_CACHE_SIZE", 1024))
+QUERY_EMBEDDING_CACHE_TTL = int(os.environ.get("QUERY_EMBEDDING_CACHE_TTL", 3600))
+QUERY_EMBEDDING_SHARED_CACHE = (
+    os.environ.get("QUERY_EMBEDDING_SHARED_CACHE", "False").lower() == "true"
+)
+
+# ============================================================================
+# RAG INDEXING CONFIGURATION
+# ============================================================================
+
+# Documents are split into chunks of at most CHUNK_SIZE characters that repeat
+# up to CHUNK_OVERLAP characters of the previous chunk
+CHUNK_SIZE = int(os.environ.get("CHUNK_SIZE", 1000))
+CHUNK_OVERLAP = int(os.environ.get("CHUNK_OVERLAP", 100))
+
+# Chunks are embedded in batches, with at most EMBEDDING_CONCURRENCY batches in
+# flight. Each finished batch is written to DocumentChunk as soon as it arrives.
+EMBEDDING_BATCH_SIZE = int(os.environ.get("EMBEDDING_BATCH_SIZE", 64))
+EMBEDDING_CONCURRENCY = int(os.environ.get("EMBEDDING_CONCURRENCY", 4))
+
+# Retries with exponential backoff (plus jitter) on 429/5xx and network errors
+EMBEDDING_MAX_RETRIES = 5
+EMBEDDING_RETRY_BASE_DELAY = 1.0  # seconds
+EMBEDDING_RETRY_MAX_DELAY = 30.0  # seconds
+
+# Documents are chunked as they are read: PDFs page by page, TXT files in
+# segments of this many characters
+TEXT_SEGMENT_CHARS = 64 * 1024
+
+# pdfminer is pure Python and CPU-bound, so PDFs are extracted in a shared
+# process pool (0 workers = extract in the calling thread). Large PDFs are
+# split into page ranges that are extracted in parallel.
+PDF_EXTRACTION_WORKERS = int(os.environ.get("PDF_EXTRACTION_WORKERS", 2))
+PDF_EXTRACTION_TIMEOUT = int(os.environ.get("PDF_EXTRACTION_TIMEOUT", 300))  # seconds
+PDF_PAGE_RANGE_SIZE = 20  # pages per extraction task
+PDF_MAX_PAGES = int(os.environ.get("PDF_MAX_PAGES", 2000))  # pages indexed for RAG
+INLINE_PDF_MAX_PAGES = 50  # pages extracted for chat attachments
+
+# Extracted text of indexed files, page by page and zlib-compressed, keyed by
+# file hash (ExtractedText, see chat/text_store.py). Re-indexing, re-chunking
+# and re-embedding read it instead of parsing the file again. Plain text files
+# are cheap to read, so by default only PDFs are stored.
+EXTRACTED_TEXT_STORE = os.environ.get("EXTRACTED_TEXT_STORE", "True").lower() == "true"
+EXTRACTED_TEXT_FILE_TYPES = ("pdf",)
+EXTRACTED_TEXT_COMPRESSION_LEVEL = 6
+
+# Embedded chunks are buffered and written INGEST_BUFFER_ROWS at a time, with
+# a binary COPY on PostgreSQL (bulk_create elsewhere or when disabled)
+INGEST_BUFFER_ROWS = 500
+CHUNK_COPY_ENABLED = os.environ.get("CHUNK_COPY_ENABLED", "True").lower() == "true"
+
+# Chunks of a deleted or re-indexed file are removed CHUNK_DELETE_BATCH_ROWS at
+# a time, each batch in its own short transaction, so a large document never
+# holds locks (or a long transaction) while other chats are being queried
+CHUNK_DELETE_BATCH_ROWS = int(os.environ.get("CHUNK_DELETE_BATCH_ROWS", 1000))
+
+# Uploads are indexed in the background by an in-process thread pool
+INDEXING_WORKERS = int(os.environ.get("INDEXING_WORKERS", 2))
+# A document whose indexing status has not moved for this long (e.g. its job
+# died with a restart) is queued again. Longer than PDF_EXTRACTION_TIMEOUT,
+# since a document can sit in "extracting" for that long without progress.
+INDEXING_STALE_AFTER = int(os.environ.get("INDEXING_STALE_AFTER", 900))  # seconds
+
+# Re-embedding into a new embedding space (see chat/reembedding.py) walks the
+# chunks REEMBED_BATCH_ROWS at a time and embeds at most
+# REEMBED_MAX_CHUNKS_PER_SECOND (0 = no limit), so a migration running next to
+# live traffic does not starve the embedding backend or the database
+REEMBED_BATCH_ROWS = int(os.environ.get("REEMBED_BATCH_ROWS", 256))
+REEMBED_MAX_CHUNKS_PER_SECOND = float(
+    os.environ.get("REEMBED_MAX_CHUNKS_PER_SECOND", 200)
+)
+
+# ============================================================================
+# RAG RETRIEVAL CONFIGURATION
+# ============================================================================
+
+# Number of chunks returned by RAG_pipeline.retrieve_docs
+RAG_TOP_K = 4
+
+# Web workers share one RAG_pipeline per process (get_rag_pipeline). With this
+# on, wsgi/asgi start building it and its embeddings client in the background
+# at boot, so the first chat turn does not pay for it.
+RAG_WARMUP_ON_BOOT = os.environ.get("RAG_WARMUP_ON_BOOT", "True").lower() == "true"
+
+# Candidate list size per query. Higher values trade latency for recall; it is
+# set per query because the chat's document filter discards most candidates.
+HNSW_EF_SEARCH = int(os.environ.get("HNSW_EF_SEARCH", 100))
+
+# pgvector >= 0.8 iterative scans keep walking the graph until enough rows pass
+# the chat's document filter. Use "strict_order", "relaxed_order" or "off"
+# (older pgvector).
+HNSW_ITERATIVE_SCAN = os.environ.get("HNSW_ITERATIVE_SCAN", "relaxed_order")
+HNSW_MAX_SCAN_TUPLES = int(os.environ.get("HNSW_MAX_SCAN_TUPLES", 20000))
+
+# Embedding storage: "vector" (float32) or "halfvec" (float16, half the
+# table and index size; needs pgvector >= 0.7). Existing rows are moved with
+# `manage.py convert_vector_storage --to halfvec`.
+VECTOR_STORAGE = os.environ.get("VECTOR_STORAGE", "vector")
+
+# Search a binary-quantised HNSW index by Hamming distance and re-rank the best
+# BINARY_RERANK_CANDIDATES by exact cosine distance. Build the index first with
+# `manage.py convert_vector_storage --binary-index`.
+VECTOR_BINARY_PREFILTER = (
+    os.environ.get("VECTOR_BINARY_PREFILTER", "False").lower() == "true"
+)
+BINARY_RERANK_CANDIDATES = int(os.environ.get("BINARY_RERANK_CANDIDATES", 40))
+
+# Chats with at most VECTOR_MATRIX_MAX_CHUNKS chunks are searched in process:
+# their embeddings are loaded once into a float32 matrix (reloaded when
+# ChatVectorIndex.last_updated changes) and ranked with one matmul. Larger chats
+# use pgvector. This is also the only vector search that works on SQLite.
+VECTOR_MATRIX_CACHE = os.environ.get("VECTOR_MATRIX_CACHE", "True").lower() == "true"
+VECTOR_MATRIX_MAX_CHUNKS = int(os.environ.get("VECTOR_MATRIX_MAX_CHUNKS", 5000))
+# Memory per worker process for cached matrices (a 5000-chunk chat takes ~7.5 MB)
+VECTOR_MATRIX_CACHE_MB = int(os.environ.get("VECTOR_MATRIX_CACHE_MB", 256))
+
+# Two-stage retrieval for chats with many documents (chat/routing.py): when a
+# chat has more than RAG_ROUTING_MIN_DOCUMENTS documents, the query is matched
+# against per-document summary embeddings first and the vector search only
+# covers the chunks of the RAG_ROUTING_TOP_DOCUMENTS closest documents
+RAG_ROUTING_ENABLED = os.environ.get("RAG_ROUTING_ENABLED", "True").lower() == "true"
+RAG_ROUTING_TOP_DOCUMENTS = int(os.environ.get("RAG_ROUTING_TOP_DOCUMENTS", 3))
+RAG_ROUTING_MIN_DOCUMENTS = int(os.environ.get("RAG_ROUTING_MIN_DOCUMENTS", 4))
+
+# "vector" (cosine only), "lexical" (full-text only) or "hybrid" (both, fused
+# with reciprocal-rank fusion). Lexical search needs PostgreSQL; elsewhere the
+# vector path is used.
+RAG_RETRIEVAL_MODE = os.environ.get("RAG_RETRIEVAL_MODE", "hybrid")
+HYBRID_CANDIDATES = 20  # chunks taken from each ranked list before fusion
+RRF_K = 60  # rank smoothing constant from the original RRF paper
+# Must match the configuration of the search_vector trigger (migration 0014)
+TEXT_SEARCH_CONFIG = "english"
+
+# Context packing for chat prompts (RAG_pipeline.retrieve_context): candidates
+# are over-fetched, reranked with maximal marginal relevance (MMR_LAMBDA = 1 is
+# pure relevance, 0 pure diversity), adjacent chunks are merged, and passages
+# are added until the token budget is used up
+RAG_CONTEXT_CANDIDATES = 20
+RAG_CONTEXT_TOKEN_BUDGET = int(os.environ.get("RAG_CONTEXT_TOKEN_BUDGET", 2000))
+MMR_LAMBDA = 0.7
+
+# Neighbour expansion for RAG_pipeline.retrieve_docs: each hit is widened with
+# up to RAG_NEIGHBOUR_CHUNKS chunks on either side in its document, overlapping
+# chunks are merged into passages, and neighbours are added only while the
+# passages fit RAG_NEIGHBOUR_TOKEN_BUDGET. 0 turns expansion off; both can be
+# overridden per call.
+RAG_NEIGHBOUR_CHUNKS = int(os.environ.get("RAG_NEIGHBOUR_CHUNKS", 0))
+RAG_NEIGHBOUR_TOKEN_BUDGET = int(os.environ.get("RAG_NEIGHBOUR_TOKEN_BUDGET", 1500))
+
+# Retrieval query for chat turns (chat/query_condensation.py): the question plus
+# keyphrases from the last RAG_QUERY_HISTORY_TURNS messages, capped at
+# RAG_QUERY_TOKEN_CAP tokens. Optionally an LLM rewrites the question into a
+# standalone one instead; rewrites are cached for RAG_QUERY_REWRITE_CACHE_TTL.
+RAG_QUERY_HISTORY_TURNS = 4
+RAG_QUERY_TOKEN_CAP = 96
+RAG_QUERY_KEYPHRASES = 8
+RAG_QUERY_REWRITE = os.environ.get("RAG_QUERY_REWRITE", "False").lower() == "true"
+RAG_QUERY_REWRITE_MODEL = os.environ.get(
+    "RAG_QUERY_REWRITE_MODEL", "openai/gpt-oss-20b"
+)
+RAG_QUERY_REWRITE_TIMEOUT = 5.0  # seconds; the condensed query is used on timeout
+RAG_QUERY_REWRITE_CACHE_TTL = 3600  # seconds
+
+# Results of retrieve_docs / retrieve_context for repeated questions, keyed by
+# the chat's index version (chat/retrieval_cache.py). The shared tier uses the
+# Django cache, so it only spans workers with Redis, Memcached or similar.
+RETRIEVAL_CACHE_ENABLED = (
+    os.environ.get("RETRIEVAL_CACHE_ENABLED", "True").lower() == "true"
+)
+RETRIEVAL_CACHE_SIZE = int(os.environ.get("RETRIEVAL_CACHE_SIZE", 512))
+RETRIEVAL_CACHE_TTL = int(os.environ.get("RETRIEVAL_CACHE_TTL", 600))  # seconds
+RETRIEVAL_CACHE_SHARED = (
+    os.environ.get("RETRIEVAL_CACHE_SHARED", "True").lower() == "true"
+)
+
 # ============================================================================
 # HELPER FUNCTIONS
 # ============================================================================
@@ -0,0 +1,247 @@
+# chat/context_packing.py
+"""
+Packing retrieved chunks into a prompt.
+
+Neighbouring chunks share up to chunk_overlap characters and similar chunks
+often repeat the same facts, so joining the top-k results wastes prompt
+tokens. pack_context reranks an over-fetched candidate list with maximal
+marginal relevance (MMR), merges chunks that are adjacent in the same file,
+and keeps adding passages until a token budget is used up.
+
+expand_neighbours goes the other way for short hit lists: it widens each hit
+with the chunks around it in its document, so the passage carries the
+sentences the hit was cut out of.
+"""
+
+from typing import Dict, Iterable, List, Optional, Sequence
+
+import numpy as np
+from langchain.docstore.document import Document
+
+from .config import MMR_LAMBDA, TOKEN_ESTIMATION_MULTIPLIER
+
+# Overlaps shorter than this are treated as coincidence, not splitter overlap
+MIN_MERGE_OVERLAP = 20
+MAX_MERGE_OVERLAP = 400
+# Tokens for the source line the prompt adds in front of each passage
+PASSAGE_OVERHEAD_TOKENS = 8
+
+
+def estimate_tokens(text: str) -> int:
+    """Word-based token estimate, the same one enforce_token_limit uses"""
+    return int(len(text.split()) * TOKEN_ESTIMATION_MULTIPLIER)
+
+
+def _unit(vector) -> np.ndarray:
+    array = np.asarray(vector, dtype=np.float32)
+    norm = np.linalg.norm(array)
+    return array / norm if norm else array
+
+
+def mmr_order(
+    query_embedding, vectors: Sequence, lambda_mult: float = MMR_LAMBDA
+) -> List[int]:
+    """Indices of vectors in maximal marginal relevance order.
+
+    Each step picks the candidate maximising
+    lambda * sim(query, d) - (1 - lambda) * max(sim(d, already picked)).
+    """
+    if not len(vectors):
+        return []
+    matrix = np.vstack([_unit(vector) for vector in vectors])
+    relevance = matrix @ _unit(query_embedding)
+    pairwise = matrix @ matrix.T
+
+    order = []
+    remaining = list(range(len(vectors)))
+    redundancy = np.zeros(len(vectors), dtype=np.float32)
+    while remaining:
+        scores = relevance[remaining]
+        if order:
+            scores = lambda_mult * scores - (1 - lambda_mult) * redundancy[remaining]
+        best = remaining.pop(int(np.argmax(scores)))
+        order.append(best)
+        redundancy = np.maximum(redundancy, pairwise[best])
+    return order
+
+
+def _overlap(left: str, right: str) -> int:
+    """Length of the longest suffix of left that is also a prefix of right"""
+    for size in range(min(len(left), len(right), MAX_MERGE_OVERLAP), 0, -1):
+        if left.endswith(right[:size]):
+            return size if size >= MIN_MERGE_OVERLAP else 0
+    return 0
+
+
+def _merge_texts(texts: List[str]) -> str:
+    merged = texts[0]
+    for text in texts[1:]:
+        overlap = _overlap(merged, text)
+        merged += text[overlap:] if overlap else "\n" + text
+    return merged
+
+
+def _passages(chunks: List, rank: Dict) -> List[Document]:
+    """Merge runs of consecutive chunks of one file into passage Documents"""
+    runs = []
+    for chunk in sorted(chunks, key=lambda c: (c.document_id, c.chunk_index)):
+        previous = runs[-1][-1] if runs else None
+        if (
+            previous is not None
+            and previous.document_id == chunk.document_id
+            and previous.chunk_index + 1 == chunk.chunk_index
+        ):
+            runs[-1].append(chunk)
+        else:
+            runs.append([chunk])
+
+    # Most relevant passage (by its best chunk) first
+    runs.sort(key=lambda run: min(rank[c.pk] for c in run))
+
+    passages = []
+    for run in runs:
+        first, last = run[0], run[-1]
+        metadata = {
+            "source": first.metadata.get("source", "unknown"),
+            "document_id": first.document_id,
+            "chunk_indices": [c.chunk_index for c in run],
+            "chunk_ids": [str(c.pk) for c in run],
+        }
+        if "page" in first.metadata:
+            metadata["page"] = first.metadata["page"]
+            metadata["page_end"] = last.metadata.get("page_end", metadata["page"])
+        passages.append(
+            Document(
+                page_content=_merge_texts([c.content for c in run]),
+                metadata=metadata,
+            )
+        )
+    return passages
+
+
+def _cost(passages: List[Document]) -> int:
+    return sum(
+        estimate_tokens(passage.page_content) + PASSAGE_OVERHEAD_TOKENS
+        for passage in passages
+    )
+
+
+def format_passage(passage: Document) -> str:
+    """Passage text under a short source line for the prompt"""
+    label = passage.metadata.get("source", "unknown")
+    page = passage.metadata.get("page")
+    if page is not None:
+        page_end = passage.metadata.get("page_end", page)
+        label += f", p. {page}" if page_end == page else f", pp. {page}-{page_end}"
+    return f"[{label}]\n{passage.page_content}"
+
+
+def pack_context(
+    chunks: List,
+    vectors: Dict,
+    query_embedding: Optional[Sequence[float]],
+    token_budget: int,
+    lambda_mult: float = MMR_LAMBDA,
+) -> List[Document]:
+    """Select and merge chunks into passages that fit token_budget.
+
+    chunks are DocumentChunk rows in retrieval order and vectors maps their
+    pk to the stored embedding. Without a query embedding (lexical-only
+    retrieval) the retrieval order is kept. Candidates are tried in MMR order;
+    one that would overflow the budget is skipped so smaller ones can still
+    fit. If not even the best chunk fits, it is cut to the budget.
+    """
+    if not chunks:
+        return []
+
+    if query_embedding is not None and all(c.pk in vectors for c in chunks):
+        order = mmr_order(query_embedding, [vectors[c.pk] for c in chunks], lambda_mult)
+    else:
+        order = list(range(len(chunks)))
+    rank = {chunks[index].pk: position for position, index in enumerate(order)}
+
+    selected = []
+    for index in order:
+        candidate = selected + [chunks[index]]
+        if _cost(_passages(candidate, rank)) <= token_budget:
+            selected = candidate
+
+    if selected:
+        return _passages(selected, rank)
+    return _truncated(_passages([chunks[order[0]]], rank)[0], token_budget)
+
+
+def _truncated(passage: Document, token_budget: int) -> List[Document]:
+    """The passage cut to token_budget, as a list (empty if nothing fits)"""
+    words = passage.page_content.split()
+    keep = max(
+        0,
+        int((token_budget - PASSAGE_OVERHEAD_TOKENS) / TOKEN_ESTIMATION_MULTIPLIER),
+    )
+    passage.page_content = " ".join(words[:keep])
+    return [passage] if passage.page_content else []
+
+
+def expand_neighbours(
+    hits: List, neighbours: Iterable, window: int, token_budget: int
+) -> List[Document]:
+    """Widen hits with their neighbouring chunks into passages that fit a budget.
+
+    hits are DocumentChunk rows in retrieval order; neighbours are chunks of
+    the same documents within window positions of a hit. Chunks are added
+    ring by ring: every hit first, then the chunks one position away from
+    each hit (best hit first), then two, and so on. A chunk that would
+    overflow token_budget is skipped, and so is the rest of that side of its
+    hit, so passages never have gaps. Consecutive chunks are merged into one
+    passage (overlap removed), passages are ordered by their best hit, and
+    each carries the 0-based positions of its hits in "hit_ranks". If not
+    even the best hit fits, it is cut to the budget.
+    """
+    if not hits:
+        return []
+    by_position = {(c.document_id, c.chunk_index): c for c in neighbours}
+    rank = {}
+    for position, hit in enumerate(hits):
+        rank.setdefault(hit.pk, position)
+
+    selected = []
+    chosen = set()
+    blocked = set()  # (hit position, direction) that cannot grow further
+    for distance in range(window + 1):
+        for position, hit in enumerate(hits):
+            for direction in (-1, 1) if distance else (0,):
+                if (position, direction) in blocked or (position, 0) in blocked:
+                    continue
+                if direction == 0:
+                    chunk = hit
+                else:
+                    chunk = by_position.get(
+                        (hit.document_id, hit.chunk_index + direction * distance)
+                    )
+                if chunk is None:
+                    blocked.add((position, direction))
+                    continue
+                if chunk.pk in chosen:
+                    continue
+                chunk_rank = min(rank.get(chunk.pk, position), position)
+                candidate_rank = {**rank, chunk.pk: chunk_rank}
+                candidate = selected + [chunk]
+                if _cost(_passages(candidate, candidate_rank)) <= token_budget:
+                    selected = candidate
+                    chosen.add(chunk.pk)
+                    rank = candidate_rank
+                else:
+                    blocked.add((position, direction))
+
+    if not selected:
+        passages = _truncated(_passages([hits[0]], rank)[0], token_budget)
+    else:
+        passages = _passages(selected, rank)
+    hit_ranks = {}
+    for position, hit in enumerate(hits):
+        hit_ranks.setdefault(str(hit.pk), position)
+    for passage in passages:
+        passage.metadata["hit_ranks"] = sorted(
+            hit_ranks[pk] for pk in passage.metadata["chunk_ids"] if pk in hit_ranks
+        )
+    return passages
@@ -0,0 +1,379 @@
+# chat/embedding_cache.py
+"""
+Caches for embeddings.
+
+Chunk embeddings: identical chunks (the same PDF uploaded to another chat, or
+re-uploaded after a delete) are embedded once per embedding model and backend
+(see cache_namespace in chat/embeddings.py). Vectors live in the
+EmbeddingCacheEntry table so the cache survives restarts and is shared by all
+workers.
+
+Query embeddings: a bounded in-process LRU with a TTL, optionally backed by the
+Django cache, so repeated retrieval queries skip the embedding backend.
+"""
+
+import hashlib
+import logging
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional
+
+from django.core.cache import cache
+from django.db import connection
+from django.utils import timezone
+
+from langchain_core.embeddings import Embeddings
+
+from .config import (
+    EMBEDDING_CACHE_EVICT_CHECK_ROWS,
+    EMBEDDING_CACHE_EVICT_TO,
+    EMBEDDING_CACHE_MAX_ENTRIES,
+    QUERY_EMBEDDING_CACHE_SIZE,
+    QUERY_EMBEDDING_CACHE_TTL,
+    QUERY_EMBEDDING_SHARED_CACHE,
+)
+
+logger = logging.getLogger(__name__)
+
+_WHITESPACE_RE = re.compile(r"\s+")
+
+
+def normalize_text(text: str) -> str:
+    """Normalise text so cosmetic differences map to the same cache key"""
+    text = unicodedata.normalize("NFC", text)
+    return _WHITESPACE_RE.sub(" ", text).strip()
+
+
+def text_hash(text: str) -> str:
+    """SHA-256 hex digest of the normalised text"""
+    return hashlib.sha256(normalize_text(text).encode("utf-8")).hexdigest()
+
+
+class EmbeddingCacheStats:
+    """Process-wide hit/miss counters for the chunk embedding cache"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evicted = 0
+
+    def record(self, hits: int = 0, misses: int = 0, evicted: int = 0):
+        with self._lock:
+            self.hits += hits
+            self.misses += misses
+            self.evicted += evicted
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def as_dict(self) -> Dict[str, float]:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evicted": self.evicted,
+            "hit_rate": round(self.hit_rate, 4),
+        }
+
+    def reset(self):
+        with self._lock:
+            self.hits = self.misses = self.evicted = 0
+
+
+cache_stats = EmbeddingCacheStats()
+
+
+class QueryCacheStats:
+    """Process-wide counters for the query embedding cache"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.memory_hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+        self.miss_seconds = 0.0
+
+    def record_hit(self, shared: bool = False):
+        with self._lock:
+            if shared:
+                self.shared_hits += 1
+            else:
+                self.memory_hits += 1
+
+    def record_miss(self, seconds: float):
+        with self._lock:
+            self.misses += 1
+            self.miss_seconds += seconds
+
+    @property
+    def hit_ratio(self) -> float:
+        hits = self.memory_hits + self.shared_hits
+        total = hits + self.misses
+        return hits / total if total else 0.0
+
+    @property
+    def latency_saved_ms(self) -> float:
+        """Estimated backend time avoided: hits x average miss latency"""
+        if not self.misses:
+            return 0.0
+        average_miss = self.miss_seconds / self.misses
+        return (self.memory_hits + self.shared_hits) * average_miss * 1000
+
+    def as_dict(self) -> Dict[str, float]:
+        return {
+            "memory_hits": self.memory_hits,
+            "shared_hits": self.shared_hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hit_ratio, 4),
+            "avg_miss_ms": (
+                round(self.miss_seconds / self.misses * 1000, 2) if self.misses else 0
+            ),
+            "latency_saved_ms": round(self.latency_saved_ms, 1),
+        }
+
+    def reset(self):
+        with self._lock:
+            self.memory_hits = self.shared_hits = self.misses = 0
+            self.miss_seconds = 0.0
+
+
+class QueryEmbeddingCache:
+    """Bounded LRU with TTL for query embeddings, keyed by model and query hash"""
+
+    def __init__(
+        self,
+        max_size: int = QUERY_EMBEDDING_CACHE_SIZE,
+        ttl: int = QUERY_EMBEDDING_CACHE_TTL,
+        use_shared_cache: bool = QUERY_EMBEDDING_SHARED_CACHE,
+    ):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.use_shared_cache = use_shared_cache
+        self.stats = QueryCacheStats()
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(embedding_model: str, text: str) -> str:
+        return f"query_embedding:{embedding_model}:{text_hash(text)}"
+
+    def get_or_embed(
+        self,
+        embedding_model: str,
+        text: str,
+        embed: Callable[[str], List[float]],
+    ) -> List[float]:
+        key = self.make_key(embedding_model, text)
+
+        vector = self._get_local(key)
+        if vector is not None:
+            self.stats.record_hit()
+            return vector
+
+        if self.use_shared_cache:
+            try:
+                vector = cache.get(key)
+            except Exception as e:
+                logger.warning(f"Shared query embedding cache unavailable: {e}")
+            if vector is not None:
+                self._set_local(key, vector)
+                self.stats.record_hit(shared=True)
+                return list(vector)
+
+        started = time.perf_counter()
+        vector = embed(text)
+        self.stats.record_miss(time.perf_counter() - started)
+
+        self._set_local(key, vector)
+        if self.use_shared_cache:
+            try:
+                cache.set(key, list(vector), timeout=self.ttl)
+            except Exception as e:
+                logger.warning(f"Shared query embedding cache unavailable: {e}")
+        return vector
+
+    def _get_local(self, key: str) -> Optional[List[float]]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, vector = entry
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return list(vector)
+
+    def _set_local(self, key: str, vector: List[float]):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, tuple(vector))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+query_embedding_cache = QueryEmbeddingCache()
+
+
+# New cache entries since the last size check, across this process
+_inserts_since_check = 0
+_inserts_lock = threading.Lock()
+
+
+def _entry_count() -> int:
+    """Size of the cache table without scanning it on PostgreSQL.
+
+    pg_class.reltuples is the planner's estimate, kept current by autovacuum
+    and ANALYZE; eviction only needs the order of magnitude. It is negative
+    for a table that was never analysed, and other databases have no
+    equivalent, so those count exactly.
+    """
+    from .models import EmbeddingCacheEntry
+
+    if connection.vendor == "postgresql":
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass",
+                [EmbeddingCacheEntry._meta.db_table],
+            )
+            row = cursor.fetchone()
+        if row and row[0] >= 0:
+            return row[0]
+    return EmbeddingCacheEntry.objects.count()
+
+
+class CachedEmbeddings(Embeddings):
+    """Wrap an embeddings backend with the chunk and query embedding caches.
+
+    With cache_documents, embed_documents only embeds cache misses. With a
+    query_cache, embed_query is served from the LRU when possible.
+    """
+
+    def __init__(
+        self,
+        embeddings: Embeddings,
+        embedding_model: str,
+        max_entries: int = EMBEDDING_CACHE_MAX_ENTRIES,
+        cache_documents: bool = True,
+        query_cache: Optional[QueryEmbeddingCache] = None,
+    ):
+        self.embeddings = embeddings
+        self.embedding_model = embedding_model
+        self.max_entries = max_entries
+        self.cache_documents = cache_documents
+        self.query_cache = query_cache
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        from .models import EmbeddingCacheEntry
+
+        if not texts:
+            return []
+        if not self.cache_documents:
+            return self.embeddings.embed_documents(texts)
+
+        hashes = [text_hash(text) for text in texts]
+        unique_hashes = set(hashes)
+
+        cached = {}
+        hash_list = list(unique_hashes)
+        # Chunk the IN clause so very large documents don't build huge queries
+        for start in range(0, len(hash_list), 1000):
+            rows = EmbeddingCacheEntry.objects.filter(
+                embedding_model=self.embedding_model,
+                text_hash__in=hash_list[start : start + 1000],
+            ).values_list("text_hash", "embedding")
+            for digest, embedding in rows:
+                cached[digest] = [float(value) for value in embedding]
+
+        # Embed each distinct missing text once
+        missing = {}
+        for digest, text in zip(hashes, texts):
+            if digest not in cached and digest not in missing:
+                missing[digest] = text
+
+        if missing:
+            new_vectors = self.embeddings.embed_documents(list(missing.values()))
+            new_entries = []
+            for digest, vector in zip(missing.keys(), new_vectors):
+                cached[digest] = vector
+                new_entries.append(
+                    EmbeddingCacheEntry(
+                        embedding_model=self.embedding_model,
+                        text_hash=digest,
+                        embedding=vector,
+                    )
+                )
+            EmbeddingCacheEntry.objects.bulk_create(
+                new_entries, batch_size=500, ignore_conflicts=True
+            )
+
+        hit_hashes = unique_hashes - set(missing)
+        if hit_hashes:
+            hit_list = list(hit_hashes)
+            for start in range(0, len(hit_list), 1000):
+                EmbeddingCacheEntry.objects.filter(
+                    embedding_model=self.embedding_model,
+                    text_hash__in=hit_list[start : start + 1000],
+                ).update(last_used_at=timezone.now())
+
+        cache_stats.record(hits=len(texts) - len(missing), misses=len(missing))
+        logger.info(
+            f"Embedding cache: {len(texts) - len(missing)} hits, {len(missing)} "
+            f"misses (process hit rate {cache_stats.hit_rate:.1%})"
+        )
+
+        if missing:
+            self._count_inserts(len(missing))
+
+        return [cached[digest] for digest in hashes]
+
+    def embed_query(self, text: str) -> List[float]:
+        if self.query_cache is None:
+            return self.embeddings.embed_query(text)
+        return self.query_cache.get_or_embed(
+            self.embedding_model, text, self.embeddings.embed_query
+        )
+
+    def _count_inserts(self, count: int):
+        """Check the cache size every EMBEDDING_CACHE_EVICT_CHECK_ROWS inserts"""
+        global _inserts_since_check
+        with _inserts_lock:
+            _inserts_since_check += count
+            if _inserts_since_check < EMBEDDING_CACHE_EVICT_CHECK_ROWS:
+                return
+            _inserts_since_check = 0
+        self.evict()
+
+    def evict(self) -> int:
+        """Drop least recently used entries once the cache exceeds max_entries"""
+        from .models import EmbeddingCacheEntry
+
+        total = _entry_count()
+        if total <= self.max_entries:
+            return 0
+
+        overflow = total - int(self.max_entries * EMBEDDING_CACHE_EVICT_TO)
+        stale_ids = list(
+            EmbeddingCacheEntry.objects.order_by("last_used_at").values_list(
+                "id", flat=True
+            )[:overflow]
+        )
+        deleted = 0
+        for start in range(0, len(stale_ids), 1000):
+            count, _ = EmbeddingCacheEntry.objects.filter(
+                id__in=stale_ids[start : start + 1000]
+            ).delete()
+            deleted += count
+
+        cache_stats.record(evicted=deleted)
+        logger.info(f"Embedding cache: evicted {deleted} least recently used entries")
+        return deleted
@@ -0,0 +1,240 @@
+# chat/embeddings.py
+"""
+Embedding backends for the RAG pipeline.
+
+The model backends implement LangChain's ``Embeddings`` interface and return
+the 384-dim, L2-normalised sentence embeddings that ``DocumentChunk.embedding``
+stores, so chunks indexed with one backend can be queried with the other.
+HashingEmbeddings has the same shape but no model behind it; it makes the
+retrieval benchmarks reproducible without a network or model download.
+"""
+
+import hashlib
+import logging
+import math
+import os
+import re
+from typing import List
+
+from langchain_core.embeddings import Embeddings
+
+from .config import (
+    EMBEDDING_BACKEND,
+    EMBEDDING_DIMENSIONS,
+    LOCAL_EMBEDDING_BATCH_SIZE,
+    LOCAL_EMBEDDING_MAX_LENGTH,
+    LOCAL_EMBEDDING_ONNX_FILE,
+    LOCAL_EMBEDDING_THREADS,
+)
+
+logger = logging.getLogger(__name__)
+
+
+def resolve_model_id(embedding_model_name: str) -> str:
+    """Accept either bare model name (e.g., "all-MiniLM-L6-v2") or full repo id"""
+    if "/" in embedding_model_name:
+        return embedding_model_name
+    return f"sentence-transformers/{embedding_model_name}"
+
+
+class LocalOnnxEmbeddings(Embeddings):
+    """Sentence embeddings computed in-process on CPU with ONNX Runtime.
+
+    Runs the int8-quantised ONNX export of the model with mean pooling and L2
+    normalisation, which is what the sentence-transformers pipeline behind the
+    Inference API does for all-MiniLM-L6-v2.
+    """
+
+    def __init__(
+        self,
+        model_id: str,
+        onnx_file: str = LOCAL_EMBEDDING_ONNX_FILE,
+        batch_size: int = LOCAL_EMBEDDING_BATCH_SIZE,
+        max_length: int = LOCAL_EMBEDDING_MAX_LENGTH,
+        num_threads: int = LOCAL_EMBEDDING_THREADS,
+    ):
+        try:
+            import numpy as np
+            import onnxruntime as ort
+            from huggingface_hub import hf_hub_download
+            from tokenizers import Tokenizer
+        except ImportError as e:
+            raise ImportError(
+                "The local embedding backend needs onnxruntime and tokenizers. "
+                "Install them with: pip install onnxruntime tokenizers"
+            ) from e
+
+        self._np = np
+        self.model_id = model_id
+        self.onnx_file = onnx_file
+        self.batch_size = batch_size
+
+        # Files are cached by huggingface_hub after the first download
+        model_path = hf_hub_download(repo_id=model_id, filename=onnx_file)
+        tokenizer_path = hf_hub_download(repo_id=model_id, filename="tokenizer.json")
+
+        self.tokenizer = Tokenizer.from_file(tokenizer_path)
+        self.tokenizer.enable_truncation(max_length=max_length)
+        self.tokenizer.enable_padding(pad_id=0, pad_token="[PAD]")
+
+        session_options = ort.SessionOptions()
+        if num_threads:
+            session_options.intra_op_num_threads = num_threads
+        session_options.graph_optimization_level = (
+            ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        )
+        self.session = ort.InferenceSession(
+            model_path,
+            sess_options=session_options,
+            providers=["CPUExecutionProvider"],
+        )
+        self._input_names = {inp.name for inp in self.session.get_inputs()}
+
+    def _embed_batch(self, texts: List[str]):
+        np = self._np
+        encodings = self.tokenizer.encode_batch(texts)
+        input_ids = np.array([e.ids for e in encodings], dtype=np.int64)
+        attention_mask = np.array([e.attention_mask for e in encodings], dtype=np.int64)
+
+        feeds = {"input_ids": input_ids, "attention_mask": attention_mask}
+        if "token_type_ids" in self._input_names:
+            feeds["token_type_ids"] = np.array(
+                [e.type_ids for e in encodings], dtype=np.int64
+            )
+
+        token_embeddings = self.session.run(None, feeds)[0]
+
+        # Mean pooling over real tokens, then L2 normalisation
+        mask = attention_mask[..., None].astype(np.float32)
+        summed = (token_embeddings * mask).sum(axis=1)
+        counts = np.clip(mask.sum(axis=1), 1e-9, None)
+        pooled = summed / counts
+        norms = np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None)
+        return pooled / norms
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """Embed texts in batches of similar length to keep padding low"""
+        if not texts:
+            return []
+
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+        vectors: List[List[float]] = [None] * len(texts)
+        for start in range(0, len(order), self.batch_size):
+            batch_ids = order[start : start + self.batch_size]
+            batch_vectors = self._embed_batch([texts[i] for i in batch_ids])
+            for i, vector in zip(batch_ids, batch_vectors):
+                vectors[i] = vector.tolist()
+        return vectors
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._embed_batch([text])[0].tolist()
+
+
+class HashingEmbeddings(Embeddings):
+    """Deterministic bag-of-words embeddings for offline tests and benchmarks.
+
+    Lower-cased words and word bigrams are hashed into `dimensions` buckets
+    with a hashed sign (the "hashing trick"), weighted by log term frequency
+    and L2-normalised. Texts that share words get similar vectors, which is
+    enough to exercise retrieval end to end, and the same text always gets
+    the same vector on every machine.
+    """
+
+    _word_re = re.compile(r"\w+")
+
+    def __init__(self, dimensions: int = EMBEDDING_DIMENSIONS):
+        self.dimensions = dimensions
+
+    def _bucket(self, feature: str):
+        digest = hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest()
+        index = int.from_bytes(digest[:4], "little") % self.dimensions
+        return index, 1.0 if digest[4] & 1 else -1.0
+
+    def _embed(self, text: str) -> List[float]:
+        words = self._word_re.findall(text.lower())
+        counts = {}
+        for feature in words + [f"{a} {b}" for a, b in zip(words, words[1:])]:
+            counts[feature] = counts.get(feature, 0) + 1
+
+        vector = [0.0] * self.dimensions
+        for feature, count in counts.items():
+            index, sign = self._bucket(feature)
+            vector[index] += sign * (1.0 + math.log(count))
+        norm = math.sqrt(sum(value * value for value in vector))
+        if norm == 0:
+            # Keep empty texts comparable (cosine distance of zero vectors is NaN)
+            vector[0], norm = 1.0, 1.0
+        return [value / norm for value in vector]
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._embed(text)
+
+
+def cache_namespace(embeddings: Embeddings, embedding_model_name: str) -> str:
+    """Name the vectors of an embeddings client are cached under.
+
+    Backends of one model do not return the same vectors (the local backend
+    runs a quantised export, HashingEmbeddings no model at all), so the name
+    holds the backend and its variant besides the model.
+    """
+    if isinstance(embeddings, LocalOnnxEmbeddings):
+        return f"{embedding_model_name}@local:{embeddings.onnx_file}"
+    if isinstance(embeddings, HashingEmbeddings):
+        return f"hashing@{embeddings.dimensions}"
+    return f"{embedding_model_name}@{type(embeddings).__name__}"
+
+
+def get_embeddings(
+    embedding_model_name: str, backend: str = EMBEDDING_BACKEND
+) -> Embeddings:
+    """Build the embeddings client for the configured backend.
+
+    Returns None when no backend can be constructed, which disables RAG.
+    """
+    model_id = resolve_model_id(embedding_model_name)
+
+    if backend == "local":
+        # The model is downloaded on first use, so a network or disk problem
+        # (or a broken onnxruntime install) surfaces here
+        try:
+            return LocalOnnxEmbeddings(model_id)
+        except Exception as e:
+            logger.error(
+                f"Local embedding backend unavailable ({e}); RAG functionality "
+                "will not work."
+            )
+            return None
+
+    if backend == "hashing":
+        return HashingEmbeddings()
+
+    if backend != "huggingface":
+        raise ValueError(f"Unknown embedding backend: {backend}")
+
+    api_token = os.getenv("HUGGINGFACEHUB_API_TOKEN")
+    if not api_token:
+        logger.warning(
+            "HUGGINGFACEHUB_API_TOKEN is not set, falling back to the local ONNX "
+            "embedding backend. Set EMBEDDING_BACKEND=local to silence this warning."
+        )
+        try:
+            return LocalOnnxEmbeddings(model_id)
+        except Exception as e:
+            logger.error(
+                f"Local embedding backend unavailable ({e}); RAG functionality "
+                "will not work. Create a token at "
+                "https://huggingface.co/settings/tokens and set it in your environment/.env."
+            )
+            return None
+
+    from langchain_huggingface.embeddings import HuggingFaceEndpointEmbeddings
+
+    # Use HuggingFaceEndpointEmbeddings which hits the Inference API
+    return HuggingFaceEndpointEmbeddings(
+        model=model_id,
+        task="feature-extraction",
+        huggingfacehub_api_token=api_token,
+    )
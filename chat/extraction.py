@@ -0,0 +1,348 @@
+# chat/extraction.py
+"""
+Streaming text extraction and chunking for RAG documents.
+
+PDFs are read page by page and chunked as the pages arrive, so peak memory
+scales with one page (plus one carried-over chunk) rather than with the whole
+document. Every chunk records the page it starts on.
+
+pdfminer is pure Python and CPU-bound, so PDF pages are extracted by
+ExtractionService in a shared process pool instead of on the calling thread.
+Large PDFs are split into page ranges that are extracted in parallel.
+Extracted pages are kept per file hash (chat/text_store.py), so a file is
+only parsed once.
+"""
+
+import io
+import logging
+import multiprocessing
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+from pdfminer.converter import PDFPageAggregator
+from pdfminer.layout import LAParams, LTContainer, LTText, LTTextBox
+from pdfminer.pdfinterp import PDFPageInterpreter, PDFResourceManager
+from pdfminer.pdfpage import PDFPage
+
+from .config import (
+    PDF_EXTRACTION_TIMEOUT,
+    PDF_EXTRACTION_WORKERS,
+    PDF_MAX_PAGES,
+    PDF_PAGE_RANGE_SIZE,
+    TEXT_SEGMENT_CHARS,
+)
+from .text_splitter import RecursiveTextSplitter
+from .text_store import document_pages
+
+logger = logging.getLogger(__name__)
+
+# pdfminer's extract_text ends every page with a form feed
+PAGE_SEPARATOR = "\x0c"
+
+# A file path, or the raw bytes of an in-memory upload
+PdfSource = Union[str, bytes]
+
+
+class ExtractionTimeout(TimeoutError):
+    """Raised when a document takes longer than the extraction timeout"""
+
+
+def _open_source(source: PdfSource):
+    if isinstance(source, (bytes, bytearray)):
+        return io.BytesIO(source)
+    return open(source, "rb")
+
+
+def _layout_text(item, parts):
+    """Collect text the way pdfminer's TextConverter renders a layout"""
+    if isinstance(item, LTContainer):
+        for child in item:
+            _layout_text(child, parts)
+    elif isinstance(item, LTText):
+        parts.append(item.get_text())
+    if isinstance(item, LTTextBox):
+        parts.append("\n")
+
+
+def iter_pdf_pages(
+    source: PdfSource, first_page: int = 1, last_page: Optional[int] = None
+) -> Iterator[Tuple[int, str]]:
+    """Yield (page_number, text) for pages first_page..last_page, 1-based.
+
+    Same loop as pdfminer's extract_pages, but with document-level object
+    caching disabled so parsed objects of finished pages can be freed. Fonts
+    are still cached by the resource manager. Runs in the calling process;
+    use extraction_service to extract off the request thread.
+    """
+    with _open_source(source) as fp:
+        resource_manager = PDFResourceManager(caching=True)
+        device = PDFPageAggregator(resource_manager, laparams=LAParams())
+        interpreter = PDFPageInterpreter(resource_manager, device)
+        for page_number, page in enumerate(
+            PDFPage.get_pages(fp, caching=False), start=1
+        ):
+            if page_number < first_page:
+                continue  # Skipped pages are not interpreted
+            if last_page is not None and page_number > last_page:
+                break
+            interpreter.process_page(page)
+            parts = []
+            _layout_text(device.get_result(), parts)
+            yield page_number, "".join(parts)
+
+
+def count_pdf_pages(source: PdfSource) -> int:
+    """Number of pages, read from the page tree without interpreting them"""
+    with _open_source(source) as fp:
+        return sum(1 for _ in PDFPage.get_pages(fp, caching=False))
+
+
+def extract_page_range(
+    source: PdfSource, first_page: int, last_page: int
+) -> List[Tuple[int, str]]:
+    """Pool task: the text of one range of pages"""
+    return list(iter_pdf_pages(source, first_page, last_page))
+
+
+class ExtractionService:
+    """PDF text extraction in a shared process pool.
+
+    A document is split into ranges of page_range_size pages; up to `workers`
+    ranges are extracted at once and pages are yielded in order, so memory
+    stays bounded by a few ranges. Each document has a deadline of `timeout`
+    seconds. A range that is already running when the deadline passes is
+    left to finish in its worker; only the caller gives up.
+
+    The pool uses the spawn start method: forking a threaded gunicorn worker
+    is unsafe. It is created on first use.
+    """
+
+    def __init__(
+        self,
+        workers: int = PDF_EXTRACTION_WORKERS,
+        timeout: float = PDF_EXTRACTION_TIMEOUT,
+        page_range_size: int = PDF_PAGE_RANGE_SIZE,
+    ):
+        self.workers = workers
+        self.timeout = timeout
+        self.page_range_size = max(1, page_range_size)
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                )
+            return self._executor
+
+    def _discard_executor(self, executor):
+        """Drop a broken pool so the next call starts a fresh one"""
+        with self._lock:
+            if self._executor is executor:
+                self._executor = None
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def _result(self, future, deadline, timeout, source_name):
+        remaining = deadline - time.monotonic()
+        try:
+            return future.result(timeout=max(0, remaining))
+        except FutureTimeoutError:
+            raise ExtractionTimeout(
+                f"Extracting {source_name} took longer than {timeout:g}s"
+            ) from None
+
+    def iter_pdf_pages(
+        self,
+        source: PdfSource,
+        max_pages: Optional[int] = PDF_MAX_PAGES,
+        timeout: Optional[float] = None,
+    ) -> Iterator[Tuple[int, str]]:
+        """Yield (page_number, text) for the first max_pages pages, in order"""
+        source_name = "PDF upload" if isinstance(source, (bytes, bytearray)) else source
+
+        if self.workers <= 0:
+            yield from iter_pdf_pages(source, last_page=max_pages)
+            return
+
+        timeout = timeout or self.timeout
+        deadline = time.monotonic() + timeout
+        executor = self._get_executor()
+        in_flight = deque()
+        try:
+            page_count = self._result(
+                executor.submit(count_pdf_pages, source), deadline, timeout, source_name
+            )
+            last_page = page_count
+            if max_pages and page_count > max_pages:
+                logger.warning(
+                    f"{source_name} has {page_count} pages; "
+                    f"only the first {max_pages} are extracted"
+                )
+                last_page = max_pages
+
+            ranges = deque(
+                (first, min(first + self.page_range_size - 1, last_page))
+                for first in range(1, last_page + 1, self.page_range_size)
+            )
+            while ranges or in_flight:
+                while ranges and len(in_flight) < self.workers:
+                    first, last = ranges.popleft()
+                    in_flight.append(
+                        executor.submit(extract_page_range, source, first, last)
+                    )
+                yield from self._result(
+                    in_flight.popleft(), deadline, timeout, source_name
+                )
+        except BrokenProcessPool:
+            self._discard_executor(executor)
+            raise
+        finally:
+            for future in in_flight:
+                future.cancel()
+
+    def extract_pdf_text(
+        self,
+        source: PdfSource,
+        max_pages: Optional[int] = PDF_MAX_PAGES,
+        timeout: Optional[float] = None,
+    ) -> str:
+        """Whole-document text, formatted like pdfminer's extract_text"""
+        return "".join(
+            text + PAGE_SEPARATOR
+            for _page, text in self.iter_pdf_pages(source, max_pages, timeout)
+        )
+
+
+extraction_service = ExtractionService()
+
+
+def iter_text_segments(
+    file_path, segment_chars: int = TEXT_SEGMENT_CHARS
+) -> Iterator[Tuple[Optional[int], str]]:
+    """Yield (None, text) segments of roughly segment_chars, split on lines"""
+    with open(file_path, encoding="utf-8") as fh:
+        lines, size = [], 0
+        for line in fh:
+            lines.append(line)
+            size += len(line)
+            if size >= segment_chars:
+                yield None, "".join(lines)
+                lines, size = [], 0
+        if lines:
+            yield None, "".join(lines)
+
+
+def iter_document_pages(file_path, file_type) -> Iterator[Tuple[Optional[int], str]]:
+    """Yield (page_number, text) for a PDF or TXT file; page is None for TXT"""
+    if file_type == "pdf":
+        return extraction_service.iter_pdf_pages(file_path)
+    if file_type == "txt":
+        return iter_text_segments(file_path)
+    raise ValueError(f"Unsupported file type: {file_type}")
+
+
+def _page_at(page_starts, offset) -> Optional[int]:
+    page = None
+    for start, page_number in page_starts:
+        if start > offset:
+            break
+        page = page_number
+    return page
+
+
+def iter_chunks(
+    pages: Iterable[Tuple[Optional[int], str]],
+    splitter: RecursiveTextSplitter,
+    metadata: Dict,
+) -> Iterator[Tuple[str, Dict]]:
+    """Chunk a stream of pages, yielding (chunk_text, chunk_metadata).
+
+    Chunk offsets come straight from the splitter's spans. The last chunk of
+    each split may be incomplete, so it is carried over and re-split together
+    with the next page. Chunks can therefore span pages;
+    "page" is the page a chunk starts on and "page_end" the page it ends on.
+    """
+    buffer = ""
+    page_starts = []  # (offset in buffer, page number)
+
+    def chunk_metadata(start, chunk):
+        chunk_meta = dict(metadata)
+        page = _page_at(page_starts, start)
+        if page is not None:
+            chunk_meta["page"] = page
+            chunk_meta["page_end"] = _page_at(page_starts, start + len(chunk) - 1)
+        return chunk_meta
+
+    for page_number, text in pages:
+        if not text or not text.strip():
+            continue
+        if buffer:
+            buffer += PAGE_SEPARATOR
+        page_starts.append((len(buffer), page_number))
+        buffer += text
+
+        spans = list(splitter.iter_spans(buffer))
+        if len(spans) < 2:
+            continue
+
+        for start, end in spans[:-1]:
+            chunk = buffer[start:end]
+            yield chunk, chunk_metadata(start, chunk)
+
+        # Carry the (possibly incomplete) last chunk into the next page
+        carry_start = spans[-1][0]
+        carry_page = _page_at(page_starts, carry_start)
+        page_starts = [(0, carry_page)] + [
+            (start - carry_start, page)
+            for start, page in page_starts
+            if start > carry_start
+        ]
+        buffer = buffer[carry_start:]
+
+    if buffer.strip():
+        for start, end in splitter.iter_spans(buffer):
+            chunk = buffer[start:end]
+            yield chunk, chunk_metadata(start, chunk)
+
+
+def iter_document_chunks(
+    file_path, file_type, splitter, text_digest=None, content_hash=None
+) -> Iterator[Tuple[str, Dict]]:
+    """Stream (chunk_text, metadata) for one file, page by page.
+
+    If text_digest (a hashlib object) is given, it is updated with the
+    extracted text of every page. With content_hash (the file's SHA-256),
+    stored text is read instead of extracting the file, and freshly
+    extracted text is stored.
+    """
+    metadata = {
+        "source": os.path.basename(file_path),
+        "file_path": file_path,
+    }
+    pages = document_pages(
+        content_hash, file_type, lambda: iter_document_pages(file_path, file_type)
+    )
+    if text_digest is not None:
+        pages = _digesting(pages, text_digest)
+    return iter_chunks(pages, splitter, metadata)
+
+
+def _digesting(pages, text_digest):
+    for page_number, text in pages:
+        text_digest.update(text.encode("utf-8"))
+        yield page_number, text
@@ -0,0 +1,319 @@
+# chat/indexing.py
+"""
+Indexing helpers for the RAG pipeline.
+
+EmbeddingPipeline embeds a stream of chunks in fixed-size batches with bounded
+concurrency and retries, handing each finished batch to a callback (normally a
+DocumentChunk bulk insert) so memory stays flat and completed batches survive
+a later failure.
+
+IndexingWorker runs upload indexing jobs in the background so the upload
+request returns immediately; progress is tracked on UserDocument, and jobs
+lost with a restarted process are queued again.
+"""
+
+import logging
+import os
+import random
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from datetime import timedelta
+from itertools import islice
+from typing import Callable, Iterable, List, Sequence, TypeVar
+
+from django.db import connection
+from django.db.models import Q
+from django.utils import timezone
+
+from .config import (
+    EMBEDDING_BATCH_SIZE,
+    EMBEDDING_CONCURRENCY,
+    EMBEDDING_MAX_RETRIES,
+    EMBEDDING_RETRY_BASE_DELAY,
+    EMBEDDING_RETRY_MAX_DELAY,
+    INDEXING_STALE_AFTER,
+    INDEXING_WORKERS,
+)
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# Exception class names raised by requests/httpx/huggingface_hub for transient
+# network failures. Matched by name to avoid importing every HTTP client.
+_TRANSIENT_ERROR_NAMES = {
+    "ConnectError",
+    "ConnectionError",
+    "ConnectTimeout",
+    "ReadError",
+    "ReadTimeout",
+    "RemoteProtocolError",
+    "Timeout",
+    "TimeoutError",
+    "TimeoutException",
+}
+
+
+def _status_code(exc: Exception):
+    response = getattr(exc, "response", None)
+    status = getattr(response, "status_code", None)
+    if status is None:
+        status = getattr(exc, "status_code", None)
+    return status
+
+
+def is_retryable(exc: Exception) -> bool:
+    """True for rate limiting (429), server errors (5xx) and network failures"""
+    status = _status_code(exc)
+    if status is not None:
+        return status == 429 or 500 <= status < 600
+    return any(cls.__name__ in _TRANSIENT_ERROR_NAMES for cls in type(exc).__mro__)
+
+
+def _retry_after(exc: Exception):
+    """Seconds requested by a Retry-After header, if the error carries one"""
+    response = getattr(exc, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    try:
+        return float(headers.get("Retry-After"))
+    except (TypeError, ValueError):
+        return None
+
+
+class EmbeddingPipeline:
+    """Batched, concurrent, retrying embedding of chunks"""
+
+    def __init__(
+        self,
+        embeddings,
+        batch_size: int = EMBEDDING_BATCH_SIZE,
+        concurrency: int = EMBEDDING_CONCURRENCY,
+        max_retries: int = EMBEDDING_MAX_RETRIES,
+        base_delay: float = EMBEDDING_RETRY_BASE_DELAY,
+        max_delay: float = EMBEDDING_RETRY_MAX_DELAY,
+    ):
+        self.embeddings = embeddings
+        self.batch_size = max(1, batch_size)
+        self.concurrency = max(1, concurrency)
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def embed_with_retry(self, texts: List[str]) -> List[List[float]]:
+        attempt = 0
+        while True:
+            try:
+                return self.embeddings.embed_documents(texts)
+            except Exception as e:
+                attempt += 1
+                if attempt > self.max_retries or not is_retryable(e):
+                    raise
+                delay = min(self.max_delay, self.base_delay * 2 ** (attempt - 1))
+                delay = max(delay * random.uniform(0.5, 1.0), _retry_after(e) or 0)
+                logger.warning(
+                    f"Embedding batch of {len(texts)} failed ({e}); "
+                    f"retry {attempt}/{self.max_retries} in {delay:.1f}s"
+                )
+                time.sleep(delay)
+
+    def _embed_batch(self, texts: List[str]) -> List[List[float]]:
+        try:
+            return self.embed_with_retry(texts)
+        finally:
+            # Worker threads get their own DB connection if the embeddings
+            # backend touches the database (e.g. the embedding cache)
+            connection.close()
+
+    def run(
+        self,
+        items: Iterable[T],
+        text_of: Callable[[T], str],
+        on_batch: Callable[[Sequence[T], List[List[float]]], None],
+    ) -> int:
+        """Embed items and call on_batch(items, vectors) for each finished batch.
+
+        on_batch runs on the calling thread, in completion order. Returns the
+        number of items embedded. The first batch that still fails after its
+        retries is raised; batches handed to on_batch before that are kept.
+        """
+        iterator = iter(items)
+        total = 0
+
+        def next_batch():
+            return list(islice(iterator, self.batch_size))
+
+        with ThreadPoolExecutor(
+            max_workers=self.concurrency, thread_name_prefix="embed"
+        ) as executor:
+            in_flight = {}
+            batch = next_batch()
+            try:
+                while batch or in_flight:
+                    # Keep at most `concurrency` batches queued or running
+                    while batch and len(in_flight) < self.concurrency:
+                        future = executor.submit(
+                            self._embed_batch, [text_of(item) for item in batch]
+                        )
+                        in_flight[future] = batch
+                        batch = next_batch()
+
+                    done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        finished = in_flight.pop(future)
+                        vectors = future.result()
+                        on_batch(finished, vectors)
+                        total += len(finished)
+            except BaseException:
+                for future in in_flight:
+                    future.cancel()
+                raise
+
+        return total
+
+
+def index_document(document_id: int):
+    """Index one uploaded UserDocument; failures are recorded on the row"""
+    # Imported here to avoid circular imports (rag.py uses EmbeddingPipeline)
+    from .models import UserDocument
+    from .rag import get_rag_pipeline
+
+    try:
+        document = UserDocument.objects.get(pk=document_id)
+        get_rag_pipeline().build_index([document], incremental=True)
+        logger.info(f"Indexed document {document_id} ({document.original_filename})")
+    except UserDocument.DoesNotExist:
+        logger.info(f"Document {document_id} was deleted before it was indexed")
+    except Exception as e:
+        logger.error(f"Failed to index document {document_id}: {e}", exc_info=True)
+        UserDocument.objects.filter(pk=document_id).update(
+            index_status="failed",
+            index_error=str(e)[:1000],
+            index_updated_at=timezone.now(),
+        )
+    finally:
+        connection.close()
+
+
+def embed_document_into_space(space_id: int, document_id: int):
+    """Embed an attached document's chunks missing from an EmbeddingSpace"""
+    # Imported here to avoid circular imports (reembedding uses EmbeddingPipeline)
+    from .models import EmbeddingSpace
+    from .reembedding import embed_document
+
+    try:
+        space = EmbeddingSpace.objects.exclude(status="retired").get(pk=space_id)
+        embed_document(space, document_id)
+    except EmbeddingSpace.DoesNotExist:
+        logger.info(f"Embedding space {space_id} was retired or deleted")
+    except Exception as e:
+        # The chat keeps being searched in the built-in columns
+        logger.error(
+            f"Failed to embed document {document_id} into space {space_id}: {e}",
+            exc_info=True,
+        )
+    finally:
+        connection.close()
+
+
+class IndexingWorker:
+    """Background indexing on a small in-process thread pool.
+
+    Jobs live in the web worker process, so a restart loses the queued and
+    running ones and leaves their documents in a non-terminal status. Every
+    stored batch and status change moves UserDocument.index_updated_at, so a
+    document that has not moved for INDEXING_STALE_AFTER seconds is taken to
+    be orphaned: requeue_stale claims it with a conditional update (only one
+    process wins) and queues it again. It runs as a job on the pool when the
+    pool starts in a process and, at most once a minute, from the status
+    endpoints the UI polls.
+    """
+
+    # Seconds between requeue_stale scans in one process
+    SCAN_INTERVAL = 60
+
+    def __init__(self, max_workers: int = INDEXING_WORKERS):
+        self.max_workers = max_workers
+        self._executor = None
+        self._lock = threading.Lock()
+        self._last_scan = None
+
+    def submit(self, document_id: int) -> Future:
+        return self._submit(index_document, document_id)
+
+    def submit_space_vectors(self, space_id: int, document_id: int) -> Future:
+        """Queue embed_document_into_space for a newly attached document"""
+        return self._submit(embed_document_into_space, space_id, document_id)
+
+    def _submit(self, job, *args) -> Future:
+        with self._lock:
+            started = self._executor is None
+            if started:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.max_workers, thread_name_prefix="rag-index"
+                )
+        future = self._executor.submit(job, *args)
+        if started:
+            # On the pool, so no caller (e.g. an async view) does DB work here
+            self._executor.submit(self._scan_on_start)
+        return future
+
+    def _scan_on_start(self):
+        try:
+            self.requeue_stale(force=True)
+        except Exception as e:
+            logger.error(f"Failed to re-queue stale indexing jobs: {e}", exc_info=True)
+        finally:
+            connection.close()
+
+    def requeue_stale(self, force: bool = False) -> int:
+        """Queue documents whose indexing stopped moving; returns how many"""
+        now = time.monotonic()
+        with self._lock:
+            if (
+                not force
+                and self._last_scan is not None
+                and now - self._last_scan < self.SCAN_INTERVAL
+            ):
+                return 0
+            self._last_scan = now
+
+        requeued = 0
+        for document_id in stale_documents().values_list("pk", flat=True):
+            if claim_document(document_id):
+                logger.info(f"Re-queueing stale indexing of document {document_id}")
+                self.submit(document_id)
+                requeued += 1
+        return requeued
+
+
+def stale_documents():
+    """UserDocuments in a non-terminal status that has not moved for a while"""
+    from .models import UserDocument
+
+    cutoff = timezone.now() - timedelta(seconds=INDEXING_STALE_AFTER)
+    return UserDocument.objects.filter(
+        index_status__in=("queued", "extracting", "embedding"),
+        index_updated_at__lt=cutoff,
+    )
+
+
+def claim_document(document_id, retry_failed: bool = False) -> bool:
+    """Mark a stale (or, with retry_failed, failed) document queued again.
+
+    The update only matches while the document is still in that state, so
+    when several processes try, exactly one gets True and submits the job.
+    """
+    from .models import UserDocument
+
+    claimable = Q(pk__in=stale_documents().values("pk"))
+    if retry_failed:
+        claimable |= Q(index_status="failed")
+    return bool(
+        UserDocument.objects.filter(claimable, pk=document_id).update(
+            index_status="queued", index_error="", index_updated_at=timezone.now()
+        )
+    )
+
+
+indexing_worker = IndexingWorker()
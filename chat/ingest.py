@@ -0,0 +1,275 @@
+# chat/ingest.py
+"""
+Bulk ingestion and removal of DocumentChunk rows.
+
+On PostgreSQL, chunks are written with COPY ... FROM STDIN in binary format.
+Vectors are sent in pgvector's binary wire format, so no text is parsed on
+the server and a whole buffer of rows costs a single round trip. Other
+databases fall back to bulk_create.
+
+Chunks belong to a UserDocument and chats see them through attachments
+(ChatRAGFile), so one document is embedded once however many chats use it.
+ChatVectorIndex.total_chunks counts the chunks of a chat's attached
+documents and is kept in step with the table: every insert, delete, attach
+and detach adjusts it in the same transaction as the rows it counts.
+Deletes are batched (see delete_document_chunks).
+"""
+
+import io
+import json
+import struct
+from collections import defaultdict
+from datetime import datetime, timedelta
+from datetime import timezone as dt_timezone
+from typing import Callable, Iterable, List, Optional
+
+from django.db import connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from pgvector import HalfVector, Vector
+
+from .config import CHUNK_COPY_ENABLED, CHUNK_DELETE_BATCH_ROWS, INGEST_BUFFER_ROWS
+
+COPY_COLUMNS = (
+    "id",
+    "document_id",
+    "content",
+    "chunk_index",
+    "embedding",
+    "embedding_half",
+    "metadata",
+    "created_at",
+)
+
+_PG_EPOCH = datetime(2000, 1, 1, tzinfo=dt_timezone.utc)
+_COPY_HEADER = b"PGCOPY\n\xff\r\n\x00" + struct.pack(">ii", 0, 0)
+_COPY_TRAILER = struct.pack(">h", -1)
+_NULL = struct.pack(">i", -1)
+
+
+def _field(payload: Optional[bytes]) -> bytes:
+    if payload is None:
+        return _NULL
+    return struct.pack(">i", len(payload)) + payload
+
+
+def _vector_bytes(value, vector_type) -> Optional[bytes]:
+    if value is None:
+        return None
+    if not isinstance(value, vector_type):
+        value = vector_type(value)
+    return value.to_binary()
+
+
+def _timestamp_bytes(value: datetime) -> bytes:
+    microseconds = (value - _PG_EPOCH) // timedelta(microseconds=1)
+    return struct.pack(">q", microseconds)
+
+
+def encode_copy_rows(chunks: Iterable, created_at: datetime) -> io.BytesIO:
+    """Serialise DocumentChunk objects to a binary COPY payload"""
+    buffer = io.BytesIO()
+    buffer.write(_COPY_HEADER)
+    created = _timestamp_bytes(created_at)
+    field_count = struct.pack(">h", len(COPY_COLUMNS))
+    for chunk in chunks:
+        buffer.write(field_count)
+        buffer.write(_field(chunk.id.bytes))
+        buffer.write(_field(struct.pack(">q", chunk.document_id)))
+        # PostgreSQL text cannot hold NUL bytes, which pdfminer occasionally emits
+        buffer.write(_field(chunk.content.replace("\x00", "").encode("utf-8")))
+        buffer.write(_field(struct.pack(">i", chunk.chunk_index)))
+        buffer.write(_field(_vector_bytes(chunk.embedding, Vector)))
+        buffer.write(_field(_vector_bytes(chunk.embedding_half, HalfVector)))
+        # jsonb binary format: version byte followed by the JSON text
+        buffer.write(_field(b"\x01" + json.dumps(chunk.metadata).encode("utf-8")))
+        buffer.write(_field(created))
+    buffer.write(_COPY_TRAILER)
+    buffer.seek(0)
+    return buffer
+
+
+def copy_document_chunks(chunks: List) -> int:
+    """Insert chunks with one binary COPY; returns the number of rows"""
+    from .models import DocumentChunk
+
+    if not chunks:
+        return 0
+    payload = encode_copy_rows(chunks, timezone.now())
+    columns = ", ".join(COPY_COLUMNS)
+    with connection.cursor() as cursor:
+        # psycopg2's copy_expert lives on the raw cursor
+        cursor.cursor.copy_expert(
+            f"COPY {DocumentChunk._meta.db_table} ({columns}) "
+            f"FROM STDIN WITH (FORMAT binary)",
+            payload,
+        )
+    return len(chunks)
+
+
+def insert_document_chunks(chunks: List) -> int:
+    """Insert chunks with COPY on PostgreSQL, bulk_create elsewhere"""
+    from .models import DocumentChunk
+
+    if CHUNK_COPY_ENABLED and connection.vendor == "postgresql":
+        return copy_document_chunks(chunks)
+    DocumentChunk.objects.bulk_create(chunks, batch_size=100)
+    return len(chunks)
+
+
+class ChunkWriter:
+    """Buffer embedded chunks and write them INGEST_BUFFER_ROWS at a time.
+
+    Each flush inserts the buffered rows and runs on_flush(chunks) in the
+    same transaction, so progress counters never run ahead of stored rows.
+    """
+
+    def __init__(
+        self,
+        on_flush: Optional[Callable[[List], None]] = None,
+        buffer_rows: int = INGEST_BUFFER_ROWS,
+    ):
+        self.on_flush = on_flush
+        self.buffer_rows = max(1, buffer_rows)
+        self.written = 0
+        self._buffer = []
+
+    def add(self, chunks: Iterable):
+        self._buffer.extend(chunks)
+        if len(self._buffer) >= self.buffer_rows:
+            self.flush()
+
+    def flush(self):
+        if not self._buffer:
+            return
+        chunks, self._buffer = self._buffer, []
+        with transaction.atomic():
+            self.written += insert_document_chunks(chunks)
+            if self.on_flush is not None:
+                self.on_flush(chunks)
+
+
+def _lock_document(document_id):
+    """Lock a UserDocument row until the end of the transaction.
+
+    Chunk counts of attached chats change under this lock, so attaching or
+    detaching a document never misses or double-counts a concurrent batch.
+    Returns the document, or None if it has been deleted.
+    """
+    from .models import UserDocument
+
+    return UserDocument.objects.select_for_update().filter(pk=document_id).first()
+
+
+def adjust_chunk_count(document_id, delta: int):
+    """Add delta to total_chunks of every chat the document is attached to.
+
+    An UPDATE with F() rather than read-modify-write, so concurrent indexing
+    runs and deletions never lose each other's counts. last_updated (the
+    index version the retrieval and matrix caches are keyed on) moves with
+    every batch, so chunks stored while a document is still being indexed
+    are searchable at once and deleted ones drop out of cached results.
+    """
+    from .models import ChatRAGFile, ChatVectorIndex
+
+    if delta:
+        ChatVectorIndex.objects.filter(
+            chat_id__in=ChatRAGFile.objects.filter(document_id=document_id).values(
+                "chat_id"
+            )
+        ).update(total_chunks=F("total_chunks") + delta, last_updated=timezone.now())
+
+
+def delete_document_chunks(chunks, batch_rows: int = CHUNK_DELETE_BATCH_ROWS) -> int:
+    """Delete the chunks of a DocumentChunk queryset in batches.
+
+    Each batch of up to batch_rows primary keys is deleted in its own
+    transaction, together with the matching total_chunks decrement, so
+    locks are short-lived and the counters are right after every batch.
+    Returns the number of rows deleted.
+    """
+    from .models import DocumentChunk
+
+    batch_rows = max(1, batch_rows)
+    deleted = 0
+    while True:
+        batch = list(chunks.order_by().values_list("pk", "document_id")[:batch_rows])
+        if not batch:
+            return deleted
+        by_document = defaultdict(list)
+        for pk, document_id in batch:
+            by_document[document_id].append(pk)
+        with transaction.atomic():
+            for document_id, pks in by_document.items():
+                _lock_document(document_id)
+                # The count excludes rows someone else deleted in the meantime,
+                # which they have already subtracted
+                count, _by_model = DocumentChunk.objects.filter(pk__in=pks).delete()
+                adjust_chunk_count(document_id, -count)
+                deleted += count
+        if len(batch) < batch_rows:
+            return deleted
+
+
+def attach_document(chat, document):
+    """Attach a library document to a chat; returns the new ChatRAGFile.
+
+    No chunk is copied: the chat's index gains the document's chunk count,
+    and its version moves forward, in the same transaction. The document
+    row is locked (see _lock_document) so an indexing run cannot add chunks
+    between the count and the attachment.
+    """
+    from .models import ChatRAGFile, ChatVectorIndex, UserDocument
+
+    with transaction.atomic():
+        document = _lock_document(document.pk)
+        if document is None:
+            raise UserDocument.DoesNotExist("The document has been deleted.")
+        rag_file = ChatRAGFile.objects.create(
+            chat=chat, user=document.user, document=document
+        )
+        vector_index, _created = ChatVectorIndex.objects.get_or_create(chat=chat)
+        vector_index.total_chunks = F("total_chunks") + document.chunks.count()
+        vector_index.save(update_fields=["total_chunks", "last_updated"])
+    return rag_file
+
+
+def detach_rag_file(rag_file) -> int:
+    """Detach a document from a chat, keeping it in the user's library.
+
+    Subtracts the document's chunks from the chat's count; deleting the
+    attachment moves the chat's index version forward (see
+    chat/signals.py). Returns the number of chunks the chat lost.
+    """
+    from .models import ChatVectorIndex
+
+    with transaction.atomic():
+        document = _lock_document(rag_file.document_id)
+        removed = document.chunks.count() if document is not None else 0
+        ChatVectorIndex.objects.filter(chat_id=rag_file.chat_id).update(
+            total_chunks=F("total_chunks") - removed
+        )
+        rag_file.delete()
+    return removed
+
+
+def delete_document(document) -> int:
+    """Delete a library document everywhere it is attached.
+
+    The chunks go first, in batches that keep every attached chat's count
+    right; then the document row, which takes its attachments and stored
+    file with it, and its extracted text unless another document has the
+    same file. Returns the number of chunks removed.
+    """
+    from .models import ExtractedText, UserDocument
+
+    removed = delete_document_chunks(document.chunks.all())
+    content_hash = document.content_hash
+    document.delete()
+    if (
+        content_hash
+        and not UserDocument.objects.filter(content_hash=content_hash).exists()
+    ):
+        ExtractedText.objects.filter(content_hash=content_hash).delete()
+    return removed
@@ -0,0 +1,122 @@
+"""
+Django management command to store the extracted text of existing documents.
+
+Documents indexed before the text store existed (chat/text_store.py) have no
+stored text, so their next re-index would parse the file again. This command
+extracts each such file once, one file per distinct content hash, and stores
+the compressed pages. Files that changed on disk since they were indexed are
+skipped; they are stored when they are re-indexed. Stored rows are saved one
+file at a time, so the command can be interrupted and re-run.
+
+--prune deletes stored text that no document refers to any more, e.g. after
+users were deleted.
+
+Usage:
+    python manage.py backfill_extracted_text
+    python manage.py backfill_extracted_text --limit 100
+    python manage.py backfill_extracted_text --prune
+"""
+
+import os
+import time
+
+from django.core.management.base import BaseCommand
+from django.db.models import Exists, OuterRef
+
+from chat import text_store
+from chat.config import EXTRACTED_TEXT_FILE_TYPES, EXTRACTED_TEXT_STORE
+from chat.extraction import iter_document_pages
+from chat.models import ExtractedText, UserDocument
+from chat.uploads import file_fingerprint
+
+
+class Command(BaseCommand):
+    help = "Store extracted text of indexed documents so re-indexing skips parsing"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--limit", type=int, help="Store at most this many files")
+        parser.add_argument(
+            "--prune",
+            action="store_true",
+            help="Delete stored text no document refers to",
+        )
+
+    def handle(self, *args, **options):
+        if options["prune"]:
+            orphans = ExtractedText.objects.filter(
+                ~Exists(
+                    UserDocument.objects.filter(content_hash=OuterRef("content_hash"))
+                )
+            )
+            deleted, _ = orphans.delete()
+            self.stdout.write(f"Pruned {deleted} stored text(s).")
+            return
+
+        if not EXTRACTED_TEXT_STORE:
+            self.stdout.write(
+                self.style.WARNING(
+                    "EXTRACTED_TEXT_STORE is off: stored text would not be used."
+                )
+            )
+
+        stored = skipped = failed = 0
+        text_chars = compressed_bytes = 0
+        started = time.perf_counter()
+        seen = set()
+        documents = (
+            UserDocument.objects.filter(index_status="done")
+            .exclude(content_hash="")
+            .order_by("pk")
+        )
+        for document in documents.iterator():
+            if options["limit"] is not None and stored >= options["limit"]:
+                break
+            file_type = os.path.splitext(document.original_filename)[1][1:].lower()
+            key = (document.content_hash, file_type)
+            if key in seen or file_type not in EXTRACTED_TEXT_FILE_TYPES:
+                continue
+            seen.add(key)
+            if text_store.load(document.content_hash, file_type) is not None:
+                continue
+
+            try:
+                file_path = document.file.path
+                if file_fingerprint(file_path)[0] != document.content_hash:
+                    self.stdout.write(
+                        f"{document.original_filename} ({document.pk}) changed "
+                        f"since it was indexed; skipping."
+                    )
+                    skipped += 1
+                    continue
+                encoder = text_store.PageEncoder()
+                for page_number, text in iter_document_pages(file_path, file_type):
+                    encoder.add(page_number, text)
+                data = encoder.finish()
+            except Exception as e:
+                self.stderr.write(
+                    f"Could not extract {document.original_filename} "
+                    f"({document.pk}): {e}"
+                )
+                failed += 1
+                continue
+
+            text_store.save(
+                document.content_hash, file_type, data, encoder.pages, encoder.chars
+            )
+            stored += 1
+            text_chars += encoder.chars
+            compressed_bytes += len(data)
+            self.stdout.write(
+                f"Stored {document.original_filename} ({document.pk}): "
+                f"{encoder.pages} pages, {encoder.chars} chars -> {len(data)} bytes"
+            )
+
+        ratio = text_chars / compressed_bytes if compressed_bytes else 0.0
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Stored text of {stored} file(s) in "
+                f"{time.perf_counter() - started:.1f}s ({text_chars} chars -> "
+                f"{compressed_bytes} bytes, {ratio:.1f}x); {skipped} changed, "
+                f"{failed} failed."
+            )
+        )
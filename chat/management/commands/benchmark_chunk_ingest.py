@@ -0,0 +1,95 @@
+"""
+Django management command to benchmark DocumentChunk ingestion.
+
+Inserts synthetic chunks (random text and 384-dim vectors) for a throwaway
+user/document, once with bulk_create(batch_size=100) as build_index used to,
+and once with the binary COPY path from chat.ingest, and reports rows/s.
+Everything the benchmark creates is deleted afterwards.
+
+Requires PostgreSQL with pgvector.
+
+Usage:
+    python manage.py benchmark_chunk_ingest
+    python manage.py benchmark_chunk_ingest --rows 50000 --buffer 1000
+"""
+
+import random
+import time
+import uuid
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from chat.config import EMBEDDING_DIMENSIONS, INGEST_BUFFER_ROWS
+from chat.ingest import copy_document_chunks
+from chat.models import DocumentChunk, UserDocument
+from users.models import CustomUser
+
+WORDS = "the of and to in is that for it as with was on be by this are or".split()
+
+
+class Command(BaseCommand):
+    help = "Benchmark bulk_create vs binary COPY ingestion of document chunks"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", type=int, default=20000)
+        parser.add_argument(
+            "--buffer",
+            type=int,
+            default=INGEST_BUFFER_ROWS,
+            help="Rows per COPY (and per bulk_create transaction)",
+        )
+        parser.add_argument("--seed", type=int, default=42)
+
+    def handle(self, *args, **options):
+        if connection.vendor != "postgresql":
+            raise CommandError("This benchmark requires PostgreSQL with pgvector.")
+
+        random.seed(options["seed"])
+        suffix = uuid.uuid4().hex[:8]
+        user = CustomUser.objects.create(
+            username=f"ingest-benchmark-{suffix}",
+            email=f"ingest-benchmark-{suffix}@example.invalid",
+        )
+        try:
+            document = UserDocument.objects.create(
+                user=user, original_filename="benchmark.txt"
+            )
+            for label, insert in (
+                ("bulk_create", self._bulk_create),
+                ("binary COPY", copy_document_chunks),
+            ):
+                rows = self._chunks(document, options["rows"])
+                started = time.perf_counter()
+                for start in range(0, len(rows), options["buffer"]):
+                    with transaction.atomic():
+                        insert(rows[start : start + options["buffer"]])
+                elapsed = time.perf_counter() - started
+                self.stdout.write(
+                    f"{label:<12} {len(rows)} rows in {elapsed:.2f}s "
+                    f"({len(rows) / elapsed:,.0f} rows/s)"
+                )
+                document.chunks.all().delete()
+        finally:
+            user.delete()
+
+    def _bulk_create(self, rows):
+        DocumentChunk.objects.bulk_create(rows, batch_size=100)
+
+    def _chunks(self, document, count):
+        """Unsaved chunks of ~1000 characters with random unit-ish vectors"""
+        chunks = []
+        for index in range(count):
+            words = random.choices(WORDS, k=180)
+            chunks.append(
+                DocumentChunk(
+                    document=document,
+                    content=" ".join(words),
+                    chunk_index=index,
+                    embedding=[
+                        random.uniform(-0.1, 0.1) for _ in range(EMBEDDING_DIMENSIONS)
+                    ],
+                    metadata={"source": "benchmark.txt", "page": index // 4 + 1},
+                )
+            )
+        return chunks
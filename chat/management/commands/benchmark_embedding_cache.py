@@ -0,0 +1,98 @@
+"""
+Django management command to measure the chunk embedding cache.
+
+Simulates a repeated-upload workload: the same document is chunked like
+RAG_pipeline.build_index does and embedded --uploads times through
+CachedEmbeddings. Reports how many texts reached the embedding backend
+compared to an uncached run, plus the cache hit rate.
+
+Cache entries are written under a separate "benchmark:" model key and removed
+afterwards so the real cache is left untouched.
+
+Usage:
+    python manage.py benchmark_embedding_cache --file path/to/book.pdf
+    python manage.py benchmark_embedding_cache --file notes.txt --uploads 10
+"""
+
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from pdfminer.high_level import extract_text
+
+from chat.config import DEFAULT_EMBEDDING_MODEL
+from chat.embedding_cache import CachedEmbeddings, cache_stats
+from chat.embeddings import get_embeddings
+from chat.models import EmbeddingCacheEntry
+from chat.text_splitter import RecursiveTextSplitter
+
+
+class CountingEmbeddings:
+    """Proxy that counts calls and texts sent to the real backend"""
+
+    def __init__(self, embeddings):
+        self.embeddings = embeddings
+        self.calls = 0
+        self.texts = 0
+
+    def embed_documents(self, texts):
+        self.calls += 1
+        self.texts += len(texts)
+        return self.embeddings.embed_documents(texts)
+
+    def embed_query(self, text):
+        return self.embeddings.embed_query(text)
+
+
+class Command(BaseCommand):
+    help = "Measure embedding calls saved by the cache on repeated uploads"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--file", required=True, help="PDF or TXT document")
+        parser.add_argument("--uploads", type=int, default=5)
+        parser.add_argument("--model", default=DEFAULT_EMBEDDING_MODEL)
+
+    def handle(self, *args, **options):
+        path = options["file"]
+        if path.lower().endswith(".pdf"):
+            text = extract_text(path)
+        else:
+            with open(path, encoding="utf-8", errors="replace") as fh:
+                text = fh.read()
+        if not text or not text.strip():
+            raise CommandError(f"No text extracted from {path}")
+
+        splitter = RecursiveTextSplitter(chunk_size=1000, chunk_overlap=100)
+        chunks = splitter.split_text(text)
+
+        backend = get_embeddings(options["model"])
+        if backend is None:
+            raise CommandError("No embedding backend available")
+        counting = CountingEmbeddings(backend)
+        cache_key = f"benchmark:{options['model']}"
+        cached = CachedEmbeddings(counting, cache_key)
+
+        EmbeddingCacheEntry.objects.filter(embedding_model=cache_key).delete()
+        cache_stats.reset()
+        try:
+            for upload in range(1, options["uploads"] + 1):
+                texts_before = counting.texts
+                started = time.perf_counter()
+                cached.embed_documents(chunks)
+                elapsed = time.perf_counter() - started
+                self.stdout.write(
+                    f"upload {upload}: {len(chunks)} chunks, "
+                    f"{counting.texts - texts_before} embedded, {elapsed:.2f}s"
+                )
+        finally:
+            EmbeddingCacheEntry.objects.filter(embedding_model=cache_key).delete()
+
+        uncached_texts = len(chunks) * options["uploads"]
+        reduction = 1 - counting.texts / uncached_texts if uncached_texts else 0
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Backend texts: {counting.texts} with cache vs {uncached_texts} "
+                f"without ({reduction:.1%} fewer), backend calls: {counting.calls}, "
+                f"cache stats: {cache_stats.as_dict()}"
+            )
+        )
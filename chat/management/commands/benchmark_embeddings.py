@@ -0,0 +1,135 @@
+"""
+Django management command to benchmark the embedding backends.
+
+Measures document throughput (chunks/s through embed_documents) and single
+query latency (p50/p99 of embed_query) for each backend in chat/embeddings.py.
+The huggingface backend needs HUGGINGFACEHUB_API_TOKEN; the local backend
+needs onnxruntime.
+
+Usage:
+    python manage.py benchmark_embeddings
+    python manage.py benchmark_embeddings --backends local --chunks 2000
+    python manage.py benchmark_embeddings --file path/to/book.txt
+"""
+
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+
+from chat.config import DEFAULT_EMBEDDING_MODEL, EMBEDDING_DIMENSIONS
+from chat.embeddings import get_embeddings
+
+WORDS = (
+    "matrix vector eigenvalue gradient theorem proof integral derivative "
+    "function variable network protocol memory process thread kernel cache "
+    "energy force velocity molecule enzyme protein history economy market "
+    "the a of and to in is that for with as on by this be are from"
+).split()
+
+
+def _synthetic_chunks(count, chunk_chars, seed):
+    rng = random.Random(seed)
+    chunks = []
+    for _ in range(count):
+        words = []
+        length = 0
+        while length < chunk_chars:
+            word = rng.choice(WORDS)
+            words.append(word)
+            length += len(word) + 1
+        chunks.append(" ".join(words)[:chunk_chars])
+    return chunks
+
+
+def _file_chunks(path, count, chunk_chars):
+    with open(path, encoding="utf-8", errors="replace") as fh:
+        text = fh.read()
+    chunks = [
+        text[start : start + chunk_chars]
+        for start in range(0, len(text), chunk_chars)
+        if text[start : start + chunk_chars].strip()
+    ]
+    return chunks[:count]
+
+
+def _percentile(samples, pct):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+class Command(BaseCommand):
+    help = "Benchmark embedding backends: chunks/s and query latency p50/p99"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--backends",
+            default="huggingface,local",
+            help="Comma separated backends to benchmark",
+        )
+        parser.add_argument("--model", default=DEFAULT_EMBEDDING_MODEL)
+        parser.add_argument("--chunks", type=int, default=500)
+        parser.add_argument("--chunk-chars", type=int, default=1000)
+        parser.add_argument("--queries", type=int, default=100)
+        parser.add_argument("--file", help="Use chunks of this text file instead")
+        parser.add_argument("--seed", type=int, default=42)
+
+    def handle(self, *args, **options):
+        if options["file"]:
+            chunks = _file_chunks(
+                options["file"], options["chunks"], options["chunk_chars"]
+            )
+        else:
+            chunks = _synthetic_chunks(
+                options["chunks"], options["chunk_chars"], options["seed"]
+            )
+        queries = [
+            " ".join(random.Random(options["seed"] + i).sample(WORDS, 8))
+            for i in range(options["queries"])
+        ]
+
+        for backend in options["backends"].split(","):
+            self.stdout.write(f"\n=== {backend} ({options['model']}) ===")
+            try:
+                started = time.perf_counter()
+                embeddings = get_embeddings(options["model"], backend=backend)
+                init_seconds = time.perf_counter() - started
+            except Exception as e:
+                self.stdout.write(self.style.ERROR(f"Could not initialise: {e}"))
+                continue
+            if embeddings is None:
+                self.stdout.write(self.style.ERROR("Backend unavailable, skipping"))
+                continue
+
+            # Warm up (model load / connection setup) outside the measurements
+            embeddings.embed_query("warm up")
+
+            started = time.perf_counter()
+            vectors = embeddings.embed_documents(chunks)
+            doc_seconds = time.perf_counter() - started
+
+            latencies = []
+            for query in queries:
+                started = time.perf_counter()
+                embeddings.embed_query(query)
+                latencies.append((time.perf_counter() - started) * 1000)
+
+            dims = len(vectors[0]) if vectors else 0
+            if dims != EMBEDDING_DIMENSIONS:
+                self.stdout.write(
+                    self.style.WARNING(
+                        f"Expected {EMBEDDING_DIMENSIONS} dims, got {dims}"
+                    )
+                )
+
+            self.stdout.write(f"init:          {init_seconds:.2f}s")
+            self.stdout.write(
+                f"documents:     {len(chunks)} chunks in {doc_seconds:.2f}s "
+                f"({len(chunks) / doc_seconds:.1f} chunks/s)"
+            )
+            self.stdout.write(
+                f"query latency: p50={statistics.median(latencies):.2f}ms "
+                f"p99={_percentile(latencies, 99):.2f}ms"
+            )
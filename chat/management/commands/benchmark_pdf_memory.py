@@ -0,0 +1,113 @@
+"""
+Django management command to compare peak memory of PDF indexing strategies.
+
+Runs, each in a fresh subprocess so ru_maxrss is not shared (the Python heap
+peak from tracemalloc is reported too, since imports dominate RSS on small
+files):
+  * whole-document: pdfminer extract_text() followed by splitting the full text
+  * streaming: page-by-page extraction and chunking (chat/extraction.py)
+
+Without --file a synthetic text-only PDF with --pages pages is generated.
+
+Usage:
+    python manage.py benchmark_pdf_memory
+    python manage.py benchmark_pdf_memory --pages 500
+    python manage.py benchmark_pdf_memory --file path/to/textbook.pdf
+"""
+
+import multiprocessing
+import os
+import random
+import resource
+import tempfile
+import time
+import tracemalloc
+
+from django.core.management.base import BaseCommand
+
+from chat.rag_eval import write_text_pdf
+
+WORDS = (
+    "matrix vector eigenvalue gradient theorem proof integral derivative "
+    "function variable network protocol memory process thread kernel cache "
+    "the a of and to in is that for with as on by this be are from"
+).split()
+
+
+def write_synthetic_pdf(path, pages, lines_per_page=45, seed=42):
+    """Write a text-only PDF of random words, 14 words per line"""
+    rng = random.Random(seed)
+    write_text_pdf(
+        path,
+        [
+            [
+                " ".join(rng.choice(WORDS) for _ in range(14))
+                for _ in range(lines_per_page)
+            ]
+            for _ in range(pages)
+        ],
+    )
+
+
+def _run_strategy(strategy, path, queue):
+    from chat.extraction import iter_document_chunks
+    from chat.text_splitter import RecursiveTextSplitter
+
+    splitter = RecursiveTextSplitter(chunk_size=1000, chunk_overlap=100)
+    baseline_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    tracemalloc.start()
+    started = time.perf_counter()
+    chunk_count = 0
+    if strategy == "whole-document":
+        from pdfminer.high_level import extract_text
+
+        text = extract_text(path)
+        chunks = splitter.split_text(text)
+        chunk_count = len(chunks)
+    else:
+        # Chunks are consumed one at a time, as build_index does
+        for _chunk in iter_document_chunks(path, "pdf", splitter):
+            chunk_count += 1
+    elapsed = time.perf_counter() - started
+    _current, peak_heap = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    peak_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    queue.put((chunk_count, elapsed, baseline_kb, peak_kb, peak_heap))
+
+
+class Command(BaseCommand):
+    help = "Compare peak RSS of whole-document vs page-streaming PDF chunking"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--file", help="PDF to use instead of a synthetic one")
+        parser.add_argument("--pages", type=int, default=500)
+
+    def handle(self, *args, **options):
+        path = options["file"]
+        temp_path = None
+        if not path:
+            fd, temp_path = tempfile.mkstemp(suffix=".pdf")
+            os.close(fd)
+            write_synthetic_pdf(temp_path, options["pages"])
+            path = temp_path
+            self.stdout.write(f"Generated {options['pages']}-page PDF at {path}")
+
+        context = multiprocessing.get_context("spawn")
+        try:
+            for strategy in ("whole-document", "streaming"):
+                queue = context.Queue()
+                process = context.Process(
+                    target=_run_strategy, args=(strategy, path, queue)
+                )
+                process.start()
+                chunk_count, elapsed, baseline_kb, peak_kb, peak_heap = queue.get()
+                process.join()
+                self.stdout.write(
+                    f"{strategy:<15} chunks={chunk_count:<6} time={elapsed:.1f}s "
+                    f"peak RSS={peak_kb / 1024:.1f} MiB "
+                    f"(+{(peak_kb - baseline_kb) / 1024:.1f} MiB over baseline), "
+                    f"peak Python heap={peak_heap / 2**20:.1f} MiB"
+                )
+        finally:
+            if temp_path:
+                os.remove(temp_path)
@@ -0,0 +1,174 @@
+"""
+Django management command to benchmark retrieval query construction.
+
+Builds synthetic conversations on an indexed chat: the question is a short
+run of words from a known chunk, and the history before it is made of other
+chunks of the same chat (long assistant answers, short user messages). Each
+conversation is retrieved with the old concatenated query (the whole history
+in front of the question) and with the condensed query, optionally also with
+the LLM rewrite. Reports hit@k (source chunk among the results), latency of
+building the query plus retrieve_docs (query embedding included), and the
+average query size in tokens.
+
+Requires PostgreSQL.
+
+Usage:
+    python manage.py benchmark_query_condensation --chat <chat_id>
+    python manage.py benchmark_query_condensation --turns 10 --rewrite
+"""
+
+import json
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Count
+
+from chat.config import RAG_TOP_K
+from chat.context_packing import estimate_tokens
+from chat.models import Chat, DocumentChunk
+from chat.query_condensation import build_retrieval_query, condense_query
+from chat.rag import get_rag_pipeline
+
+
+def _percentile(samples, pct):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def concatenated_query(query, history):
+    """The retrieval query stream_completion used to build"""
+    history_str = "\n".join(f"{m['role']}: {m['content']}" for m in history)
+    return f"Conversation_history: {history_str}\n\nQuestion: {query}"
+
+
+class Command(BaseCommand):
+    help = "Benchmark concatenated vs condensed retrieval queries on an indexed chat"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--chat", help="Chat id to query (default: the chat with most chunks)"
+        )
+        parser.add_argument("--queries", type=int, default=50)
+        parser.add_argument(
+            "--turns", type=int, default=6, help="History messages per question"
+        )
+        parser.add_argument("--words", type=int, default=8, help="Question words")
+        parser.add_argument("--k", type=int, default=RAG_TOP_K, help="Top-k")
+        parser.add_argument(
+            "--rewrite", action="store_true", help="Also benchmark the LLM rewrite"
+        )
+        parser.add_argument("--seed", type=int, default=42)
+        parser.add_argument("--json", dest="json_path", help="Write results here")
+
+    def handle(self, *args, **options):
+        if connection.vendor != "postgresql":
+            raise CommandError("This benchmark requires PostgreSQL.")
+
+        random.seed(options["seed"])
+        chat_id = options["chat"] or self._largest_chat()
+        if not chat_id:
+            raise CommandError("No indexed chats found.")
+
+        conversations = self._conversations(
+            chat_id, options["queries"], options["turns"], options["words"]
+        )
+        if not conversations:
+            raise CommandError(f"Chat {chat_id} has too few chunks to sample from.")
+
+        pipeline = get_rag_pipeline()
+        if pipeline.embeddings is None:
+            raise CommandError("No embedding backend is available.")
+        pipeline.warm_up()
+
+        strategies = [
+            ("concatenated", concatenated_query),
+            ("condensed", condense_query),
+        ]
+        if options["rewrite"]:
+            strategies.append(
+                (
+                    "rewrite",
+                    lambda query, history: build_retrieval_query(
+                        query, history, rewrite=True
+                    ),
+                )
+            )
+
+        self.stdout.write(
+            f"Chat {chat_id}: {len(conversations)} questions after "
+            f"{options['turns']} messages, k={options['k']}"
+        )
+        results = []
+        for name, build in strategies:
+            latencies, sizes, hits = [], [], 0
+            for chunk_id, question, history in conversations:
+                started = time.perf_counter()
+                retrieval_query = build(question, history)
+                documents = pipeline.retrieve_docs(
+                    retrieval_query, chat_id=chat_id, k=options["k"]
+                )
+                latencies.append((time.perf_counter() - started) * 1000)
+                sizes.append(estimate_tokens(retrieval_query))
+                hits += any(
+                    doc.metadata.get("chunk_id") == chunk_id for doc in documents
+                )
+            result = {
+                "strategy": name,
+                "queries": len(conversations),
+                "hit_at_k": round(hits / len(conversations), 4),
+                "p50_ms": round(statistics.median(latencies), 3),
+                "p95_ms": round(_percentile(latencies, 95), 3),
+                "mean_query_tokens": round(statistics.mean(sizes), 1),
+            }
+            results.append(result)
+            self.stdout.write(
+                f"{name:<13} hit@k={result['hit_at_k']:.3f} "
+                f"p50={result['p50_ms']:.1f}ms p95={result['p95_ms']:.1f}ms "
+                f"query={result['mean_query_tokens']:.0f} tokens"
+            )
+
+        if options["json_path"]:
+            with open(options["json_path"], "w") as fh:
+                json.dump(results, fh, indent=2)
+            self.stdout.write(
+                self.style.SUCCESS(f"Results written to {options['json_path']}")
+            )
+
+    def _largest_chat(self):
+        chat = (
+            Chat.objects.annotate(n_chunks=Count("rag_files__document__chunks"))
+            .filter(n_chunks__gt=0)
+            .order_by("-n_chunks")
+            .first()
+        )
+        return str(chat.id) if chat else None
+
+    def _conversations(self, chat_id, count, turns, words):
+        """(chunk id, question, history) triples built from the chat's chunks"""
+        chunks = list(DocumentChunk.for_chat(chat_id).values_list("id", "content"))
+        if len(chunks) <= turns:
+            return []
+
+        conversations = []
+        for chunk_id, content in random.sample(chunks, min(count, len(chunks))):
+            tokens = content.split()
+            if len(tokens) < words:
+                continue
+            start = random.randrange(len(tokens) - words + 1)
+            question = " ".join(tokens[start : start + words])
+
+            others = random.sample([c for c in chunks if c[0] != chunk_id], turns)
+            history = []
+            for index, (_other_id, other) in enumerate(others):
+                if index % 2:
+                    history.append({"role": "assistant", "content": other})
+                else:
+                    history.append(
+                        {"role": "user", "content": " ".join(other.split()[:15])}
+                    )
+            conversations.append((str(chunk_id), question, history))
+        return conversations
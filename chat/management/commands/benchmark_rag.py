@@ -0,0 +1,305 @@
+"""
+Django management command for the offline RAG quality and latency harness.
+
+Indexes the fixture corpus of chat/benchmark_data/rag (see chat/rag_eval.py)
+into a throwaway user's chat with the deterministic HashingEmbeddings backend,
+then runs the labelled queries through RAG_pipeline.retrieve_docs under each
+retrieval configuration. Reports, per configuration, recall@k, MRR, hit@k and
+p50/p95 retrieval latency, plus indexing throughput (chunks/s and MB/s of
+source files, extraction and embedding included).
+
+Nothing leaves the machine: no embedding API, no model download. Uploaded
+files go to a temporary MEDIA_ROOT and the user (with its chat, library and
+chunks) is deleted afterwards. Each configuration gets one untimed warm-up query, so
+one-off costs such as loading the in-memory matrix are not in the
+percentiles. The retrieval cache is disabled throughout.
+
+--distractors takes a comma-separated list of counts to measure how quality
+and latency change as a chat holds more files: the distractors are attached
+and indexed step by step, and every configuration is run at each step.
+
+The harness is meant to run against a local PostgreSQL with pgvector. On
+other databases only vector-memory and vector-memory-routed (ranked in NumPy)
+can run.
+
+Usage:
+    python manage.py benchmark_rag
+    python manage.py benchmark_rag --configs vector,hybrid --k 5
+    python manage.py benchmark_rag --distractors 200 --repeat 5 --json out.json
+    python manage.py benchmark_rag --distractors 0,20,100,400 --configs vector-memory,vector-memory-routed
+    python manage.py benchmark_rag --chunk-size 500 --chunk-overlap 50
+    python manage.py benchmark_rag --neighbours 1 --neighbour-budget 1500
+"""
+
+import argparse
+import io
+import json
+import os
+import subprocess
+import tempfile
+import time
+import uuid
+from contextlib import redirect_stdout
+from unittest import mock
+
+from django.core.files import File
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import override_settings
+from django.utils import timezone
+
+from chat import rag
+from chat.config import RAG_TOP_K
+from chat.embeddings import HashingEmbeddings
+from chat.extraction import extraction_service
+from chat.ingest import attach_document
+from chat.models import Chat, DocumentChunk, UserDocument
+from chat.rag_eval import (
+    CONFIGURATIONS,
+    POSTGRES_ONLY,
+    evaluate,
+    load_query_set,
+    prepare_corpus,
+)
+from users.models import CustomUser
+
+EMBEDDING_MODEL_NAME = "benchmark-hashing"
+
+
+def _positive_int(value):
+    number = int(value)
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"must be at least 1, got {value}")
+    return number
+
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Command(BaseCommand):
+    help = "Offline retrieval quality (recall@k, MRR) and latency harness"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--configs",
+            default=",".join(CONFIGURATIONS),
+            help=f"Comma-separated configurations ({', '.join(CONFIGURATIONS)})",
+        )
+        parser.add_argument("--k", type=int, default=RAG_TOP_K, help="Top-k")
+        parser.add_argument(
+            "--repeat", type=_positive_int, default=3, help="Timed runs of each query"
+        )
+        parser.add_argument(
+            "--distractors",
+            default="20",
+            help="Random-prose documents added to the index; a comma-separated "
+            "list (e.g. 0,20,100) runs the configurations at each count",
+        )
+        parser.add_argument(
+            "--neighbours",
+            type=int,
+            default=0,
+            help="Widen each hit with this many neighbouring chunks per side",
+        )
+        parser.add_argument(
+            "--neighbour-budget",
+            type=int,
+            default=rag.RAG_NEIGHBOUR_TOKEN_BUDGET,
+            help="Token budget of the widened passages",
+        )
+        parser.add_argument("--queries", help="Query set JSON (default: fixture)")
+        parser.add_argument("--chunk-size", type=int, default=rag.CHUNK_SIZE)
+        parser.add_argument("--chunk-overlap", type=int, default=rag.CHUNK_OVERLAP)
+        parser.add_argument("--seed", type=int, default=42)
+        parser.add_argument("--json", dest="json_path", help="Write results here")
+
+    def handle(self, *args, **options):
+        configs = [name.strip() for name in options["configs"].split(",") if name]
+        unknown = [name for name in configs if name not in CONFIGURATIONS]
+        if unknown:
+            raise CommandError(f"Unknown configuration(s): {', '.join(unknown)}")
+        if connection.vendor != "postgresql":
+            skipped = [name for name in configs if name in POSTGRES_ONLY]
+            configs = [name for name in configs if name not in POSTGRES_ONLY]
+            if skipped:
+                self.stderr.write(
+                    f"Skipping {', '.join(skipped)}: they require PostgreSQL."
+                )
+            if not configs:
+                raise CommandError("No configuration can run on this database.")
+
+        try:
+            steps = sorted(
+                {int(count) for count in options["distractors"].split(",") if count}
+            )
+        except ValueError:
+            raise CommandError("--distractors takes comma-separated integers.")
+        if not steps or steps[0] < 0:
+            raise CommandError("--distractors takes counts of 0 or more.")
+
+        query_set = load_query_set(options["queries"])
+        pipeline = rag.RAG_pipeline(
+            embedding_model_name=EMBEDDING_MODEL_NAME, embeddings=HashingEmbeddings()
+        )
+
+        with (
+            tempfile.TemporaryDirectory() as media_root,
+            override_settings(MEDIA_ROOT=media_root),
+            mock.patch.multiple(
+                rag,
+                RETRIEVAL_CACHE_ENABLED=False,
+                CHUNK_SIZE=options["chunk_size"],
+                CHUNK_OVERLAP=options["chunk_overlap"],
+            ),
+        ):
+            corpus_dir = os.path.join(media_root, "corpus")
+            os.makedirs(corpus_dir)
+            files = prepare_corpus(
+                query_set,
+                corpus_dir,
+                distractors=steps[-1],
+                seed=options["seed"],
+            )
+            username = f"rag-benchmark-{uuid.uuid4().hex[:12]}"
+            user = CustomUser.objects.create(
+                username=username, email=f"{username}@example.invalid"
+            )
+            try:
+                report = self._run(
+                    pipeline, user, files, query_set, configs, steps, options
+                )
+            finally:
+                user.delete()
+
+        if options["json_path"]:
+            with open(options["json_path"], "w") as fh:
+                json.dump(report, fh, indent=2)
+            self.stdout.write(
+                self.style.SUCCESS(f"Results written to {options['json_path']}")
+            )
+
+    def _run(self, pipeline, user, files, query_set, configs, steps, options):
+        chat = Chat.objects.create(user=user, title="RAG benchmark")
+        base_files = [entry for entry in files if entry[2] is not None]
+        distractor_files = [entry for entry in files if entry[2] is None]
+        queries = query_set["queries"]
+        sources = {}
+
+        def source_of(doc):
+            return sources.get(doc.metadata.get("file_path"))
+
+        indexing_steps = []
+        results = []
+        indexed = 0
+        for step, count in enumerate(steps):
+            # Each step attaches and indexes only the files added since the last
+            new_files = (base_files if step == 0 else []) + distractor_files[
+                indexed:count
+            ]
+            indexed = count
+            indexing, new_sources = self._index(pipeline, chat, user, new_files)
+            sources.update(new_sources)
+            indexing["total_files"] = len(base_files) + count
+            indexing_steps.append(indexing)
+            self.stdout.write(
+                f"Indexed {indexing['files']} files ({indexing['megabytes']:.2f} MB) "
+                f"into {indexing['chunks']} chunks in {indexing['seconds']:.2f}s: "
+                f"{indexing['chunks_per_second']:.1f} chunks/s, "
+                f"{indexing['mb_per_second']:.2f} MB/s"
+            )
+            self.stdout.write(
+                f"{indexing['total_files']} files, {len(queries)} queries, "
+                f"k={options['k']}, repeat={options['repeat']}"
+            )
+            for name in configs:
+                result = self._evaluate(
+                    pipeline, chat, name, queries, source_of, options
+                )
+                result = {"files": indexing["total_files"], **result}
+                results.append(result)
+                self.stdout.write(
+                    f"{name:<20} recall@k={result['recall_at_k']:.3f} "
+                    f"MRR={result['mrr']:.3f} hit@k={result['hit_at_k']:.3f} "
+                    f"p50={result['p50_ms']:.2f}ms p95={result['p95_ms']:.2f}ms"
+                )
+
+        return {
+            "created_at": timezone.now().isoformat(),
+            "git_commit": _git_commit(),
+            "database": connection.vendor,
+            "embeddings": f"hashing-{pipeline.embeddings.dimensions}",
+            "chunk_size": options["chunk_size"],
+            "chunk_overlap": options["chunk_overlap"],
+            "k": options["k"],
+            "neighbours": options["neighbours"],
+            "neighbour_budget": options["neighbour_budget"],
+            "repeat": options["repeat"],
+            "indexing": indexing_steps,
+            "results": results,
+        }
+
+    def _evaluate(self, pipeline, chat, name, queries, source_of, options):
+        config = CONFIGURATIONS[name]
+
+        def retrieve(query):
+            return pipeline.retrieve_docs(
+                query,
+                chat_id=chat.id,
+                mode=config["mode"],
+                k=options["k"],
+                neighbours=options["neighbours"],
+                token_budget=options["neighbour_budget"],
+            )
+
+        with mock.patch.multiple(rag, **config["settings"]):
+            with redirect_stdout(io.StringIO()):
+                retrieve(queries[0]["query"])  # warm-up, untimed
+                result = evaluate(retrieve, queries, source_of, options["repeat"])
+        return {"config": name, "mode": config["mode"], **result}
+
+    def _index(self, pipeline, chat, user, files):
+        """Upload and index the corpus; returns (stats, {stored path: manifest name})"""
+        documents = []
+        sources = {}
+        for path, file_type, name in files:
+            filename = os.path.basename(path)
+            document = UserDocument(user=user, original_filename=filename)
+            with open(path, "rb") as fh:
+                document.file.save(filename, File(fh), save=True)
+            attach_document(chat, document)
+            documents.append(document)
+            sources[document.file.path] = name
+
+        # Start the PDF extraction pool outside the timed section
+        pdfs = [path for path, file_type, _name in files if file_type == "pdf"]
+        if pdfs:
+            list(extraction_service.iter_pdf_pages(pdfs[0]))
+
+        total_bytes = sum(os.path.getsize(path) for path in sources)
+        started = time.perf_counter()
+        with redirect_stdout(io.StringIO()):
+            pipeline.build_index(documents)
+        elapsed = time.perf_counter() - started
+
+        chunks = DocumentChunk.objects.filter(document__in=documents).count()
+        if documents and not chunks:
+            raise CommandError("Indexing produced no chunks.")
+        megabytes = total_bytes / (1024 * 1024)
+        stats = {
+            "files": len(documents),
+            "megabytes": round(megabytes, 4),
+            "chunks": chunks,
+            "seconds": round(elapsed, 3),
+            "chunks_per_second": round(chunks / elapsed, 1) if elapsed else 0.0,
+            "mb_per_second": round(megabytes / elapsed, 3) if elapsed else 0.0,
+        }
+        return stats, sources
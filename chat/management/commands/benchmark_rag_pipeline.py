@@ -0,0 +1,70 @@
+"""
+Django management command to measure the cost of building RAG_pipeline per turn.
+
+Simulates chat turns that each embed a fresh query, once constructing a new
+RAG_pipeline per turn (the old behaviour) and once using the shared pipeline
+from get_rag_pipeline(). Queries are unique, so the query embedding cache
+never answers them and both sides pay for a real embedding call. The
+difference of the means is the latency the shared pipeline removes per turn.
+
+Usage:
+    python manage.py benchmark_rag_pipeline
+    python manage.py benchmark_rag_pipeline --turns 50
+"""
+
+import statistics
+import time
+import uuid
+
+from django.core.management.base import BaseCommand, CommandError
+
+from chat.rag import RAG_pipeline, get_rag_pipeline
+
+
+def _percentile(samples, pct):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+class Command(BaseCommand):
+    help = "Compare per-turn RAG_pipeline construction with the shared pipeline"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--turns", type=int, default=20)
+
+    def handle(self, *args, **options):
+        shared = get_rag_pipeline()
+        if shared.embeddings is None:
+            raise CommandError("No embedding backend is available.")
+
+        started = time.perf_counter()
+        shared.warm_up()
+        self.stdout.write(f"Warm-up: {(time.perf_counter() - started) * 1000:.1f}ms")
+
+        run = uuid.uuid4().hex[:8]
+        per_turn, construction, reused = [], [], []
+        for turn in range(options["turns"]):
+            started = time.perf_counter()
+            pipeline = RAG_pipeline()
+            built = time.perf_counter()
+            pipeline.embeddings.embed_query(f"per-turn query {run} {turn}")
+            per_turn.append((time.perf_counter() - started) * 1000)
+            construction.append((built - started) * 1000)
+
+            started = time.perf_counter()
+            get_rag_pipeline().embeddings.embed_query(f"shared query {run} {turn}")
+            reused.append((time.perf_counter() - started) * 1000)
+
+        for label, samples in (
+            ("per-turn pipeline", per_turn),
+            ("  of which __init__", construction),
+            ("shared pipeline", reused),
+        ):
+            self.stdout.write(
+                f"{label:<20} mean={statistics.mean(samples):.1f}ms "
+                f"p50={statistics.median(samples):.1f}ms "
+                f"p95={_percentile(samples, 95):.1f}ms"
+            )
+        saved = statistics.mean(per_turn) - statistics.mean(reused)
+        self.stdout.write(self.style.SUCCESS(f"Removed per turn: {saved:.1f}ms"))
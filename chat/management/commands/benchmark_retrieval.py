@@ -0,0 +1,140 @@
+"""
+Django management command to benchmark vector vs hybrid retrieval.
+
+Samples chunks from an indexed chat and turns a short window of each chunk's
+text into a query, so every query contains exact terms from a known chunk.
+Each query is run through RAG_pipeline.retrieve_docs in every mode, and the
+command reports latency percentiles and hit@k (how often the source chunk is
+among the results).
+
+Query embeddings are computed once before timing, so with the query embedding
+cache enabled the numbers measure the database side of retrieval.
+
+Requires PostgreSQL (full-text search).
+
+Usage:
+    python manage.py benchmark_retrieval --chat <chat_id>
+    python manage.py benchmark_retrieval --queries 200 --json out.json
+"""
+
+import json
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Count
+
+from chat.config import RAG_TOP_K
+from chat.models import Chat, DocumentChunk
+from chat.rag import get_rag_pipeline
+
+MODES = ("vector", "lexical", "hybrid")
+
+
+def _percentile(samples, pct):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+class Command(BaseCommand):
+    help = "Benchmark vector, lexical and hybrid (RRF) retrieval on an indexed chat"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--chat", help="Chat id to query (default: the chat with most chunks)"
+        )
+        parser.add_argument(
+            "--queries", type=int, default=100, help="Number of sampled queries"
+        )
+        parser.add_argument(
+            "--words", type=int, default=6, help="Words per sampled query"
+        )
+        parser.add_argument("--k", type=int, default=RAG_TOP_K, help="Top-k")
+        parser.add_argument("--seed", type=int, default=42)
+        parser.add_argument("--json", dest="json_path", help="Write results here")
+
+    def handle(self, *args, **options):
+        if connection.vendor != "postgresql":
+            raise CommandError("This benchmark requires PostgreSQL.")
+
+        random.seed(options["seed"])
+        chat_id = options["chat"] or self._largest_chat()
+        if not chat_id:
+            raise CommandError("No indexed chats found.")
+
+        queries = self._sample_queries(chat_id, options["queries"], options["words"])
+        if not queries:
+            raise CommandError(f"Chat {chat_id} has no chunks to sample from.")
+
+        pipeline = get_rag_pipeline()
+        if pipeline.embeddings is None:
+            raise CommandError("No embedding backend is available.")
+
+        # Warm the query embedding cache so timings exclude the embedding call
+        for _chunk_id, query in queries:
+            pipeline.embeddings.embed_query(query)
+
+        self.stdout.write(
+            f"Chat {chat_id}: {len(queries)} queries of {options['words']} words, "
+            f"k={options['k']}"
+        )
+        results = []
+        for mode in MODES:
+            latencies, hits = [], 0
+            for chunk_id, query in queries:
+                started = time.perf_counter()
+                documents = pipeline.retrieve_docs(
+                    query, chat_id=chat_id, mode=mode, k=options["k"]
+                )
+                latencies.append((time.perf_counter() - started) * 1000)
+                hits += any(
+                    doc.metadata.get("chunk_id") == chunk_id for doc in documents
+                )
+            result = {
+                "mode": mode,
+                "queries": len(queries),
+                "hit_at_k": round(hits / len(queries), 4),
+                "p50_ms": round(statistics.median(latencies), 3),
+                "p95_ms": round(_percentile(latencies, 95), 3),
+                "mean_ms": round(statistics.mean(latencies), 3),
+            }
+            results.append(result)
+            self.stdout.write(
+                f"{mode:<8} hit@k={result['hit_at_k']:.3f} "
+                f"p50={result['p50_ms']:.2f}ms p95={result['p95_ms']:.2f}ms"
+            )
+
+        if options["json_path"]:
+            with open(options["json_path"], "w") as fh:
+                json.dump(results, fh, indent=2)
+            self.stdout.write(
+                self.style.SUCCESS(f"Results written to {options['json_path']}")
+            )
+
+    def _largest_chat(self):
+        chat = (
+            Chat.objects.annotate(n_chunks=Count("rag_files__document__chunks"))
+            .filter(n_chunks__gt=0)
+            .order_by("-n_chunks")
+            .first()
+        )
+        return str(chat.id) if chat else None
+
+    def _sample_queries(self, chat_id, count, words):
+        """(chunk id, query) pairs: a random run of words from random chunks"""
+        chunks = list(
+            DocumentChunk.for_chat(chat_id)
+            .order_by("?")
+            .values_list("id", "content")[:count]
+        )
+        queries = []
+        for chunk_id, content in chunks:
+            tokens = content.split()
+            if len(tokens) < words:
+                continue
+            start = random.randrange(len(tokens) - words + 1)
+            queries.append((str(chunk_id), " ".join(tokens[start : start + words])))
+        return queries
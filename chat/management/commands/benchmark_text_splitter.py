@@ -0,0 +1,171 @@
+"""
+Django management command to check and benchmark chat.text_splitter.
+
+First checks parity: RecursiveTextSplitter must return exactly the chunks of
+LangChain's RecursiveCharacterTextSplitter. It is run on randomly generated
+texts (mixing paragraphs, single newlines, runs of spaces and unbroken words
+longer than a chunk) across chunk sizes, overlaps and separator lists, and on
+the benchmark text itself. Any mismatch fails the command.
+
+Then times both splitters on the benchmark text (default 10 MB of synthetic
+prose, or --file) and reports MB/s and peak traced memory. For the native
+splitter, both split_text (chunk strings) and iter_spans (offsets only) are
+measured.
+
+Usage:
+    python manage.py benchmark_text_splitter
+    python manage.py benchmark_text_splitter --mb 50 --cases 5000
+    python manage.py benchmark_text_splitter --file path/to/book.txt
+"""
+
+import random
+import time
+import tracemalloc
+
+from django.core.management.base import BaseCommand, CommandError
+
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+from chat.text_splitter import RecursiveTextSplitter
+
+WORDS = (
+    "matrix vector eigenvalue gradient theorem proof integral derivative "
+    "function variable network protocol memory process thread kernel cache "
+    "the a of and to in is that for with as on by this be are from"
+).split()
+
+# Fragments for parity cases, weighted towards separator edge cases
+FRAGMENTS = WORDS[:8] + [
+    " ",
+    "  ",
+    "\n",
+    "\n\n",
+    "\n \n",
+    "\t",
+    ",",
+    ".",
+    "\\n",
+    "é",
+    "x" * 60,
+    "y" * 1500,
+]
+
+SEPARATOR_LISTS = [None, [" ", ",", "\\n"], ["\n", " "], ["."], ["\n\n", "\n", " "]]
+
+
+def _synthetic_text(size, seed):
+    rng = random.Random(seed)
+    paragraphs = []
+    length = 0
+    while length < size:
+        sentences = []
+        for _ in range(rng.randint(1, 12)):
+            words = rng.choices(WORDS, k=rng.randint(5, 30))
+            sentences.append(" ".join(words).capitalize() + ".")
+        # Some paragraphs are hard-wrapped like extracted PDF text
+        paragraph = " ".join(sentences)
+        if rng.random() < 0.3:
+            paragraph = "\n".join(
+                paragraph[i : i + 80] for i in range(0, len(paragraph), 80)
+            )
+        paragraphs.append(paragraph)
+        length += len(paragraph) + 2
+    return "\n\n".join(paragraphs)[:size]
+
+
+def _parity_case(rng):
+    text = "".join(
+        rng.choice(FRAGMENTS) if rng.random() < 0.3 else rng.choice(WORDS + [" "])
+        for _ in range(rng.randint(0, 500))
+    )
+    chunk_size = rng.choice([10, 50, 100, 300, 1000])
+    chunk_overlap = rng.choice([0, 1, 5, chunk_size // 10, chunk_size // 2, chunk_size])
+    return text, chunk_size, chunk_overlap, rng.choice(SEPARATOR_LISTS)
+
+
+def _splitters(chunk_size, chunk_overlap, separators=None):
+    return (
+        RecursiveCharacterTextSplitter(
+            chunk_size=chunk_size, chunk_overlap=chunk_overlap, separators=separators
+        ),
+        RecursiveTextSplitter(
+            chunk_size=chunk_size, chunk_overlap=chunk_overlap, separators=separators
+        ),
+    )
+
+
+def _measure(func, text, repeat):
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = func(text)
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+
+    tracemalloc.start()
+    func(text)
+    _current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return best, peak, result
+
+
+class Command(BaseCommand):
+    help = "Check parity with LangChain's splitter and benchmark RecursiveTextSplitter"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--mb", type=float, default=10, help="Synthetic text size in MB"
+        )
+        parser.add_argument("--file", help="Benchmark this text file instead")
+        parser.add_argument(
+            "--cases", type=int, default=2000, help="Random parity cases"
+        )
+        parser.add_argument("--chunk-size", type=int, default=1000)
+        parser.add_argument("--chunk-overlap", type=int, default=100)
+        parser.add_argument("--repeat", type=int, default=3)
+        parser.add_argument("--seed", type=int, default=42)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options["seed"])
+        for case in range(options["cases"]):
+            text, chunk_size, chunk_overlap, separators = _parity_case(rng)
+            reference, native = _splitters(chunk_size, chunk_overlap, separators)
+            if reference.split_text(text) != native.split_text(text):
+                raise CommandError(
+                    f"Parity case {case} differs (chunk_size={chunk_size}, "
+                    f"chunk_overlap={chunk_overlap}, separators={separators!r}): "
+                    f"{text[:200]!r}"
+                )
+        self.stdout.write(f"Parity: {options['cases']} random cases match")
+
+        if options["file"]:
+            with open(options["file"], encoding="utf-8", errors="replace") as fh:
+                text = fh.read()
+        else:
+            text = _synthetic_text(int(options["mb"] * 1024 * 1024), options["seed"])
+        megabytes = len(text.encode("utf-8")) / (1024 * 1024)
+
+        reference, native = _splitters(options["chunk_size"], options["chunk_overlap"])
+        runs = [
+            ("langchain split_text", reference.split_text),
+            ("native split_text", native.split_text),
+            ("native iter_spans", lambda t: sum(1 for _ in native.iter_spans(t))),
+        ]
+        results = {}
+        for label, func in runs:
+            elapsed, peak, result = _measure(func, text, options["repeat"])
+            results[label] = result
+            self.stdout.write(
+                f"{label:<22} {elapsed:.2f}s ({megabytes / elapsed:.1f} MB/s), "
+                f"peak {peak / (1024 * 1024):.1f} MiB"
+            )
+
+        chunks = results["langchain split_text"]
+        if results["native split_text"] != chunks:
+            raise CommandError("Chunks of the benchmark text differ")
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"{megabytes:.1f} MB -> {len(chunks)} identical chunks "
+                f"(size {options['chunk_size']}, overlap {options['chunk_overlap']})"
+            )
+        )
@@ -0,0 +1,367 @@
+"""
+Django management command to benchmark exact vs HNSW vector search.
+
+Builds a synthetic, unlogged copy of chat_document_chunks with clustered
+384-dim embeddings spread over many chats, then runs the same chat-filtered
+cosine query that RAG_pipeline.retrieve_docs issues, once as an exact scan and
+once through the HNSW index, and reports recall@k and latency percentiles.
+
+The compact storage options (VECTOR_STORAGE=halfvec, VECTOR_BINARY_PREFILTER)
+are measured on the same data: a halfvec column with its own HNSW index, and a
+binary-quantised HNSW index whose Hamming-distance candidates are re-ranked by
+exact cosine distance. Recall is always against the exact float32 result, and
+column/index sizes and index build times are reported.
+
+Requires PostgreSQL with the pgvector extension (>= 0.7 for halfvec and
+binary quantisation, >= 0.8 for iterative scans).
+
+Usage:
+    python manage.py benchmark_vector_index
+    python manage.py benchmark_vector_index --sizes 10000,100000 --json out.json
+"""
+
+import json
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from chat.config import (
+    BINARY_RERANK_CANDIDATES,
+    EMBEDDING_DIMENSIONS,
+    HNSW_MAX_SCAN_TUPLES,
+)
+
+BENCH_TABLE = "bench_document_chunks"
+BENCH_CENTROIDS = "bench_chat_centroids"
+
+
+def _percentile(samples, pct):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+class Command(BaseCommand):
+    help = "Benchmark exact vs HNSW (ANN) recall@k and latency on synthetic chunks"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--sizes",
+            default="10000,100000,1000000",
+            help="Comma separated chunk counts to benchmark",
+        )
+        parser.add_argument(
+            "--chats", type=int, default=100, help="Number of chats to spread over"
+        )
+        parser.add_argument(
+            "--queries", type=int, default=200, help="Queries per configuration"
+        )
+        parser.add_argument("--k", type=int, default=4, help="Top-k to retrieve")
+        parser.add_argument(
+            "--ef-search",
+            default="40,100,200",
+            help="Comma separated hnsw.ef_search values to try",
+        )
+        parser.add_argument("--seed", type=int, default=42)
+        parser.add_argument("--json", dest="json_path", help="Write results here")
+        parser.add_argument(
+            "--rerank",
+            type=int,
+            default=BINARY_RERANK_CANDIDATES,
+            help="Binary-quantised candidates re-ranked by exact distance",
+        )
+        parser.add_argument(
+            "--skip-quantized",
+            action="store_true",
+            help="Only benchmark the float32 column",
+        )
+        parser.add_argument(
+            "--keep", action="store_true", help="Keep the benchmark tables"
+        )
+
+    def handle(self, *args, **options):
+        if connection.vendor != "postgresql":
+            raise CommandError("This benchmark requires PostgreSQL with pgvector.")
+
+        random.seed(options["seed"])
+        sizes = [int(size) for size in options["sizes"].split(",")]
+        ef_values = [int(ef) for ef in options["ef_search"].split(",")]
+        results = []
+
+        try:
+            for size in sizes:
+                self.stdout.write(f"\n=== {size} chunks / {options['chats']} chats ===")
+                build_seconds = self._build_table(size, options["chats"])
+                index_mb = self._index_mb("bench_embedding_hnsw")
+                self.stdout.write(
+                    f"HNSW build time: {build_seconds:.1f}s, index {index_mb:.1f} MB"
+                )
+
+                queries = self._sample_queries(options["chats"], options["queries"])
+                exact_ids, exact_latencies = self._run(queries, options["k"], None)
+                results.append(
+                    self._report(
+                        size,
+                        "exact",
+                        None,
+                        exact_latencies,
+                        1.0,
+                        build_seconds,
+                        index_mb,
+                    )
+                )
+
+                for ef_search in ef_values:
+                    for iterative_scan in ("off", "relaxed_order"):
+                        ann_ids, latencies = self._run(
+                            queries,
+                            options["k"],
+                            {"ef_search": ef_search, "iterative_scan": iterative_scan},
+                        )
+                        recall = statistics.mean(
+                            len(set(ann) & set(exact)) / options["k"]
+                            for ann, exact in zip(ann_ids, exact_ids)
+                        )
+                        results.append(
+                            self._report(
+                                size,
+                                f"hnsw iterative_scan={iterative_scan}",
+                                ef_search,
+                                latencies,
+                                recall,
+                                build_seconds,
+                                index_mb,
+                            )
+                        )
+
+                if not options["skip_quantized"]:
+                    results.extend(
+                        self._run_quantized(
+                            size, queries, exact_ids, ef_values, options
+                        )
+                    )
+        finally:
+            if not options["keep"]:
+                with connection.cursor() as cursor:
+                    cursor.execute(f"DROP TABLE IF EXISTS {BENCH_TABLE}")
+                    cursor.execute(f"DROP TABLE IF EXISTS {BENCH_CENTROIDS}")
+
+        if options["json_path"]:
+            with open(options["json_path"], "w") as fh:
+                json.dump(results, fh, indent=2)
+            self.stdout.write(
+                self.style.SUCCESS(f"Results written to {options['json_path']}")
+            )
+
+    def _build_table(self, size, chats):
+        """(Re)create the synthetic table: one random centroid per chat plus noise"""
+        dims = EMBEDDING_DIMENSIONS
+        with connection.cursor() as cursor:
+            cursor.execute(f"DROP TABLE IF EXISTS {BENCH_TABLE}")
+            cursor.execute(f"DROP TABLE IF EXISTS {BENCH_CENTROIDS}")
+            cursor.execute(
+                f"CREATE UNLOGGED TABLE {BENCH_CENTROIDS} "
+                f"(chat_id integer, dim integer, value float8)"
+            )
+            cursor.execute(
+                f"INSERT INTO {BENCH_CENTROIDS} "
+                f"SELECT c, d, random() - 0.5 "
+                f"FROM generate_series(0, %s) c, generate_series(1, %s) d",
+                [chats - 1, dims],
+            )
+            cursor.execute(f"CREATE INDEX ON {BENCH_CENTROIDS} (chat_id, dim)")
+            cursor.execute(
+                f"CREATE UNLOGGED TABLE {BENCH_TABLE} ("
+                f"id bigserial PRIMARY KEY, chat_id integer NOT NULL, "
+                f"embedding vector({dims}) NOT NULL)"
+            )
+            cursor.execute(
+                f"INSERT INTO {BENCH_TABLE} (chat_id, embedding) "
+                f"SELECT g %% %s, ("
+                f"  SELECT array_agg(c.value + (random() - 0.5) * 0.6 ORDER BY c.dim)"
+                f"  FROM {BENCH_CENTROIDS} c WHERE c.chat_id = g %% %s"
+                f")::vector FROM generate_series(1, %s) g",
+                [chats, chats, size],
+            )
+            cursor.execute(f"CREATE INDEX ON {BENCH_TABLE} (chat_id)")
+
+            started = time.perf_counter()
+            cursor.execute(
+                f"CREATE INDEX bench_embedding_hnsw ON {BENCH_TABLE} USING hnsw "
+                f"(embedding vector_cosine_ops) WITH (m = 16, ef_construction = 64)"
+            )
+            build_seconds = time.perf_counter() - started
+            cursor.execute(f"ANALYZE {BENCH_TABLE}")
+        return build_seconds
+
+    def _sample_queries(self, chats, count):
+        """Pick (chat_id, query vector) pairs: stored vectors from the chat, jittered"""
+        queries = []
+        with connection.cursor() as cursor:
+            for _ in range(count):
+                chat_id = random.randrange(chats)
+                cursor.execute(
+                    f"SELECT embedding::text FROM {BENCH_TABLE} "
+                    f"WHERE chat_id = %s ORDER BY random() LIMIT 1",
+                    [chat_id],
+                )
+                row = cursor.fetchone()
+                if not row:
+                    continue
+                vector = [v + random.uniform(-0.05, 0.05) for v in json.loads(row[0])]
+                queries.append((chat_id, "[" + ",".join(map(str, vector)) + "]"))
+        return queries
+
+    def _run(self, queries, k, ann_settings):
+        """Run every query; ann_settings=None forces an exact scan"""
+        all_ids, latencies = [], []
+        for chat_id, vector in queries:
+            with transaction.atomic(), connection.cursor() as cursor:
+                if ann_settings is None:
+                    cursor.execute("SET LOCAL enable_indexscan = off")
+                else:
+                    cursor.execute(
+                        f"SET LOCAL hnsw.ef_search = {int(ann_settings['ef_search'])}"
+                    )
+                    cursor.execute(
+                        f"SET LOCAL hnsw.iterative_scan = {ann_settings['iterative_scan']}"
+                    )
+                    cursor.execute(
+                        f"SET LOCAL hnsw.max_scan_tuples = {int(HNSW_MAX_SCAN_TUPLES)}"
+                    )
+                started = time.perf_counter()
+                cursor.execute(
+                    f"SELECT id FROM {BENCH_TABLE} WHERE chat_id = %s "
+                    f"ORDER BY embedding <=> %s::vector LIMIT %s",
+                    [chat_id, vector, k],
+                )
+                rows = cursor.fetchall()
+                latencies.append((time.perf_counter() - started) * 1000)
+            all_ids.append([row[0] for row in rows])
+        return all_ids, latencies
+
+    def _run_quantized(self, size, queries, exact_ids, ef_values, options):
+        """Benchmark the halfvec column and binary quantisation with re-rank"""
+        dims = EMBEDDING_DIMENSIONS
+        k = options["k"]
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"ALTER TABLE {BENCH_TABLE} ADD COLUMN embedding_half halfvec({dims})"
+            )
+            cursor.execute(
+                f"UPDATE {BENCH_TABLE} SET embedding_half = embedding::halfvec({dims})"
+            )
+            cursor.execute(
+                f"SELECT avg(pg_column_size(embedding)), "
+                f"avg(pg_column_size(embedding_half)) FROM {BENCH_TABLE}"
+            )
+            full_bytes, half_bytes = cursor.fetchone()
+            self.stdout.write(
+                f"Bytes per vector: vector={float(full_bytes):.0f} "
+                f"halfvec={float(half_bytes):.0f} bit={dims // 8}"
+            )
+
+            started = time.perf_counter()
+            cursor.execute(
+                f"CREATE INDEX bench_embedding_half_hnsw ON {BENCH_TABLE} "
+                f"USING hnsw (embedding_half halfvec_cosine_ops) "
+                f"WITH (m = 16, ef_construction = 64)"
+            )
+            half_build = time.perf_counter() - started
+
+            started = time.perf_counter()
+            cursor.execute(
+                f"CREATE INDEX bench_embedding_bit_hnsw ON {BENCH_TABLE} "
+                f"USING hnsw ((binary_quantize(embedding)::bit({dims})) "
+                f"bit_hamming_ops) WITH (m = 16, ef_construction = 64)"
+            )
+            bit_build = time.perf_counter() - started
+            cursor.execute(f"ANALYZE {BENCH_TABLE}")
+
+        half_mb = self._index_mb("bench_embedding_half_hnsw")
+        bit_mb = self._index_mb("bench_embedding_bit_hnsw")
+        self.stdout.write(
+            f"halfvec HNSW build {half_build:.1f}s, {half_mb:.1f} MB; "
+            f"binary HNSW build {bit_build:.1f}s, {bit_mb:.1f} MB"
+        )
+
+        half_sql = (
+            f"SELECT id FROM {BENCH_TABLE} WHERE chat_id = %(chat_id)s "
+            f"ORDER BY embedding_half <=> %(vector)s::halfvec({dims}) LIMIT %(k)s"
+        )
+        binary_sql = (
+            f"SELECT id FROM ("
+            f"  SELECT id, embedding FROM {BENCH_TABLE} WHERE chat_id = %(chat_id)s"
+            f"  ORDER BY binary_quantize(embedding)::bit({dims}) <~> "
+            f"  binary_quantize(%(vector)s::vector({dims}))::bit({dims})"
+            f"  LIMIT %(rerank)s"
+            f") candidates ORDER BY embedding <=> %(vector)s::vector LIMIT %(k)s"
+        )
+
+        results = []
+        for ef_search in ef_values:
+            for mode, sql, build, index_mb in (
+                ("halfvec", half_sql, half_build, half_mb),
+                (f"binary+rerank({options['rerank']})", binary_sql, bit_build, bit_mb),
+            ):
+                ids, latencies = self._run_sql(
+                    queries,
+                    sql,
+                    {"k": k, "rerank": max(options["rerank"], k)},
+                    max(ef_search, options["rerank"] if "binary" in mode else 0),
+                )
+                recall = statistics.mean(
+                    len(set(found) & set(exact)) / k
+                    for found, exact in zip(ids, exact_ids)
+                )
+                results.append(
+                    self._report(
+                        size, mode, ef_search, latencies, recall, build, index_mb
+                    )
+                )
+        return results
+
+    def _run_sql(self, queries, sql, params, ef_search):
+        """Run a parameterised ANN query for every (chat_id, vector) pair"""
+        all_ids, latencies = [], []
+        for chat_id, vector in queries:
+            with transaction.atomic(), connection.cursor() as cursor:
+                cursor.execute(f"SET LOCAL hnsw.ef_search = {int(ef_search)}")
+                cursor.execute("SET LOCAL hnsw.iterative_scan = relaxed_order")
+                cursor.execute(
+                    f"SET LOCAL hnsw.max_scan_tuples = {int(HNSW_MAX_SCAN_TUPLES)}"
+                )
+                started = time.perf_counter()
+                cursor.execute(sql, {**params, "chat_id": chat_id, "vector": vector})
+                rows = cursor.fetchall()
+                latencies.append((time.perf_counter() - started) * 1000)
+            all_ids.append([row[0] for row in rows])
+        return all_ids, latencies
+
+    def _index_mb(self, name):
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT pg_relation_size(%s)", [name])
+            return cursor.fetchone()[0] / (1024 * 1024)
+
+    def _report(
+        self, size, mode, ef_search, latencies, recall, build_seconds, index_mb=None
+    ):
+        result = {
+            "chunks": size,
+            "mode": mode,
+            "ef_search": ef_search,
+            "recall_at_k": round(recall, 4),
+            "p50_ms": round(statistics.median(latencies), 3),
+            "p95_ms": round(_percentile(latencies, 95), 3),
+            "hnsw_build_s": round(build_seconds, 2),
+            "index_mb": round(index_mb, 2) if index_mb is not None else None,
+        }
+        label = mode if ef_search is None else f"{mode} ef_search={ef_search}"
+        self.stdout.write(
+            f"{label:<45} recall@k={result['recall_at_k']:.3f} "
+            f"p50={result['p50_ms']:.2f}ms p95={result['p95_ms']:.2f}ms"
+        )
+        return result
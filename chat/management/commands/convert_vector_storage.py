@@ -0,0 +1,188 @@
+"""
+Django management command to move chunk embeddings between storage formats.
+
+--to halfvec copies every float32 embedding into embedding_half (float16);
+--to vector does the reverse. The source column is left as it is, so search
+(which follows VECTOR_STORAGE) keeps seeing every chunk while the copy runs,
+and an interrupted run simply continues where it stopped. Rows are copied in
+batches, each in its own transaction.
+
+Once it has finished, set VECTOR_STORAGE to the target and restart the app.
+Then --clear-source copies the rows added in the meantime and clears the old
+column in batches. Disk space freed by the cleared column is reused by new
+rows; VACUUM FULL (or pg_repack) returns it to the operating system.
+
+--binary-index builds the binary-quantised HNSW index used when
+VECTOR_BINARY_PREFILTER is enabled, over the column of the target storage.
+
+Requires PostgreSQL with pgvector >= 0.7.
+
+Usage:
+    python manage.py convert_vector_storage --to halfvec
+    VECTOR_STORAGE=halfvec python manage.py convert_vector_storage --clear-source
+    python manage.py convert_vector_storage --to halfvec --binary-index
+    python manage.py convert_vector_storage --drop-binary-index
+"""
+
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from chat.config import EMBEDDING_DIMENSIONS, VECTOR_STORAGE
+
+TABLE = "chat_document_chunks"
+COLUMNS = {"vector": "embedding", "halfvec": "embedding_half"}
+
+
+def _source_column(target):
+    return COLUMNS["halfvec" if target == "vector" else "vector"]
+
+
+def binary_index_name(column):
+    return f"chat_chunk_{column}_bit"
+
+
+class Command(BaseCommand):
+    help = "Convert chunk embeddings between vector and halfvec storage"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--to",
+            choices=sorted(COLUMNS),
+            help="Storage format to convert existing rows to",
+        )
+        parser.add_argument(
+            "--clear-source",
+            action="store_true",
+            help="After cutover to VECTOR_STORAGE, clear the other column",
+        )
+        parser.add_argument("--batch-size", type=int, default=5000)
+        parser.add_argument(
+            "--binary-index",
+            action="store_true",
+            help="Build the binary-quantised HNSW index for the target storage",
+        )
+        parser.add_argument(
+            "--drop-binary-index",
+            action="store_true",
+            help="Drop the binary-quantised HNSW indexes",
+        )
+
+    def handle(self, *args, **options):
+        if connection.vendor != "postgresql":
+            raise CommandError("This command requires PostgreSQL with pgvector.")
+
+        target = options["to"] or VECTOR_STORAGE
+        if target not in COLUMNS:
+            raise CommandError(f"Unknown vector storage: {target}")
+
+        if options["clear_source"] and target != VECTOR_STORAGE:
+            raise CommandError(
+                f"Search still uses {VECTOR_STORAGE}; set VECTOR_STORAGE={target} "
+                f"and restart the app before clearing the other column."
+            )
+
+        if options["to"] or options["clear_source"]:
+            self._convert(target, options["batch_size"])
+            if target != VECTOR_STORAGE:
+                self.stdout.write(
+                    self.style.WARNING(
+                        f"Set VECTOR_STORAGE={target} and restart so new chunks "
+                        f"and searches use the converted column, then run "
+                        f"--clear-source to free the old one."
+                    )
+                )
+        if options["clear_source"]:
+            self._clear_source(target, options["batch_size"])
+
+        if options["drop_binary_index"]:
+            with connection.cursor() as cursor:
+                for column in COLUMNS.values():
+                    cursor.execute(
+                        f"DROP INDEX CONCURRENTLY IF EXISTS {binary_index_name(column)}"
+                    )
+            self.stdout.write("Dropped binary-quantised indexes.")
+
+        if options["binary_index"]:
+            self._build_binary_index(COLUMNS[target])
+
+    def _convert(self, target, batch_size):
+        """Copy embeddings missing from the target column, keeping the source"""
+        destination = COLUMNS[target]
+        source = _source_column(target)
+        cast = (
+            f"halfvec({EMBEDDING_DIMENSIONS})"
+            if target == "halfvec"
+            else f"vector({EMBEDDING_DIMENSIONS})"
+        )
+
+        converted = 0
+        started = time.perf_counter()
+        while True:
+            with transaction.atomic(), connection.cursor() as cursor:
+                cursor.execute(
+                    f"UPDATE {TABLE} SET {destination} = {source}::{cast} "
+                    f"WHERE id IN (SELECT id FROM {TABLE} "
+                    f"WHERE {source} IS NOT NULL AND {destination} IS NULL "
+                    f"LIMIT %s)",
+                    [batch_size],
+                )
+                count = cursor.rowcount
+            if not count:
+                break
+            converted += count
+            self.stdout.write(f"Converted {converted} chunks...")
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Converted {converted} chunks to {target} in "
+                f"{time.perf_counter() - started:.1f}s"
+            )
+        )
+
+    def _clear_source(self, target, batch_size):
+        """Clear the old column of rows whose embedding is in the target one"""
+        destination = COLUMNS[target]
+        source = _source_column(target)
+        cleared = 0
+        started = time.perf_counter()
+        while True:
+            with transaction.atomic(), connection.cursor() as cursor:
+                cursor.execute(
+                    f"UPDATE {TABLE} SET {source} = NULL "
+                    f"WHERE id IN (SELECT id FROM {TABLE} "
+                    f"WHERE {source} IS NOT NULL AND {destination} IS NOT NULL "
+                    f"LIMIT %s)",
+                    [batch_size],
+                )
+                count = cursor.rowcount
+            if not count:
+                break
+            cleared += count
+            self.stdout.write(f"Cleared {source} of {cleared} chunks...")
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Cleared {source} of {cleared} chunks in "
+                f"{time.perf_counter() - started:.1f}s"
+            )
+        )
+
+    def _build_binary_index(self, column):
+        name = binary_index_name(column)
+        started = time.perf_counter()
+        with connection.cursor() as cursor:
+            # CONCURRENTLY keeps the table writable while the graph is built
+            cursor.execute(
+                f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} ON {TABLE} "
+                f"USING hnsw ((binary_quantize({column})::bit({EMBEDDING_DIMENSIONS})) "
+                f"bit_hamming_ops) WITH (m = 16, ef_construction = 64)"
+            )
+            cursor.execute("SELECT pg_size_pretty(pg_relation_size(%s))", [name])
+            size = cursor.fetchone()[0]
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Built {name} ({size}) in {time.perf_counter() - started:.1f}s"
+            )
+        )
@@ -0,0 +1,223 @@
+"""
+Django management command to move chunk embeddings to a new embedding model.
+
+Drives the online migration of chat/reembedding.py: register a versioned
+embedding space, re-embed the existing chunks into it in the background
+(resumable, rate-limited), cut chats over once their chunks are covered, and
+report progress. Retrieval keeps using each chat's current space until its
+cutover, and --revert sends chats back.
+
+--index builds the space's partial HNSW index (PostgreSQL), which searches
+of chats with more chunks than VECTOR_MATRIX_MAX_CHUNKS use.
+
+Usage:
+    python manage.py reembed_chunks --create bge-small-v1 --model BAAI/bge-small-en-v1.5
+    python manage.py reembed_chunks --space bge-small-v1 --run --rate 100
+    python manage.py reembed_chunks --space bge-small-v1 --index
+    python manage.py reembed_chunks --space bge-small-v1 --cutover
+    python manage.py reembed_chunks --space bge-small-v1 --revert
+    python manage.py reembed_chunks --space bge-small-v1 --retire
+    python manage.py reembed_chunks --status
+"""
+
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Count
+
+from chat import reembedding
+from chat.config import (
+    DEFAULT_EMBEDDING_MODEL,
+    EMBEDDING_BACKEND,
+    REEMBED_BATCH_ROWS,
+    REEMBED_MAX_CHUNKS_PER_SECOND,
+)
+from chat.models import ChatVectorIndex, DocumentChunk, EmbeddingSpace
+
+TABLE = "chat_chunk_embeddings"
+
+
+def space_index_name(space):
+    return f"chat_chunk_space_{space.pk}_hnsw"
+
+
+class Command(BaseCommand):
+    help = "Re-embed chunks into a versioned embedding space and cut chats over"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--create", metavar="NAME", help="Register a new space")
+        parser.add_argument("--model", help="Embedding model of the new space")
+        parser.add_argument(
+            "--backend",
+            default=EMBEDDING_BACKEND,
+            help="Embedding backend of the new space (default: EMBEDDING_BACKEND)",
+        )
+        parser.add_argument("--space", metavar="NAME", help="Space to act on")
+        parser.add_argument(
+            "--run", action="store_true", help="Re-embed chunks missing from the space"
+        )
+        parser.add_argument("--batch-size", type=int, default=REEMBED_BATCH_ROWS)
+        parser.add_argument(
+            "--rate",
+            type=float,
+            default=REEMBED_MAX_CHUNKS_PER_SECOND,
+            help="Maximum chunks per second (0 = no limit)",
+        )
+        parser.add_argument(
+            "--max-batches", type=int, help="Stop after this many batches"
+        )
+        parser.add_argument(
+            "--index",
+            action="store_true",
+            help="Build the space's partial HNSW index (PostgreSQL)",
+        )
+        parser.add_argument(
+            "--cutover",
+            action="store_true",
+            help="Move chats whose chunks are all embedded to the space",
+        )
+        parser.add_argument(
+            "--chat",
+            action="append",
+            dest="chats",
+            help="Limit --cutover to this chat (repeatable)",
+        )
+        parser.add_argument(
+            "--revert",
+            action="store_true",
+            help="Move the space's chats back to the built-in embeddings",
+        )
+        parser.add_argument(
+            "--retire",
+            action="store_true",
+            help="Stop embedding new chunks into the space (no chat may use it)",
+        )
+        parser.add_argument("--status", action="store_true", help="Show progress")
+
+    def handle(self, *args, **options):
+        space = None
+        if options["create"]:
+            if not options["model"]:
+                raise CommandError("--create needs --model.")
+            if EmbeddingSpace.objects.filter(name=options["create"]).exists():
+                raise CommandError(f"Space {options['create']} already exists.")
+            space = reembedding.create_space(
+                options["create"], options["model"], options["backend"]
+            )
+            self.stdout.write(
+                self.style.SUCCESS(
+                    f"Created space {space.name}: {space.embedding_model} "
+                    f"({space.backend}, {space.dimensions} dimensions). New chunks "
+                    f"are now embedded into it as well."
+                )
+            )
+        elif options["space"]:
+            space = EmbeddingSpace.objects.filter(name=options["space"]).first()
+            if space is None:
+                raise CommandError(f"Unknown space: {options['space']}")
+
+        actions = ("run", "index", "cutover", "revert", "retire")
+        if any(options[action] for action in actions) and space is None:
+            raise CommandError("Name the space with --space (or --create).")
+
+        if options["run"]:
+            self._run(space, options)
+        if options["index"]:
+            self._build_index(space)
+        if options["cutover"]:
+            moved = reembedding.cut_over(space, options["chats"])
+            self.stdout.write(f"Cut {moved} chat(s) over to {space.name}.")
+        if options["revert"]:
+            moved = reembedding.revert(space, DEFAULT_EMBEDDING_MODEL)
+            self.stdout.write(f"Moved {moved} chat(s) back to the built-in embeddings.")
+        if options["retire"]:
+            if ChatVectorIndex.objects.filter(embedding_space=space).exists():
+                raise CommandError(
+                    f"Chats still use {space.name}; move them with --revert first."
+                )
+            space.status = "retired"
+            space.save(update_fields=["status", "updated_at"])
+            self.stdout.write(f"Retired {space.name}.")
+        if options["status"] or not (
+            options["create"] or any(options[action] for action in actions)
+        ):
+            self._status()
+
+    def _run(self, space, options):
+        if space.status == "retired":
+            raise CommandError(f"{space.name} is retired.")
+        started = time.perf_counter()
+
+        def report(space, embedded):
+            elapsed = time.perf_counter() - started
+            self.stdout.write(
+                f"{space.name}: +{embedded} chunks this run "
+                f"({embedded / elapsed:.1f} chunks/s), cursor {space.cursor}"
+            )
+
+        try:
+            embedded = reembedding.reembed(
+                space,
+                batch_rows=options["batch_size"],
+                max_rate=options["rate"],
+                max_batches=options["max_batches"],
+                on_progress=report,
+            )
+        except KeyboardInterrupt:
+            self.stdout.write(
+                self.style.WARNING("Interrupted; run again to resume from the cursor.")
+            )
+            return
+        space.refresh_from_db()
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Embedded {embedded} chunks in {time.perf_counter() - started:.1f}s; "
+                f"{space.name} is {space.status}."
+            )
+        )
+
+    def _build_index(self, space):
+        if connection.vendor != "postgresql":
+            raise CommandError("--index requires PostgreSQL with pgvector.")
+        name = space_index_name(space)
+        started = time.perf_counter()
+        with connection.cursor() as cursor:
+            # CONCURRENTLY keeps the table writable while the graph is built
+            cursor.execute(
+                f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} ON {TABLE} "
+                f"USING hnsw ((embedding::vector({space.dimensions})) "
+                f"vector_cosine_ops) WITH (m = 16, ef_construction = 64) "
+                f"WHERE space_id = {int(space.pk)}"
+            )
+            cursor.execute("SELECT pg_size_pretty(pg_relation_size(%s))", [name])
+            size = cursor.fetchone()[0]
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Built {name} ({size}) in {time.perf_counter() - started:.1f}s"
+            )
+        )
+
+    def _status(self):
+        total = DocumentChunk.objects.count()
+        chats = ChatVectorIndex.objects.count()
+        on_builtin = ChatVectorIndex.objects.filter(embedding_space=None).count()
+        self.stdout.write(
+            f"{total} chunks; {on_builtin}/{chats} chats on the built-in embeddings"
+        )
+        spaces = EmbeddingSpace.objects.annotate(
+            vectors=Count("chunk_embeddings", distinct=True),
+            chats=Count("chat_indexes", distinct=True),
+        ).order_by("created_at")
+        for space in spaces:
+            ready = (
+                reembedding.ready_indexes(space).count()
+                if space.status != "retired"
+                else 0
+            )
+            self.stdout.write(
+                f"{space.name:<20} {space.embedding_model} ({space.dimensions} dims) "
+                f"{space.status}: {space.vectors}/{total} chunks, "
+                f"{space.chats} chats cut over, {ready} ready to cut over"
+                + (f", last error: {space.last_error}" if space.last_error else "")
+            )
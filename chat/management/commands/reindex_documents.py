@@ -0,0 +1,116 @@
+"""
+Django management command to re-chunk and re-embed library documents.
+
+After CHUNK_SIZE, CHUNK_OVERLAP or the embedding model changes, indexed
+documents keep their old chunks: the upload path only indexes new or changed
+files. This command re-indexes every done document chunked or embedded with
+other settings than the current ones (all of them with --all). The text of
+files kept in the text store (chat/text_store.py) is read back from there, so
+those files are not parsed again; --stored-only skips the others.
+
+Each document is re-indexed on its own, so the command can be interrupted
+and re-run; documents already current are not selected again.
+
+Usage:
+    python manage.py reindex_documents
+    python manage.py reindex_documents --stored-only --limit 100
+    python manage.py reindex_documents --all
+"""
+
+import io
+import os
+import time
+from contextlib import redirect_stdout
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Q
+
+from chat import text_store
+from chat.models import UserDocument
+from chat.rag import chunking_key, get_rag_pipeline
+
+
+class Command(BaseCommand):
+    help = "Re-chunk and re-embed documents indexed with other settings"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--all",
+            action="store_true",
+            help="Re-index every indexed document, not only outdated ones",
+        )
+        parser.add_argument(
+            "--stored-only",
+            action="store_true",
+            help="Only documents whose text is stored, so no file is parsed",
+        )
+        parser.add_argument(
+            "--limit", type=int, help="Re-index at most this many documents"
+        )
+
+    def handle(self, *args, **options):
+        pipeline = get_rag_pipeline()
+        if pipeline.embeddings is None:
+            raise CommandError("No embedding backend available")
+
+        chunking = chunking_key()
+        documents = UserDocument.objects.filter(index_status="done").order_by("pk")
+        if not options["all"]:
+            documents = documents.filter(
+                ~Q(chunking=chunking)
+                | ~Q(embedding_model=pipeline.embedding_model_name)
+            )
+        self.stdout.write(
+            f"{documents.count()} document(s) to re-index with {chunking} and "
+            f"{pipeline.embedding_model_name}"
+        )
+
+        reindexed = from_store = skipped = failed = 0
+        started = time.perf_counter()
+        for document in documents.iterator():
+            if options["limit"] is not None and reindexed >= options["limit"]:
+                break
+            file_type = os.path.splitext(document.original_filename)[1][1:].lower()
+            stored = text_store.is_stored(document.content_hash, file_type)
+            if options["stored_only"] and not stored:
+                skipped += 1
+                continue
+
+            output = io.StringIO()
+            try:
+                with redirect_stdout(output):
+                    pipeline.build_index([document], incremental=False)
+            except Exception as e:
+                self.stderr.write(
+                    f"Could not re-index {document.original_filename} "
+                    f"({document.pk}): {e}"
+                )
+                failed += 1
+                continue
+            if options["verbosity"] > 1:
+                self.stdout.write(output.getvalue())
+
+            document.refresh_from_db(fields=["index_status", "chunks_total"])
+            if document.index_status != "done":
+                self.stderr.write(
+                    f"Re-indexing {document.original_filename} ({document.pk}) "
+                    f"failed; see its index error."
+                )
+                failed += 1
+                continue
+            reindexed += 1
+            from_store += stored
+            self.stdout.write(
+                f"Re-indexed {document.original_filename} ({document.pk}): "
+                f"{document.chunks_total} chunks"
+                + (" from stored text" if stored else "")
+            )
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Re-indexed {reindexed} document(s) in "
+                f"{time.perf_counter() - started:.1f}s ({from_store} from stored "
+                f"text, {reindexed - from_store} parsed); {skipped} without "
+                f"stored text skipped, {failed} failed."
+            )
+        )
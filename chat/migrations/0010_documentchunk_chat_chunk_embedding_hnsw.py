@@ -0,0 +1,51 @@
+# Generated by Django 5.2 on 2026-10-17 07:13
+
+from django.db import migrations
+
+import pgvector.django.indexes
+
+
+def create_hnsw_index(apps, schema_editor):
+    """Build the HNSW index concurrently, only for PostgreSQL databases"""
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        # CONCURRENTLY keeps chat_document_chunks writable while the graph is built
+        cursor.execute("""
+            CREATE INDEX CONCURRENTLY IF NOT EXISTS chat_chunk_embedding_hnsw
+            ON chat_document_chunks
+            USING hnsw (embedding vector_cosine_ops)
+            WITH (m = 16, ef_construction = 64);
+        """)
+
+
+def drop_hnsw_index(apps, schema_editor):
+    """Drop the HNSW index, only for PostgreSQL databases"""
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute("DROP INDEX CONCURRENTLY IF EXISTS chat_chunk_embedding_hnsw;")
+
+
+class Migration(migrations.Migration):
+
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction
+    atomic = False
+
+    dependencies = [
+        ('chat', '0009_chatvectorindex_documentchunk'),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            database_operations=[
+                migrations.RunPython(create_hnsw_index, drop_hnsw_index),
+            ],
+            state_operations=[
+                migrations.AddIndex(
+                    model_name='documentchunk',
+                    index=pgvector.django.indexes.HnswIndex(ef_construction=64, fields=['embedding'], m=16, name='chat_chunk_embedding_hnsw', opclasses=['vector_cosine_ops']),
+                ),
+            ],
+        ),
+    ]
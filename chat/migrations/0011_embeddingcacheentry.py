@@ -0,0 +1,30 @@
+# Generated by Django 5.2 on 2026-10-17 07:16
+
+import pgvector.django.vector
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0010_documentchunk_chat_chunk_embedding_hnsw'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EmbeddingCacheEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('embedding_model', models.CharField(max_length=100)),
+                ('text_hash', models.CharField(max_length=64)),
+                ('embedding', pgvector.django.vector.VectorField(dimensions=384)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('last_used_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'db_table': 'chat_embedding_cache',
+                'indexes': [models.Index(fields=['last_used_at'], name='chat_embedd_last_us_e11c42_idx')],
+                'unique_together': {('embedding_model', 'text_hash')},
+            },
+        ),
+    ]
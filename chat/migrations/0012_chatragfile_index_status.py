@@ -0,0 +1,70 @@
+# Generated by Django 5.2 on 2026-10-17 07:20
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def mark_existing_files_indexed(apps, schema_editor):
+    """Files uploaded before background indexing were indexed inline"""
+    ChatRAGFile = apps.get_model("chat", "ChatRAGFile")
+    for rag_file in ChatRAGFile.objects.annotate(n_chunks=Count("chunks")):
+        rag_file.index_status = "done"
+        rag_file.chunks_total = rag_file.n_chunks
+        rag_file.chunks_indexed = rag_file.n_chunks
+        rag_file.indexed_at = rag_file.uploaded_at
+        rag_file.save(
+            update_fields=[
+                "index_status",
+                "chunks_total",
+                "chunks_indexed",
+                "indexed_at",
+            ]
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("chat", "0011_embeddingcacheentry"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="chatragfile",
+            name="chunks_indexed",
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="chatragfile",
+            name="chunks_total",
+            field=models.IntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="chatragfile",
+            name="index_error",
+            field=models.TextField(blank=True),
+        ),
+        migrations.AddField(
+            model_name="chatragfile",
+            name="index_status",
+            field=models.CharField(
+                choices=[
+                    ("queued", "Queued"),
+                    ("extracting", "Extracting"),
+                    ("embedding", "Embedding"),
+                    ("done", "Done"),
+                    ("failed", "Failed"),
+                ],
+                default="queued",
+                max_length=20,
+            ),
+        ),
+        migrations.AddField(
+            model_name="chatragfile",
+            name="indexed_at",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.RunPython(
+            mark_existing_files_indexed, migrations.RunPython.noop
+        ),
+    ]
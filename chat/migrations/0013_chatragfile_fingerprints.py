@@ -0,0 +1,60 @@
+# Generated by Django 5.2 on 2026-10-17 07:39
+
+import hashlib
+
+from django.db import migrations, models
+
+
+def fingerprint_existing_files(apps, schema_editor):
+    """Hash files already on disk and record the model their chunks used"""
+    ChatRAGFile = apps.get_model("chat", "ChatRAGFile")
+    ChatVectorIndex = apps.get_model("chat", "ChatVectorIndex")
+    models_by_chat = dict(
+        ChatVectorIndex.objects.values_list("chat_id", "embedding_model")
+    )
+    for rag_file in ChatRAGFile.objects.all():
+        try:
+            digest = hashlib.sha256()
+            size = 0
+            with rag_file.file.open("rb") as fh:
+                for block in iter(lambda: fh.read(1024 * 1024), b""):
+                    digest.update(block)
+                    size += len(block)
+        except (OSError, ValueError):
+            continue  # Missing file; it will be fingerprinted if re-indexed
+        rag_file.content_hash = digest.hexdigest()
+        rag_file.file_size = size
+        if rag_file.index_status == "done":
+            rag_file.embedding_model = models_by_chat.get(rag_file.chat_id, "")
+        rag_file.save(update_fields=["content_hash", "file_size", "embedding_model"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("chat", "0012_chatragfile_index_status"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="chatragfile",
+            name="content_hash",
+            field=models.CharField(blank=True, db_index=True, max_length=64),
+        ),
+        migrations.AddField(
+            model_name="chatragfile",
+            name="embedding_model",
+            field=models.CharField(blank=True, max_length=100),
+        ),
+        migrations.AddField(
+            model_name="chatragfile",
+            name="file_size",
+            field=models.BigIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="chatragfile",
+            name="text_hash",
+            field=models.CharField(blank=True, max_length=64),
+        ),
+        migrations.RunPython(fingerprint_existing_files, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,84 @@
+# Generated by Django 5.2 on 2026-10-17 07:41
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.db import migrations
+
+
+def create_search_trigger(apps, schema_editor):
+    """Maintain search_vector with a trigger and backfill, PostgreSQL only"""
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute("""
+            CREATE TRIGGER chat_chunk_search_vector_update
+            BEFORE INSERT OR UPDATE OF content ON chat_document_chunks
+            FOR EACH ROW EXECUTE FUNCTION
+            tsvector_update_trigger(search_vector, 'pg_catalog.english', content);
+        """)
+        cursor.execute("""
+            UPDATE chat_document_chunks
+            SET search_vector = to_tsvector('pg_catalog.english', content)
+            WHERE search_vector IS NULL;
+        """)
+
+
+def drop_search_trigger(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(
+            "DROP TRIGGER IF EXISTS chat_chunk_search_vector_update ON chat_document_chunks;"
+        )
+
+
+def create_search_index(apps, schema_editor):
+    """Build the GIN index concurrently, only for PostgreSQL databases"""
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute("""
+            CREATE INDEX CONCURRENTLY IF NOT EXISTS chat_chunk_search_gin
+            ON chat_document_chunks USING gin (search_vector);
+        """)
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute("DROP INDEX CONCURRENTLY IF EXISTS chat_chunk_search_gin;")
+
+
+class Migration(migrations.Migration):
+
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction
+    atomic = False
+
+    dependencies = [
+        ("chat", "0013_chatragfile_fingerprints"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="documentchunk",
+            name="search_vector",
+            field=django.contrib.postgres.search.SearchVectorField(
+                editable=False, null=True
+            ),
+        ),
+        migrations.RunPython(create_search_trigger, drop_search_trigger),
+        migrations.SeparateDatabaseAndState(
+            database_operations=[
+                migrations.RunPython(create_search_index, drop_search_index),
+            ],
+            state_operations=[
+                migrations.AddIndex(
+                    model_name="documentchunk",
+                    index=django.contrib.postgres.indexes.GinIndex(
+                        fields=["search_vector"], name="chat_chunk_search_gin"
+                    ),
+                ),
+            ],
+        ),
+    ]
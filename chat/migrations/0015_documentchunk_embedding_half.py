@@ -0,0 +1,90 @@
+# Generated by Django 5.2 on 2026-10-17 07:45
+
+import pgvector.django.halfvec
+import pgvector.django.indexes
+import pgvector.django.vector
+from django.db import migrations
+
+
+def drop_embedding_not_null(apps, schema_editor):
+    """Rows stored as halfvec leave embedding empty"""
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(
+            "ALTER TABLE chat_document_chunks ALTER COLUMN embedding DROP NOT NULL;"
+        )
+
+
+def create_halfvec_index(apps, schema_editor):
+    """Build the halfvec HNSW index concurrently, only for PostgreSQL databases"""
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute("""
+            CREATE INDEX CONCURRENTLY IF NOT EXISTS chat_chunk_embedding_half_hnsw
+            ON chat_document_chunks
+            USING hnsw (embedding_half halfvec_cosine_ops)
+            WITH (m = 16, ef_construction = 64);
+        """)
+
+
+def drop_halfvec_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(
+            "DROP INDEX CONCURRENTLY IF EXISTS chat_chunk_embedding_half_hnsw;"
+        )
+
+
+class Migration(migrations.Migration):
+
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction
+    atomic = False
+
+    dependencies = [
+        ("chat", "0014_documentchunk_search_vector"),
+    ]
+
+    operations = [
+        # halfvec needs pgvector >= 0.7
+        migrations.AddField(
+            model_name="documentchunk",
+            name="embedding_half",
+            field=pgvector.django.halfvec.HalfVectorField(dimensions=384, null=True),
+        ),
+        # On SQLite an AlterField rebuilds the table together with its
+        # PostgreSQL-only indexes, so the constraint is only dropped on PostgreSQL
+        migrations.SeparateDatabaseAndState(
+            database_operations=[
+                migrations.RunPython(
+                    drop_embedding_not_null, migrations.RunPython.noop
+                ),
+            ],
+            state_operations=[
+                migrations.AlterField(
+                    model_name="documentchunk",
+                    name="embedding",
+                    field=pgvector.django.vector.VectorField(dimensions=384, null=True),
+                ),
+            ],
+        ),
+        migrations.SeparateDatabaseAndState(
+            database_operations=[
+                migrations.RunPython(create_halfvec_index, drop_halfvec_index),
+            ],
+            state_operations=[
+                migrations.AddIndex(
+                    model_name="documentchunk",
+                    index=pgvector.django.indexes.HnswIndex(
+                        ef_construction=64,
+                        fields=["embedding_half"],
+                        m=16,
+                        name="chat_chunk_embedding_half_hnsw",
+                        opclasses=["halfvec_cosine_ops"],
+                    ),
+                ),
+            ],
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.2 on 2026-10-17 08:20
+
+from django.db import migrations
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def recount_total_chunks(apps, schema_editor):
+    """total_chunks used to hold only the last indexing run's count"""
+    ChatVectorIndex = apps.get_model("chat", "ChatVectorIndex")
+    DocumentChunk = apps.get_model("chat", "DocumentChunk")
+    chunk_counts = (
+        DocumentChunk.objects.filter(chat_id=OuterRef("chat_id"))
+        .order_by()
+        .values("chat_id")
+        .annotate(count=Count("pk"))
+        .values("count")
+    )
+    ChatVectorIndex.objects.update(total_chunks=Coalesce(Subquery(chunk_counts), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("chat", "0015_documentchunk_embedding_half"),
+    ]
+
+    operations = [
+        migrations.RunPython(recount_total_chunks, migrations.RunPython.noop),
+    ]
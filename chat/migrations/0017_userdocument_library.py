@@ -0,0 +1,128 @@
+# Generated by Django 5.2 on 2026-10-17 08:40
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+import chat.models
+
+
+def move_files_to_library(apps, schema_editor):
+    """One library document per existing RAG file, owning that file's chunks"""
+    ChatRAGFile = apps.get_model("chat", "ChatRAGFile")
+    UserDocument = apps.get_model("chat", "UserDocument")
+    DocumentChunk = apps.get_model("chat", "DocumentChunk")
+    for rag_file in ChatRAGFile.objects.all().iterator():
+        document = UserDocument.objects.create(
+            user_id=rag_file.user_id,
+            file=rag_file.file.name,
+            original_filename=rag_file.original_filename,
+            index_status=rag_file.index_status,
+            chunks_total=rag_file.chunks_total,
+            chunks_indexed=rag_file.chunks_indexed,
+            index_error=rag_file.index_error,
+            indexed_at=rag_file.indexed_at,
+            content_hash=rag_file.content_hash,
+            file_size=rag_file.file_size,
+            text_hash=rag_file.text_hash,
+            embedding_model=rag_file.embedding_model,
+        )
+        # auto_now_add ignores the value passed to create()
+        UserDocument.objects.filter(pk=document.pk).update(
+            uploaded_at=rag_file.uploaded_at
+        )
+        ChatRAGFile.objects.filter(pk=rag_file.pk).update(document=document)
+        DocumentChunk.objects.filter(rag_file_id=rag_file.pk).update(document=document)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("chat", "0016_recount_chatvectorindex_total_chunks"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="UserDocument",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "file",
+                    models.FileField(upload_to=chat.models.user_document_upload_path),
+                ),
+                ("original_filename", models.CharField(max_length=255)),
+                ("uploaded_at", models.DateTimeField(auto_now_add=True)),
+                (
+                    "index_status",
+                    models.CharField(
+                        choices=[
+                            ("queued", "Queued"),
+                            ("extracting", "Extracting"),
+                            ("embedding", "Embedding"),
+                            ("done", "Done"),
+                            ("failed", "Failed"),
+                        ],
+                        default="queued",
+                        max_length=20,
+                    ),
+                ),
+                ("chunks_total", models.IntegerField(blank=True, null=True)),
+                ("chunks_indexed", models.IntegerField(default=0)),
+                ("index_error", models.TextField(blank=True)),
+                ("indexed_at", models.DateTimeField(blank=True, null=True)),
+                (
+                    "content_hash",
+                    models.CharField(blank=True, db_index=True, max_length=64),
+                ),
+                ("file_size", models.BigIntegerField(blank=True, null=True)),
+                ("text_hash", models.CharField(blank=True, max_length=64)),
+                ("embedding_model", models.CharField(blank=True, max_length=100)),
+                (
+                    "user",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="documents",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "User Document",
+                "verbose_name_plural": "User Documents",
+                "ordering": ["-uploaded_at"],
+            },
+        ),
+        migrations.AddField(
+            model_name="chatragfile",
+            name="document",
+            field=models.ForeignKey(
+                null=True,
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="attachments",
+                to="chat.userdocument",
+            ),
+        ),
+        migrations.AddField(
+            model_name="documentchunk",
+            name="document",
+            field=models.ForeignKey(
+                null=True,
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="chunks",
+                to="chat.userdocument",
+            ),
+        ),
+        # Nothing to undo: the RAG files keep their own file and status columns
+        # in this migration, and reversing the operations above drops the
+        # document links and the UserDocument table
+        migrations.RunPython(move_files_to_library, migrations.RunPython.noop),
+    ]
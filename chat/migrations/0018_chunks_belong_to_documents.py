@@ -0,0 +1,95 @@
+# Generated by Django 5.2 on 2026-10-17 08:41
+
+import django.contrib.postgres.indexes
+import django.db.models.deletion
+import pgvector.django.indexes
+from django.db import migrations, models
+
+# The PostgreSQL-only indexes of DocumentChunk. SQLite rebuilds the table to
+# drop or alter a foreign key and would try to create them, so they are taken
+# out of the migration state around those operations. The indexes themselves
+# are never touched.
+POSTGRES_ONLY_INDEXES = [
+    pgvector.django.indexes.HnswIndex(
+        ef_construction=64,
+        fields=["embedding"],
+        m=16,
+        name="chat_chunk_embedding_hnsw",
+        opclasses=["vector_cosine_ops"],
+    ),
+    pgvector.django.indexes.HnswIndex(
+        ef_construction=64,
+        fields=["embedding_half"],
+        m=16,
+        name="chat_chunk_embedding_half_hnsw",
+        opclasses=["halfvec_cosine_ops"],
+    ),
+    django.contrib.postgres.indexes.GinIndex(
+        fields=["search_vector"], name="chat_chunk_search_gin"
+    ),
+]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("chat", "0017_userdocument_library"),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.RemoveIndex(model_name="documentchunk", name=index.name)
+                for index in POSTGRES_ONLY_INDEXES
+            ],
+        ),
+        migrations.RemoveField(model_name="chatragfile", name="file"),
+        migrations.RemoveField(model_name="chatragfile", name="index_status"),
+        migrations.RemoveField(model_name="chatragfile", name="chunks_total"),
+        migrations.RemoveField(model_name="chatragfile", name="chunks_indexed"),
+        migrations.RemoveField(model_name="chatragfile", name="index_error"),
+        migrations.RemoveField(model_name="chatragfile", name="indexed_at"),
+        migrations.RemoveField(model_name="chatragfile", name="content_hash"),
+        migrations.RemoveField(model_name="chatragfile", name="file_size"),
+        migrations.RemoveField(model_name="chatragfile", name="text_hash"),
+        migrations.RemoveField(model_name="chatragfile", name="embedding_model"),
+        migrations.AlterField(
+            model_name="chatragfile",
+            name="document",
+            field=models.ForeignKey(
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="attachments",
+                to="chat.userdocument",
+            ),
+        ),
+        migrations.RemoveIndex(
+            model_name="documentchunk", name="chat_docume_chat_id_7655a4_idx"
+        ),
+        migrations.RemoveIndex(
+            model_name="documentchunk", name="chat_docume_rag_fil_46f24c_idx"
+        ),
+        migrations.RemoveField(model_name="documentchunk", name="chat"),
+        migrations.RemoveField(model_name="documentchunk", name="rag_file"),
+        migrations.AlterField(
+            model_name="documentchunk",
+            name="document",
+            field=models.ForeignKey(
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="chunks",
+                to="chat.userdocument",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="documentchunk",
+            index=models.Index(
+                fields=["document", "chunk_index"],
+                name="chat_docume_documen_dc5a67_idx",
+            ),
+        ),
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.AddIndex(model_name="documentchunk", index=index)
+                for index in POSTGRES_ONLY_INDEXES
+            ],
+        ),
+    ]
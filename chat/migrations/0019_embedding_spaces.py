@@ -0,0 +1,99 @@
+# Generated by Django 5.2 on 2026-10-17 09:30
+
+import django.db.models.deletion
+import pgvector.django.vector
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("chat", "0018_chunks_belong_to_documents"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="EmbeddingSpace",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("name", models.CharField(max_length=100, unique=True)),
+                ("embedding_model", models.CharField(max_length=100)),
+                ("backend", models.CharField(max_length=20)),
+                ("dimensions", models.PositiveIntegerField()),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[
+                            ("building", "Building"),
+                            ("ready", "Ready"),
+                            ("retired", "Retired"),
+                        ],
+                        default="building",
+                        max_length=20,
+                    ),
+                ),
+                ("cursor", models.UUIDField(blank=True, null=True)),
+                ("chunks_embedded", models.BigIntegerField(default=0)),
+                ("last_error", models.TextField(blank=True)),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                "db_table": "chat_embedding_spaces",
+            },
+        ),
+        migrations.AddField(
+            model_name="chatvectorindex",
+            name="embedding_space",
+            field=models.ForeignKey(
+                blank=True,
+                null=True,
+                on_delete=django.db.models.deletion.SET_NULL,
+                related_name="chat_indexes",
+                to="chat.embeddingspace",
+            ),
+        ),
+        migrations.CreateModel(
+            name="ChunkEmbedding",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("embedding", pgvector.django.vector.VectorField()),
+                (
+                    "chunk",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="space_embeddings",
+                        to="chat.documentchunk",
+                    ),
+                ),
+                (
+                    "space",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="chunk_embeddings",
+                        to="chat.embeddingspace",
+                    ),
+                ),
+            ],
+            options={
+                "db_table": "chat_chunk_embeddings",
+                "unique_together": {("space", "chunk")},
+            },
+        ),
+    ]
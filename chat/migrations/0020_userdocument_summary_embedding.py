@@ -0,0 +1,53 @@
+# Generated by Django 5.2 on 2026-10-17 10:15
+
+from django.db import migrations
+
+import numpy as np
+import pgvector.django.vector
+
+
+def _as_array(value):
+    if hasattr(value, "to_numpy"):
+        value = value.to_numpy()
+    return np.asarray(value, dtype=np.float32)
+
+
+def summarise_indexed_documents(apps, schema_editor):
+    """Summary embedding (normalised mean of unit chunk vectors) per document"""
+    UserDocument = apps.get_model("chat", "UserDocument")
+    DocumentChunk = apps.get_model("chat", "DocumentChunk")
+    for document_id in UserDocument.objects.values_list("pk", flat=True).iterator():
+        total = None
+        rows = DocumentChunk.objects.filter(document_id=document_id).values_list(
+            "embedding", "embedding_half"
+        )
+        for embedding, embedding_half in rows.iterator():
+            vector = embedding if embedding is not None else embedding_half
+            if vector is None:
+                continue
+            vector = _as_array(vector)
+            norm = np.linalg.norm(vector)
+            if norm:
+                total = vector / norm if total is None else total + vector / norm
+        if total is not None and np.linalg.norm(total):
+            UserDocument.objects.filter(pk=document_id).update(
+                summary_embedding=(total / np.linalg.norm(total)).tolist()
+            )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("chat", "0019_embedding_spaces"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="userdocument",
+            name="summary_embedding",
+            field=pgvector.django.vector.VectorField(
+                blank=True, dimensions=384, null=True
+            ),
+        ),
+        migrations.RunPython(summarise_indexed_documents, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.2 on 2026-10-17 11:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("chat", "0020_userdocument_summary_embedding"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ExtractedText",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("content_hash", models.CharField(max_length=64)),
+                ("file_type", models.CharField(max_length=10)),
+                ("extractor", models.CharField(max_length=100)),
+                ("data", models.BinaryField()),
+                ("pages", models.PositiveIntegerField()),
+                ("text_chars", models.BigIntegerField()),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                "db_table": "chat_extracted_texts",
+                "unique_together": {("content_hash", "file_type", "extractor")},
+            },
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2 on 2026-10-17 11:30
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("chat", "0021_extracted_text"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="userdocument",
+            name="index_updated_at",
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.2 on 2026-10-17 12:15
+
+from django.db import migrations
+
+
+def drop_unattributed_entries(apps, schema_editor):
+    """Entries were keyed by model name only, so their backend is unknown.
+
+    Vectors of the Inference API, the quantised local model and the hashing
+    backend were all cached under the same name; they are re-embedded (and
+    cached under model@backend) the next time their chunks are indexed.
+    """
+    EmbeddingCacheEntry = apps.get_model("chat", "EmbeddingCacheEntry")
+    EmbeddingCacheEntry.objects.exclude(embedding_model__contains="@").delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("chat", "0022_userdocument_index_updated_at"),
+    ]
+
+    operations = [
+        migrations.RunPython(drop_unattributed_entries, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2 on 2026-10-17 12:45
+
+from django.db import migrations, models
+
+
+def record_current_chunking(apps, schema_editor):
+    """Indexed documents were chunked with the settings configured now.
+
+    Without this every document would count as chunked differently and be
+    re-indexed by reindex_documents.
+    """
+    from chat.config import CHUNK_OVERLAP, CHUNK_SIZE
+
+    UserDocument = apps.get_model("chat", "UserDocument")
+    UserDocument.objects.filter(index_status="done").update(
+        chunking=f"recursive-{CHUNK_SIZE}-{CHUNK_OVERLAP}"
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("chat", "0023_embedding_cache_backend_namespace"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="userdocument",
+            name="chunking",
+            field=models.CharField(blank=True, max_length=50),
+        ),
+        migrations.RunPython(record_current_chunking, migrations.RunPython.noop),
+    ]
@@ -1,12 +1,18 @@
 import uuid
 
 from django.conf import settings
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
 from django.db import models
+from django.utils import timezone
 
-from pgvector.django import VectorField
+from pgvector import HalfVector
+from pgvector.django import HalfVectorField, HnswIndex, VectorField
 
 from users.models import CustomUser
 
+from .config import VECTOR_STORAGE
+
 
 class Chat(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
@@ -100,20 +106,92 @@ class Message(models.Model):
         )
 
 
-# Helper function to define upload path for RAG files
+# Helper function to define upload path for RAG files (uploads made before
+# the document library; kept for the migrations that reference it)
 def rag_file_upload_path(instance, filename):
     # file will be uploaded to MEDIA_ROOT/rag_files/user_<id>/chat_<id>/<sanitized_filename>
     # Consider adding filename sanitization here if needed
     return f"rag_files/user_{instance.user.id}/chat_{instance.chat.id}/{filename}"
 
 
+def user_document_upload_path(instance, filename):
+    # file will be uploaded to MEDIA_ROOT/documents/user_<id>/<filename>
+    return f"documents/user_{instance.user.id}/{filename}"
+
+
+class UserDocument(models.Model):
+    """A file in a user's document library.
+
+    It is stored, extracted and embedded once; chats use it by reference
+    through ChatRAGFile attachments and share its chunks.
+    """
+
+    user = models.ForeignKey(
+        CustomUser, on_delete=models.CASCADE, related_name="documents"
+    )
+    file = models.FileField(upload_to=user_document_upload_path)
+    original_filename = models.CharField(max_length=255)
+    uploaded_at = models.DateTimeField(auto_now_add=True)
+
+    # Background indexing state (see chat/indexing.py)
+    index_status = models.CharField(
+        max_length=20,
+        default="queued",
+        choices=[
+            ("queued", "Queued"),
+            ("extracting", "Extracting"),
+            ("embedding", "Embedding"),
+            ("done", "Done"),
+            ("failed", "Failed"),
+        ],
+    )
+    chunks_total = models.IntegerField(null=True, blank=True)
+    chunks_indexed = models.IntegerField(default=0)
+    index_error = models.TextField(blank=True)
+    indexed_at = models.DateTimeField(null=True, blank=True)
+    # Moves with every status change and stored batch; indexing that stops
+    # moving is picked up again (IndexingWorker.requeue_stale)
+    index_updated_at = models.DateTimeField(default=timezone.now)
+
+    # Fingerprints used to skip re-indexing unchanged files and to find an
+    # uploaded file that is already in the library
+    content_hash = models.CharField(max_length=64, blank=True, db_index=True)
+    file_size = models.BigIntegerField(null=True, blank=True)
+    text_hash = models.CharField(max_length=64, blank=True)
+    embedding_model = models.CharField(max_length=100, blank=True)
+    # Splitter settings the chunks were cut with (see chunking_key in chat/rag.py)
+    chunking = models.CharField(max_length=50, blank=True)
+
+    # Normalised mean of the chunk embeddings, used to route queries to the
+    # most relevant documents of a chat (see chat/routing.py)
+    summary_embedding = VectorField(dimensions=384, null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.original_filename} (User: {self.user.username})"
+
+    class Meta:
+        ordering = ["-uploaded_at"]
+        verbose_name = "User Document"
+        verbose_name_plural = "User Documents"
+
+    def delete(self, *args, **kwargs):
+        # Also delete the actual file from storage when the model instance is deleted
+        if self.file:
+            # save=False to prevent saving the model again after file deletion
+            self.file.delete(save=False)
+        super().delete(*args, **kwargs)
+
+
 class ChatRAGFile(models.Model):
+    """A library document attached to a chat's RAG context"""
+
     chat = models.ForeignKey(Chat, on_delete=models.CASCADE, related_name="rag_files")
     user = models.ForeignKey(CustomUser, on_delete=models.CASCADE)
-    file = models.FileField(upload_to=rag_file_upload_path)
+    document = models.ForeignKey(
+        UserDocument, on_delete=models.CASCADE, related_name="attachments"
+    )
     original_filename = models.CharField(max_length=255)
     uploaded_at = models.DateTimeField(auto_now_add=True)
-    # indexed_at = models.DateTimeField(null=True, blank=True) # Consider adding later
 
     def __str__(self):
         return f"{self.original_filename} for Chat {self.chat.id} (User: {self.user.username})"
@@ -125,18 +203,11 @@ class ChatRAGFile(models.Model):
         verbose_name_plural = "Chat RAG Files"
 
     def save(self, *args, **kwargs):
-        # Ensure original_filename is set if not provided (e.g. from file.name)
-        if not self.original_filename and self.file:
-            self.original_filename = self.file.name
+        # Ensure original_filename is set if not provided (e.g. from the document)
+        if not self.original_filename and self.document_id:
+            self.original_filename = self.document.original_filename
         super().save(*args, **kwargs)
 
-    def delete(self, *args, **kwargs):
-        # Also delete the actual file from storage when the model instance is deleted
-        if self.file:
-            # save=False to prevent saving the model again after file deletion
-            self.file.delete(save=False)
-        super().delete(*args, **kwargs)
-
 
 class ChatFlashcard(models.Model):
     """Store flashcards for each chat"""
@@ -199,32 +270,135 @@ class DocumentChunk(models.Model):
     """Store document chunks with their vector embeddings"""
 
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
-    chat = models.ForeignKey(
-        Chat, on_delete=models.CASCADE, related_name="document_chunks"
-    )
-    rag_file = models.ForeignKey(
-        ChatRAGFile, on_delete=models.CASCADE, related_name="chunks"
+    # Chunks belong to the library document and are shared by every chat it
+    # is attached to (see for_chat)
+    document = models.ForeignKey(
+        UserDocument, on_delete=models.CASCADE, related_name="chunks"
     )
 
     # Text content
     content = models.TextField()
     chunk_index = models.IntegerField()
 
-    # Vector embedding (384 dimensions for all-MiniLM-L6-v2)
-    embedding = VectorField(dimensions=384)
+    # Vector embedding (384 dimensions for all-MiniLM-L6-v2). Only one of the
+    # two columns is filled, depending on config.VECTOR_STORAGE: float32 in
+    # embedding, or float16 in embedding_half (half the table and index size).
+    embedding = VectorField(dimensions=384, null=True)
+    embedding_half = HalfVectorField(dimensions=384, null=True)
+
+    # Full-text search vector of content, maintained by a PostgreSQL trigger
+    # (see migration 0014). Always NULL on other databases.
+    search_vector = SearchVectorField(null=True, editable=False)
 
     # Metadata
     metadata = models.JSONField(default=dict)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    @classmethod
+    def for_chat(cls, chat_id):
+        """Chunks of the documents attached to a chat"""
+        return cls.objects.filter(
+            document_id__in=ChatRAGFile.objects.filter(chat_id=chat_id).values(
+                "document_id"
+            )
+        )
+
+    @staticmethod
+    def vector_column():
+        """Name of the column new embeddings are written to and searched in"""
+        return "embedding_half" if VECTOR_STORAGE == "halfvec" else "embedding"
+
+    @property
+    def vector(self):
+        """The stored embedding as a NumPy array, whichever column holds it"""
+        if self.embedding is not None:
+            return self.embedding
+        if isinstance(self.embedding_half, HalfVector):
+            return self.embedding_half.to_numpy()
+        return self.embedding_half
+
     class Meta:
         db_table = "chat_document_chunks"
         indexes = [
-            models.Index(fields=["chat", "chunk_index"]),
-            models.Index(fields=["rag_file"]),
+            models.Index(fields=["document", "chunk_index"]),
+            # Approximate nearest neighbour index for cosine similarity search.
+            # Created concurrently and only on PostgreSQL, see migration 0010.
+            HnswIndex(
+                name="chat_chunk_embedding_hnsw",
+                fields=["embedding"],
+                m=16,
+                ef_construction=64,
+                opclasses=["vector_cosine_ops"],
+            ),
+            HnswIndex(
+                name="chat_chunk_embedding_half_hnsw",
+                fields=["embedding_half"],
+                m=16,
+                ef_construction=64,
+                opclasses=["halfvec_cosine_ops"],
+            ),
+            # Lexical search for hybrid retrieval; PostgreSQL only, migration 0014
+            GinIndex(name="chat_chunk_search_gin", fields=["search_vector"]),
         ]
 
 
+class EmbeddingSpace(models.Model):
+    """A versioned embedding model and the vectors it produced.
+
+    Vectors of different spaces are never compared. The embedding columns of
+    DocumentChunk hold the configured model's vectors; any other space keeps
+    its vectors in ChunkEmbedding, and a chat searches it once it has been
+    cut over (ChatVectorIndex.embedding_space). See chat/reembedding.py.
+    """
+
+    name = models.CharField(max_length=100, unique=True)
+    embedding_model = models.CharField(max_length=100)
+    backend = models.CharField(max_length=20)
+    dimensions = models.PositiveIntegerField()
+    status = models.CharField(
+        max_length=20,
+        default="building",
+        choices=[
+            ("building", "Building"),
+            ("ready", "Ready"),
+            ("retired", "Retired"),
+        ],
+    )
+
+    # Re-embedding progress: the job walks DocumentChunk in primary-key order
+    # and saves the last key it finished, so it resumes where it stopped
+    cursor = models.UUIDField(null=True, blank=True)
+    chunks_embedded = models.BigIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.name} ({self.embedding_model}, {self.dimensions} dims)"
+
+    class Meta:
+        db_table = "chat_embedding_spaces"
+
+
+class ChunkEmbedding(models.Model):
+    """A chunk's vector in an embedding space other than the built-in columns"""
+
+    chunk = models.ForeignKey(
+        DocumentChunk, on_delete=models.CASCADE, related_name="space_embeddings"
+    )
+    space = models.ForeignKey(
+        EmbeddingSpace, on_delete=models.CASCADE, related_name="chunk_embeddings"
+    )
+    # No fixed dimensions: each space has its own. Searches cast the column to
+    # vector(space.dimensions), which is what the per-space HNSW index covers
+    # (see the reembed_chunks command).
+    embedding = VectorField()
+
+    class Meta:
+        db_table = "chat_chunk_embeddings"
+        unique_together = [["space", "chunk"]]
+
+
 class ChatVectorIndex(models.Model):
     """Track vector index status for chats"""
 
@@ -234,6 +408,52 @@ class ChatVectorIndex(models.Model):
     total_chunks = models.IntegerField(default=0)
     last_updated = models.DateTimeField(auto_now=True)
     embedding_model = models.CharField(max_length=100, default="all-MiniLM-L6-v2")
+    # The space the chat is searched in; NULL means the built-in columns of
+    # DocumentChunk. Moved only by a cutover, once every chunk of the chat
+    # has a vector in the new space.
+    embedding_space = models.ForeignKey(
+        EmbeddingSpace,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name="chat_indexes",
+    )
 
     class Meta:
         db_table = "chat_vector_index"
+
+
+class ExtractedText(models.Model):
+    """Extracted text of a file, keyed by content hash (see chat/text_store.py)"""
+
+    # SHA-256 hex digest of the file (UserDocument.content_hash)
+    content_hash = models.CharField(max_length=64)
+    file_type = models.CharField(max_length=10)
+    # Identifies the extractor and its settings; text from another is not used
+    extractor = models.CharField(max_length=100)
+    # zlib stream of one JSON [page, text] line per page
+    data = models.BinaryField()
+    pages = models.PositiveIntegerField()
+    text_chars = models.BigIntegerField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        db_table = "chat_extracted_texts"
+        unique_together = [["content_hash", "file_type", "extractor"]]
+
+
+class EmbeddingCacheEntry(models.Model):
+    """Persistent cache of chunk embeddings keyed by model and content hash"""
+
+    # Model, backend and variant (see cache_namespace in chat/embeddings.py)
+    embedding_model = models.CharField(max_length=100)
+    # SHA-256 hex digest of the normalised chunk text
+    text_hash = models.CharField(max_length=64)
+    embedding = VectorField(dimensions=384)
+    created_at = models.DateTimeField(auto_now_add=True)
+    last_used_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        db_table = "chat_embedding_cache"
+        unique_together = [["embedding_model", "text_hash"]]
+        indexes = [models.Index(fields=["last_used_at"])]
@@ -0,0 +1,239 @@
+# chat/query_condensation.py
+"""
+Building the retrieval query for a chat turn.
+
+Prepending the whole conversation to the question makes the embedding input
+grow with every turn until the model truncates it, and lets old topics
+outweigh the question. condense_query keeps the question and adds only the
+most salient keyphrases of the last few messages, within a token cap.
+Keyphrases are scored locally with RAKE (word co-occurrence degree over
+frequency), weighted towards recent messages.
+
+With RAG_QUERY_REWRITE, an LLM rewrites the question into a standalone one
+instead. Rewrites are cached, and the condensed query is used whenever the
+rewrite fails.
+"""
+
+import logging
+import re
+from typing import Dict, List, Optional
+
+from django.core.cache import cache
+
+from groq import Groq
+
+from .config import (
+    RAG_QUERY_HISTORY_TURNS,
+    RAG_QUERY_KEYPHRASES,
+    RAG_QUERY_REWRITE,
+    RAG_QUERY_REWRITE_CACHE_TTL,
+    RAG_QUERY_REWRITE_MODEL,
+    RAG_QUERY_REWRITE_TIMEOUT,
+    RAG_QUERY_TOKEN_CAP,
+)
+from .context_packing import estimate_tokens
+from .embedding_cache import text_hash
+
+logger = logging.getLogger(__name__)
+
+STOP_WORDS = frozenset(
+    (
+        "a about above after again against all also am an and any are as at be "
+        "because been before being below between both but by can could did do "
+        "does doing down during each else ever few for from further get got had "
+        "has have having he her here hers him his how however i if in into is it "
+        "its itself just know let like make me might more most much must my no "
+        "nor not now of off on once one only or other our ours out over own "
+        "please really said same say see she should so some such tell than thank "
+        "thanks that the their theirs them then there these they thing things "
+        "think this those through to too under until up us use used using very "
+        "want was way we well were what when where which while who whom why will "
+        "with would yes yet you your yours"
+    ).split()
+)
+
+MAX_PHRASE_WORDS = 3
+
+_WORD_RE = re.compile(r"[\w'-]+")
+_PHRASE_BREAK_RE = re.compile(r"[.,;:!?()\[\]{}\"\n\r\t]+")
+
+REWRITE_PROMPT = (
+    "Rewrite the user's last question as a single standalone search query for "
+    "their documents. Resolve pronouns and references using the conversation. "
+    "Reply with the query only."
+)
+
+
+def _candidate_phrases(text: str) -> List[List[str]]:
+    """Runs of content words between stop words and punctuation"""
+    phrases = []
+    for fragment in _PHRASE_BREAK_RE.split(text.lower()):
+        phrase = []
+        for word in _WORD_RE.findall(fragment):
+            word = word.strip("'-")
+            if word in STOP_WORDS or (len(word) < 3 and not word.isdigit()):
+                if phrase:
+                    phrases.append(phrase)
+                phrase = []
+            else:
+                phrase.append(word)
+        if phrase:
+            phrases.append(phrase)
+    # Long runs are usually lists or code, not phrases; keep their head
+    return [phrase[:MAX_PHRASE_WORDS] for phrase in phrases]
+
+
+def _rake_scores(text: str) -> Dict[str, float]:
+    phrases = _candidate_phrases(text)
+    frequency: Dict[str, int] = {}
+    degree: Dict[str, int] = {}
+    for phrase in phrases:
+        for word in phrase:
+            frequency[word] = frequency.get(word, 0) + 1
+            degree[word] = degree.get(word, 0) + len(phrase)
+
+    scores = {}
+    for phrase in phrases:
+        key = " ".join(phrase)
+        scores[key] = sum(degree[word] / frequency[word] for word in phrase)
+    return scores
+
+
+def extract_keyphrases(
+    texts: List[str],
+    max_phrases: int = RAG_QUERY_KEYPHRASES,
+    exclude: str = "",
+) -> List[str]:
+    """Top keyphrases of texts, given most recent first.
+
+    A phrase's score in the i-th text is divided by i + 1, and the best score
+    over all texts is kept. Phrases whose words all appear in exclude (the
+    question itself) are skipped.
+    """
+    excluded = set(_WORD_RE.findall(exclude.lower()))
+    best: Dict[str, float] = {}
+    for age, text in enumerate(texts):
+        for phrase, score in _rake_scores(text).items():
+            if set(phrase.split()) <= excluded:
+                continue
+            best[phrase] = max(best.get(phrase, 0.0), score / (age + 1))
+    return sorted(best, key=best.get, reverse=True)[:max_phrases]
+
+
+def _recent_turns(history: List[Dict], max_turns: int) -> List[str]:
+    """Contents of the last max_turns user/assistant messages, newest first"""
+    turns = [
+        message["content"]
+        for message in history
+        if message.get("role") in ("user", "assistant") and message.get("content")
+    ]
+    return list(reversed(turns[-max_turns:])) if max_turns > 0 else []
+
+
+def _cap_words(text: str, token_cap: int) -> str:
+    """Last words of text that fit token_cap (questions usually come last)"""
+    words = text.split()
+    while words and estimate_tokens(" ".join(words)) > token_cap:
+        words = words[max(1, len(words) // 10) :]
+    return " ".join(words)
+
+
+def condense_query(
+    query: str,
+    history: List[Dict],
+    max_turns: int = RAG_QUERY_HISTORY_TURNS,
+    token_cap: int = RAG_QUERY_TOKEN_CAP,
+    max_keyphrases: int = RAG_QUERY_KEYPHRASES,
+) -> str:
+    """The question followed by keyphrases of recent turns, within token_cap"""
+    question = _cap_words(query, token_cap)
+    phrases = extract_keyphrases(
+        _recent_turns(history, max_turns), max_keyphrases, exclude=question
+    )
+
+    kept = []
+    for phrase in phrases:
+        candidate = "; ".join(kept + [phrase])
+        if estimate_tokens(f"{question}\n{candidate}") > token_cap:
+            break
+        kept.append(phrase)
+    return f"{question}\n{'; '.join(kept)}" if kept else question
+
+
+class QueryRewriter:
+    """Standalone search queries written by an LLM, cached per conversation tail"""
+
+    def __init__(
+        self,
+        model: str = RAG_QUERY_REWRITE_MODEL,
+        timeout: float = RAG_QUERY_REWRITE_TIMEOUT,
+        ttl: int = RAG_QUERY_REWRITE_CACHE_TTL,
+    ):
+        self.model = model
+        self.timeout = timeout
+        self.ttl = ttl
+        self._client = None
+
+    def rewrite(
+        self,
+        query: str,
+        history: List[Dict],
+        max_turns: int = RAG_QUERY_HISTORY_TURNS,
+        token_cap: int = RAG_QUERY_TOKEN_CAP,
+    ) -> Optional[str]:
+        """Rewritten query, or None if the LLM call fails"""
+        turns = list(reversed(_recent_turns(history, max_turns)))
+        conversation = "\n".join(_cap_words(turn, token_cap) for turn in turns)
+        key = f"rag_query_rewrite:{self.model}:{text_hash(conversation + query)}"
+
+        try:
+            rewritten = cache.get(key)
+        except Exception as e:
+            logger.warning(f"Query rewrite cache unavailable: {e}")
+            rewritten = None
+        if rewritten:
+            return rewritten
+
+        try:
+            if self._client is None:
+                self._client = Groq(timeout=self.timeout)
+            completion = self._client.chat.completions.create(
+                model=self.model,
+                messages=[
+                    {"role": "system", "content": REWRITE_PROMPT},
+                    {
+                        "role": "user",
+                        "content": f"Conversation:\n{conversation}\n\n"
+                        f"Question: {query}",
+                    },
+                ],
+                temperature=0,
+                max_tokens=256,
+            )
+            rewritten = (completion.choices[0].message.content or "").strip()
+        except Exception as e:
+            logger.warning(f"Query rewrite failed, using condensed query: {e}")
+            return None
+        if not rewritten:
+            return None
+
+        rewritten = _cap_words(rewritten, token_cap)
+        try:
+            cache.set(key, rewritten, timeout=self.ttl)
+        except Exception as e:
+            logger.warning(f"Query rewrite cache unavailable: {e}")
+        return rewritten
+
+
+query_rewriter = QueryRewriter()
+
+
+def build_retrieval_query(
+    query: str, history: List[Dict], rewrite: bool = RAG_QUERY_REWRITE
+) -> str:
+    """Retrieval query for a chat turn: LLM rewrite if enabled, else condensed"""
+    if rewrite:
+        rewritten = query_rewriter.rewrite(query, history)
+        if rewritten:
+            return rewritten
+    return condense_query(query, history)
@@ -1,25 +1,199 @@
+import hashlib
 import os
+import re
+import threading
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.db import connection, transaction
+from django.db.models import F, Func, Q, Value
+from django.db.models.functions import Cast
+from django.utils import timezone
+
 from dotenv import load_dotenv
 from langchain.docstore.document import Document
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_community.document_loaders import TextLoader
-from langchain_huggingface.embeddings import HuggingFaceEndpointEmbeddings
-from pdfminer.high_level import extract_text
-from pgvector.django import CosineDistance
-
-from chat.models import ChatRAGFile
-
-from .config import get_default_model
+from pgvector import HalfVector, Vector
+from pgvector.django import BitField, CosineDistance, HammingDistance, VectorField
+
+from chat.models import UserDocument
+
+from .config import (
+    BINARY_RERANK_CANDIDATES,
+    CHUNK_OVERLAP,
+    CHUNK_SIZE,
+    EMBEDDING_CACHE_ENABLED,
+    EMBEDDING_DIMENSIONS,
+    HNSW_EF_SEARCH,
+    HNSW_ITERATIVE_SCAN,
+    HNSW_MAX_SCAN_TUPLES,
+    HYBRID_CANDIDATES,
+    QUERY_EMBEDDING_CACHE_ENABLED,
+    RAG_CONTEXT_CANDIDATES,
+    RAG_CONTEXT_TOKEN_BUDGET,
+    RAG_NEIGHBOUR_CHUNKS,
+    RAG_NEIGHBOUR_TOKEN_BUDGET,
+    RAG_RETRIEVAL_MODE,
+    RAG_ROUTING_ENABLED,
+    RAG_TOP_K,
+    RETRIEVAL_CACHE_ENABLED,
+    RRF_K,
+    TEXT_SEARCH_CONFIG,
+    VECTOR_BINARY_PREFILTER,
+    VECTOR_MATRIX_CACHE,
+    get_default_model,
+)
+from .context_packing import expand_neighbours, pack_context
+from .embedding_cache import CachedEmbeddings, query_embedding_cache
+from .embeddings import cache_namespace, get_embeddings
+from .extraction import iter_document_chunks
+from .indexing import EmbeddingPipeline
+from .ingest import ChunkWriter, adjust_chunk_count, delete_document_chunks
+from .reembedding import check_dimensions, live_spaces, missing_chunks, space_embeddings
+from .retrieval_cache import retrieval_cache
+from .routing import SummaryAccumulator, route
+from .text_splitter import RecursiveTextSplitter
+from .uploads import file_fingerprint
+from .vector_cache import chat_matrix_cache
 
 BASE_DIR = Path(os.path.dirname(os.path.abspath(__file__)))
 env_path = os.path.join(BASE_DIR, ".env")
 load_dotenv(env_path)
 
 
+_TERM_RE = re.compile(r"\w+")
+
+# Runs the full-text half of hybrid searches alongside the vector half
+_lexical_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="lexical")
+
+
+def _lexical_query(text, max_terms=32):
+    """OR of the distinct words in text, or None if there are none"""
+    terms = list(dict.fromkeys(term.lower() for term in _TERM_RE.findall(text)))
+    # "or" is websearch syntax (and an English stop word anyway)
+    terms = [term for term in terms if term != "or"][:max_terms]
+    if not terms:
+        return None
+    return SearchQuery(
+        " or ".join(terms), search_type="websearch", config=TEXT_SEARCH_CONFIG
+    )
+
+
+def reciprocal_rank_fusion(ranked_lists, k=RAG_TOP_K, rrf_k=RRF_K):
+    """Fuse rankings of DocumentChunk rows by summing 1 / (rrf_k + rank).
+
+    A chunk found by several rankings keeps the row object from the first list
+    it appears in (so vector hits keep their similarity). Each returned chunk
+    gets an rrf_score attribute.
+    """
+    scores = {}
+    chunks = {}
+    for ranked in ranked_lists:
+        for rank, chunk in enumerate(ranked, start=1):
+            scores[chunk.pk] = scores.get(chunk.pk, 0.0) + 1.0 / (rrf_k + rank)
+            chunks.setdefault(chunk.pk, chunk)
+    fused = sorted(scores, key=scores.get, reverse=True)[:k]
+    for pk in fused:
+        chunks[pk].rrf_score = round(scores[pk], 6)
+    return [chunks[pk] for pk in fused]
+
+
+def _binary_quantize(expression):
+    """binary_quantize(expression)::bit(N), the expression the bit index uses"""
+    return Cast(
+        Func(expression, function="binary_quantize"),
+        BitField(length=EMBEDDING_DIMENSIONS),
+    )
+
+
+# Statuses of a document whose indexing has not finished; progress updates
+# never move a document out of done or failed
+IN_PROGRESS_STATUSES = ("queued", "extracting", "embedding")
+
+
+def _set_index_status(documents, status, **fields):
+    """Record background indexing progress on UserDocument rows"""
+    document_ids = [document.pk for document in documents]
+    if document_ids:
+        UserDocument.objects.filter(pk__in=document_ids).update(
+            index_status=status, index_updated_at=timezone.now(), **fields
+        )
+
+
+def _set_hnsw_search(candidates):
+    """Apply the HNSW search settings to the current transaction (PostgreSQL)"""
+    with connection.cursor() as cursor:
+        ef_search = max(int(HNSW_EF_SEARCH), candidates)
+        cursor.execute(f"SET LOCAL hnsw.ef_search = {ef_search}")
+        if HNSW_ITERATIVE_SCAN in ("strict_order", "relaxed_order"):
+            cursor.execute(f"SET LOCAL hnsw.iterative_scan = {HNSW_ITERATIVE_SCAN}")
+            cursor.execute(
+                f"SET LOCAL hnsw.max_scan_tuples = {int(HNSW_MAX_SCAN_TUPLES)}"
+            )
+
+
+def _chat_space(chat_id):
+    """The EmbeddingSpace a chat is searched in, or None for the built-in columns.
+
+    A document attached after the chat was cut over can have chunks without a
+    vector in the space until embed_document (chat/reembedding.py) has run.
+    Distances of two spaces cannot be compared, so until then the whole chat
+    is searched in the built-in columns, which every chunk has.
+    """
+    from .models import ChatVectorIndex
+
+    vector_index = (
+        ChatVectorIndex.objects.select_related("embedding_space")
+        .filter(chat_id=chat_id)
+        .first()
+    )
+    space = vector_index.embedding_space if vector_index else None
+    if (
+        space is not None
+        and missing_chunks(space)
+        .filter(document__attachments__chat_id=chat_id)
+        .exists()
+    ):
+        return None
+    return space
+
+
+def chunking_key() -> str:
+    """The splitter settings documents are chunked with, as stored on them"""
+    return f"recursive-{CHUNK_SIZE}-{CHUNK_OVERLAP}"
+
+
+def get_rag_pipeline():
+    """The process-wide RAG_pipeline from the service container.
+
+    Building a pipeline reads the environment and creates the embeddings
+    client (an HTTP client with its own connection pool, or an ONNX session),
+    so callers share one instance instead of constructing one per request.
+    """
+    from .services.container import get_container
+
+    container = get_container()
+    container.register_lazy_singleton(RAG_pipeline, RAG_pipeline)
+    return container.get(RAG_pipeline)
+
+
+def _warm_up():
+    try:
+        get_rag_pipeline().warm_up()
+    except Exception as e:
+        print(f"Warning: RAG pipeline warm-up failed: {e}")
+
+
+def warm_up_in_background():
+    """Build the shared pipeline and open its connections off the boot path"""
+    threading.Thread(target=_warm_up, name="rag-warmup", daemon=True).start()
+
+
 class RAG_pipeline:
-    def __init__(self, embedding_model_name="all-MiniLM-L6-v2", model=None):
+    def __init__(
+        self, embedding_model_name="all-MiniLM-L6-v2", model=None, embeddings=None
+    ):
         self.embedding_model_name = embedding_model_name
         self.model = model or get_default_model()
         # Replace FAISS with None since we're using PostgreSQL
@@ -28,217 +202,635 @@ class RAG_pipeline:
         self.qa_chain = None
         self.chunks = []
 
-        # Keep embeddings for generating new embeddings
-        # Use Hugging Face Inference API instead of local model to avoid heavy deps (torch/sentence-transformers)
-        api_token = os.getenv("HUGGINGFACEHUB_API_TOKEN")
-        if not api_token:
-            print(
-                "WARNING: HUGGINGFACEHUB_API_TOKEN is not set. RAG functionality will not work properly."
-            )
-            print(
-                "Create a token at https://huggingface.co/settings/tokens and set it in your environment/.env."
-            )
-            # Don't raise an error, just warn and continue with a dummy embeddings object
-            self.embeddings = None
+        # An explicitly passed embeddings client (benchmarks, tests) is used
+        # as is, without the embedding caches
+        if embeddings is not None:
+            self.embeddings = embeddings
             return
 
-        # Accept either bare model name (e.g., "all-MiniLM-L6-v2") or full repo id
-        model_id = (
-            embedding_model_name
-            if "/" in embedding_model_name
-            else f"sentence-transformers/{embedding_model_name}"
-        )
-
-        # Use HuggingFaceEndpointEmbeddings which hits the Inference API
-        self.embeddings = HuggingFaceEndpointEmbeddings(
-            model=model_id,
-            task="feature-extraction",
-            huggingfacehub_api_token=api_token,
-        )
+        # Embeddings client for the backend selected in config.EMBEDDING_BACKEND.
+        # None means no backend could be built and RAG is disabled.
+        self.embeddings = get_embeddings(embedding_model_name)
+
+        # Reuse vectors of chunks and queries that were already embedded with this
+        # model and backend
+        if self.embeddings is not None and (
+            EMBEDDING_CACHE_ENABLED or QUERY_EMBEDDING_CACHE_ENABLED
+        ):
+            self.embeddings = CachedEmbeddings(
+                self.embeddings,
+                cache_namespace(self.embeddings, embedding_model_name),
+                cache_documents=EMBEDDING_CACHE_ENABLED,
+                query_cache=(
+                    query_embedding_cache if QUERY_EMBEDDING_CACHE_ENABLED else None
+                ),
+            )
 
-    def build_index(
-        self, file_paths_and_types, chat_id=None, rag_files_map=None, incremental=True
-    ):
-        """Build index using PostgreSQL instead of FAISS"""
-        if not chat_id:
-            raise ValueError("chat_id is required for PostgreSQL vector storage")
+    def warm_up(self):
+        """Embed a probe query so the model or HTTP connection is ready.
 
-        print(f"FILE PATHS ADN TYPES {file_paths_and_types}")
-        print(f"RAG FIle Map {rag_files_map} ")
+        Goes to the backend directly, past the query embedding cache, because
+        the point is to load the ONNX session or open the keep-alive connection.
+        """
+        if self.embeddings is None:
+            return
+        backend = getattr(self.embeddings, "embeddings", self.embeddings)
+        backend.embed_query("warm up")
+
+    def build_index(self, documents, incremental=True):
+        """Extract, chunk, embed and store library documents (UserDocument).
+
+        Files are extracted, chunked, embedded and stored as a stream, so
+        memory stays flat regardless of document size. Incremental runs skip
+        documents already indexed from the same file with the same model and
+        chunking; otherwise a document's chunks are replaced, from its stored
+        text when there is some (see chat/text_store.py). Every chat the
+        documents are attached to sees the new chunks.
+        """
         # Import here to avoid circular imports
-        from .models import Chat, ChatVectorIndex, DocumentChunk
+        from .models import ChatRAGFile, ChatVectorIndex, ChunkEmbedding, DocumentChunk
 
-        try:
-            chat = Chat.objects.get(id=chat_id)
-        except Chat.DoesNotExist:
-            print(f"Chat with id {chat_id} not found")
-            return
+        # New chunks are also embedded into the spaces being migrated to, so
+        # re-embedding never falls behind uploads (see chat/reembedding.py)
+        spaces = live_spaces()
 
-        # Only clear existing chunks if not incremental
-        if not incremental:
-            DocumentChunk.objects.filter(chat=chat).delete()
-        else:
-            # For incremental indexing, only delete chunks for files we're re-indexing
-            if rag_files_map:
-                existing_rag_files = [rag_file for rag_file in rag_files_map.values()]
-                DocumentChunk.objects.filter(
-                    chat=chat, rag_file__in=existing_rag_files
-                ).delete()
-
-        all_loaded_docs = []
-        file_to_rag_file_map = {}
-
-        # Process files (keep your existing file processing logic)
-        for file_path, file_type in file_paths_and_types:
-            docs_from_file = []
-            if file_type == "pdf":
-                print("HI IM INSIDE FILE_TYPE == PDF")
+        splitter = RecursiveTextSplitter(
+            chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP
+        )
+        chunking = chunking_key()
+        removed_count = 0
+        summaries = SummaryAccumulator()
+        indexed_documents = []
+        failed_documents = set()  # pks whose extraction failed partway
+        fingerprints = {}  # document pk -> (content hash, size, text digest)
+        unchanged_documents = []
+
+        def pending_chunks():
+            """Yield unsaved DocumentChunk rows (without embeddings) in order"""
+            nonlocal removed_count
+            for document in documents:
                 try:
-                    if not os.path.exists(file_path) or not os.path.isfile(file_path):
-                        print(f"PDF file not found: {file_path}. Skipping.")
-                        continue
-                    text = extract_text(file_path)
-                    if text and text.strip():
-                        docs_from_file = [
-                            Document(
-                                page_content=text,
-                                metadata={
-                                    "source": os.path.basename(file_path),
-                                    "file_path": file_path,
-                                },
-                            )
-                        ]
-                except Exception as e:
-                    print(f"Failed to extract text from PDF {file_path}: {e}")
+                    file_path = document.file.path
+                except ValueError:
+                    file_path = None
+                if (
+                    not file_path
+                    or not os.path.exists(file_path)
+                    or not os.path.isfile(file_path)
+                ):
+                    print(f"File not found for document {document.pk}. Skipping.")
+                    _set_index_status(
+                        [document], "failed", index_error="The file could not be read."
+                    )
                     continue
-            elif file_type == "txt":
+                file_type = os.path.splitext(document.original_filename)[1][1:]
+
+                content_hash, file_size = file_fingerprint(file_path)
+                if (
+                    incremental
+                    and document.index_status == "done"
+                    and document.content_hash == content_hash
+                    and document.embedding_model == self.embedding_model_name
+                    and document.chunking == chunking
+                    and document.chunks.exists()
+                ):
+                    print(f"{file_path} is unchanged. Skipping.")
+                    unchanged_documents.append(document)
+                    continue
+                removed_count += delete_document_chunks(document.chunks.all())
+
+                _set_index_status(
+                    [document],
+                    "extracting",
+                    chunks_total=None,
+                    chunks_indexed=0,
+                    index_error="",
+                )
+                text_digest = hashlib.sha256()
                 try:
-                    if not os.path.exists(file_path) or not os.path.isfile(file_path):
-                        print(f"Text file not found: {file_path}. Skipping.")
-                        continue
-                    loader = TextLoader(file_path, encoding="utf-8")
-                    loaded_docs_segment = loader.load()
-                    if loaded_docs_segment:
-                        # Add file_path to metadata
-                        for doc in loaded_docs_segment:
-                            doc.metadata["file_path"] = file_path
-                        docs_from_file = loaded_docs_segment
+                    for chunk_index, (text, metadata) in enumerate(
+                        iter_document_chunks(
+                            file_path,
+                            file_type.lower(),
+                            splitter,
+                            text_digest=text_digest,
+                            content_hash=content_hash,
+                        )
+                    ):
+                        yield DocumentChunk(
+                            document=document,
+                            content=text,
+                            chunk_index=chunk_index,
+                            metadata=metadata,
+                        )
                 except Exception as e:
-                    print(f"Failed to load text file {file_path}: {e}")
+                    print(f"Failed to extract text from {file_path}: {e}")
+                    failed_documents.add(document.pk)
+                    _set_index_status(
+                        [document], "failed", index_error=f"Extraction failed: {e}"
+                    )
                     continue
+                indexed_documents.append(document)
+                fingerprints[document.pk] = (content_hash, file_size, text_digest)
 
-            # Map file path to rag_file if provided
-            if rag_files_map and file_path in rag_files_map:
-                file_to_rag_file_map[file_path] = rag_files_map[file_path]
+        vector_column = DocumentChunk.vector_column()
 
-            all_loaded_docs.extend(docs_from_file)
+        def record_progress(chunk_objects):
+            """Progress for the indexing status endpoint and the chats' counts"""
+            per_document = {}
+            for chunk_obj in chunk_objects:
+                per_document[chunk_obj.document_id] = (
+                    per_document.get(chunk_obj.document_id, 0) + 1
+                )
+            for document_id, count in per_document.items():
+                # Updating the document first takes its row lock, which
+                # attach_document holds while it counts the document's chunks
+                UserDocument.objects.filter(
+                    pk=document_id, index_status__in=IN_PROGRESS_STATUSES
+                ).update(
+                    index_status="embedding",
+                    chunks_indexed=F("chunks_indexed") + count,
+                    index_updated_at=timezone.now(),
+                )
+                adjust_chunk_count(document_id, count)
+            ChunkEmbedding.objects.bulk_create(
+                [
+                    ChunkEmbedding(chunk=chunk_obj, space_id=space_id, embedding=vector)
+                    for chunk_obj in chunk_objects
+                    for space_id, vector in chunk_obj.space_vectors.items()
+                ],
+                batch_size=100,
+            )
 
-        if not all_loaded_docs:
-            print("No documents were successfully loaded.")
-            return
+        # Rows go out in buffered COPY batches, each in one transaction
+        # together with its progress update
+        writer = ChunkWriter(on_flush=record_progress)
+
+        def store_batch(chunk_objects, embeddings_list):
+            # Chunks of a document that has failed since they were queued
+            kept = [
+                (chunk_obj, embedding)
+                for chunk_obj, embedding in zip(chunk_objects, embeddings_list)
+                if chunk_obj.document_id not in failed_documents
+            ]
+            if not kept:
+                return
+            chunk_objects = [chunk_obj for chunk_obj, _embedding in kept]
+            embeddings_list = [embedding for _chunk_obj, embedding in kept]
+            by_document = defaultdict(list)
+            for chunk_obj, embedding in zip(chunk_objects, embeddings_list):
+                setattr(chunk_obj, vector_column, embedding)
+                chunk_obj.space_vectors = {}
+                by_document[chunk_obj.document_id].append(embedding)
+            for document_id, vectors in by_document.items():
+                summaries.add(document_id, vectors)
+            for space in list(spaces):
+                try:
+                    vectors = EmbeddingPipeline(
+                        space_embeddings(space)
+                    ).embed_with_retry(
+                        [chunk_obj.content for chunk_obj in chunk_objects]
+                    )
+                    check_dimensions(space, vectors)
+                except Exception as e:
+                    # The re-embedding job picks these chunks up later
+                    print(f"Warning: could not embed into space {space.name}: {e}")
+                    spaces.remove(space)
+                    continue
+                for chunk_obj, vector in zip(chunk_objects, vectors):
+                    chunk_obj.space_vectors[space.pk] = vector
+            writer.add(chunk_objects)
 
-        # Split documents into chunks
-        splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=100)
-        self.chunks = splitter.split_documents(all_loaded_docs)
+        # Extract, embed and store in one stream; finished batches are written
+        # as soon as the buffer fills
+        try:
+            EmbeddingPipeline(self.embeddings).run(
+                pending_chunks(),
+                text_of=lambda chunk_obj: chunk_obj.content,
+                on_batch=store_batch,
+            )
+        finally:
+            # Keep what was embedded even if a later batch failed
+            writer.flush()
+            if failed_documents:
+                # Batches of a failed document stored before its extraction
+                # broke off; deleting them also takes them off the chats' counts
+                removed_count += delete_document_chunks(
+                    DocumentChunk.objects.filter(document_id__in=failed_documents)
+                )
+                UserDocument.objects.filter(pk__in=failed_documents).update(
+                    chunks_indexed=0, chunks_total=None
+                )
+        stored_count = writer.written
 
-        if not self.chunks:
-            print("No chunks created from documents.")
-            return
+        for document in indexed_documents:
+            UserDocument.objects.filter(pk=document.pk, chunks_indexed=0).update(
+                index_status="failed",
+                index_error="No text could be extracted from the file.",
+                index_updated_at=timezone.now(),
+            )
+            content_hash, file_size, text_digest = fingerprints[document.pk]
+            UserDocument.objects.filter(pk=document.pk, chunks_indexed__gt=0).update(
+                index_status="done",
+                chunks_total=F("chunks_indexed"),
+                indexed_at=timezone.now(),
+                index_updated_at=timezone.now(),
+                content_hash=content_hash,
+                file_size=file_size,
+                text_hash=text_digest.hexdigest(),
+                embedding_model=self.embedding_model_name,
+                chunking=chunking,
+                summary_embedding=summaries.summary(document.pk),
+            )
 
-        # Generate embeddings for all chunks
-        chunk_texts = [chunk.page_content for chunk in self.chunks]
-        embeddings_list = self.embeddings.embed_documents(chunk_texts)
-
-        # Store chunks with embeddings in PostgreSQL
-        chunk_objects = []
-        for i, (chunk, embedding) in enumerate(zip(self.chunks, embeddings_list)):
-            # Find the corresponding RAG file using the file path
-            rag_file = None
-            file_path = chunk.metadata.get("file_path", "")
-            if file_path and file_path in file_to_rag_file_map:
-                rag_file = file_to_rag_file_map[file_path]
-            else:
-                # Fallback: try to find by filename
-                source_file = chunk.metadata.get("source", "")
-                if source_file:
-                    try:
-                        rag_file = ChatRAGFile.objects.filter(
-                            chat=chat, original_filename=source_file
-                        ).first()
-                    except:
-                        pass
-
-            if not rag_file:
+        if stored_count or removed_count:
+            # Saving moves last_updated (the index version) of every chat that
+            # sees these documents forward. Only the named fields are written,
+            # so total_chunks keeps its F() updates.
+            attached_chats = ChatRAGFile.objects.filter(
+                document_id__in=[document.pk for document in documents]
+            ).values("chat_id")
+            for vector_index in ChatVectorIndex.objects.filter(
+                chat_id__in=attached_chats
+            ):
+                # A chat cut over to an embedding space keeps that space's model
+                if vector_index.embedding_space_id is None:
+                    vector_index.embedding_model = self.embedding_model_name
+                vector_index.save(update_fields=["embedding_model", "last_updated"])
+
+        if not stored_count:
+            if unchanged_documents:
                 print(
-                    f"Warning: Could not find RAG file for chunk {i}, file_path: {file_path}"
+                    f"All {len(unchanged_documents)} document(s) unchanged; "
+                    "index is current."
                 )
-                continue  # Skip chunks without valid rag_file
-
-            chunk_obj = DocumentChunk(
-                chat=chat,
-                rag_file=rag_file,
-                content=chunk.page_content,
-                chunk_index=i,
-                embedding=embedding,
-                metadata=chunk.metadata,
-            )
-            chunk_objects.append(chunk_obj)
-
-        # Bulk create all chunks
-        DocumentChunk.objects.bulk_create(chunk_objects, batch_size=100)
-
-        # Update or create vector index record
-        ChatVectorIndex.objects.update_or_create(
-            chat=chat,
-            defaults={
-                "total_chunks": len(chunk_objects),
-                "embedding_model": self.embedding_model_name,
-            },
-        )
+            else:
+                print("No chunks created from documents.")
+            return
 
         print(
-            f"Successfully stored {len(chunk_objects)} chunks in PostgreSQL for chat {chat_id}"
+            f"Successfully stored {stored_count} chunks in PostgreSQL for "
+            f"{len(indexed_documents)} document(s)"
         )
 
-    def retrieve_docs(self, query: str, chat_id=None):
-        """Retrieve relevant documents from PostgreSQL using vector similarity"""
+    def retrieve_docs(
+        self,
+        query: str,
+        chat_id=None,
+        mode=None,
+        k=RAG_TOP_K,
+        neighbours=None,
+        token_budget=None,
+    ):
+        """Retrieve relevant documents for a query from PostgreSQL.
+
+        mode is "vector", "lexical" or "hybrid" (default RAG_RETRIEVAL_MODE).
+        In hybrid mode the full-text search runs on another thread while the
+        query is embedded and searched by vector, then both rankings are fused.
+
+        neighbours (default RAG_NEIGHBOUR_CHUNKS) widens each hit with that
+        many chunks on either side, fetched in one query; overlapping hits
+        are merged and the result is kept within token_budget (default
+        RAG_NEIGHBOUR_TOKEN_BUDGET). One Document is returned per passage.
+        """
         if not chat_id:
             return []
+        mode = mode or RAG_RETRIEVAL_MODE
+        neighbours = RAG_NEIGHBOUR_CHUNKS if neighbours is None else neighbours
+        if token_budget is None:
+            token_budget = RAG_NEIGHBOUR_TOKEN_BUDGET
+
+        def retrieve():
+            chunks, _query_embedding = self._retrieve(
+                query, chat_id, mode, k, _chat_space(chat_id)
+            )
+            if neighbours > 0:
+                return self._expand(chunks, neighbours, token_budget)
+            return self._to_documents(chunks)
+
+        if not RETRIEVAL_CACHE_ENABLED:
+            return retrieve()
+        key = (self.embedding_model_name, "docs", mode, k)
+        if neighbours > 0:
+            key += (neighbours, token_budget)
+        return retrieval_cache.get_or_retrieve(chat_id, key, query, retrieve)
+
+    def retrieve_context(
+        self,
+        query: str,
+        chat_id=None,
+        token_budget=RAG_CONTEXT_TOKEN_BUDGET,
+        mode=None,
+    ):
+        """Retrieve documents packed into a prompt token budget.
+
+        Over-fetches RAG_CONTEXT_CANDIDATES chunks, reranks them with maximal
+        marginal relevance on their stored embeddings, merges adjacent chunks
+        of the same file and keeps what fits in token_budget. Returns one
+        Document per merged passage, in relevance order.
+        """
+        if not chat_id or token_budget <= 0:
+            return []
+        mode = mode or RAG_RETRIEVAL_MODE
+
+        def retrieve():
+            return self._retrieve_context(query, chat_id, token_budget, mode)
+
+        if not RETRIEVAL_CACHE_ENABLED:
+            return retrieve()
+        return retrieval_cache.get_or_retrieve(
+            chat_id,
+            (self.embedding_model_name, "context", mode, token_budget),
+            query,
+            retrieve,
+        )
+
+    def _retrieve_context(self, query, chat_id, token_budget, mode):
+        from .models import ChunkEmbedding
+
+        space = _chat_space(chat_id)
+        chunks, query_embedding = self._retrieve(
+            query, chat_id, mode, RAG_CONTEXT_CANDIDATES, space
+        )
+        if not chunks:
+            return []
 
+        if space is None:
+            # Retrieved rows already carry their stored embeddings
+            vectors = {chunk.pk: chunk.vector for chunk in chunks}
+        else:
+            vectors = dict(
+                ChunkEmbedding.objects.filter(
+                    space=space, chunk_id__in=[chunk.pk for chunk in chunks]
+                ).values_list("chunk_id", "embedding")
+            )
+            # Lexical hits not yet re-embedded cannot be compared
+            chunks = [chunk for chunk in chunks if chunk.pk in vectors]
+        return pack_context(chunks, vectors, query_embedding, token_budget)
+
+    def _retrieve(self, query, chat_id, mode=None, k=RAG_TOP_K, space=None):
+        """Return (ranked chunks, query embedding or None) for a query.
+
+        space is the chat's EmbeddingSpace, or None for the built-in columns;
+        the query is embedded with the matching model.
+        """
+        mode = mode or RAG_RETRIEVAL_MODE
+        if mode != "vector" and connection.vendor != "postgresql":
+            mode = "vector"  # Full-text search needs PostgreSQL
+
+        if mode == "lexical":
+            return self._lexical_search(chat_id, query, k), None
+
+        candidates = max(HYBRID_CANDIDATES, k)
+        lexical_future = None
+        if mode == "hybrid":
+            lexical_future = _lexical_executor.submit(
+                self._lexical_search_in_thread, chat_id, query, candidates
+            )
+
+        query_embedding = None
+        vector_chunks = None
         if not self.embeddings:
             print(
-                "ERROR: Cannot retrieve documents - embeddings not initialized (missing HuggingFace token)"
+                "ERROR: Cannot retrieve documents - embeddings not initialized (no embedding backend available)"
             )
-            return []
+        else:
+            try:
+                # Generate embedding for the query (served from the LRU on repeats)
+                embeddings = (
+                    self.embeddings if space is None else space_embeddings(space)
+                )
+                query_embedding = embeddings.embed_query(query)
+                # Route to the documents closest to the query first (summaries
+                # are in the built-in space, so chats on another are not routed)
+                document_ids = None
+                if RAG_ROUTING_ENABLED and space is None:
+                    document_ids = route(chat_id, query_embedding)
+                # Perform vector similarity search using PostgreSQL
+                vector_chunks = self._vector_search(
+                    chat_id,
+                    query_embedding,
+                    k=candidates if lexical_future else k,
+                    space=space,
+                    document_ids=document_ids,
+                )
+            except Exception as e:
+                print(f"ERROR: Failed to generate query embedding: {e}")
 
-        from .models import DocumentChunk
+        if lexical_future is None:
+            return vector_chunks or [], query_embedding
 
         try:
-            # Generate embedding for the query
-            query_embedding = self.embeddings.embed_query(query)
+            lexical_chunks = lexical_future.result()
         except Exception as e:
-            print(f"ERROR: Failed to generate query embedding: {e}")
-            return []
+            print(f"ERROR: Full-text search failed: {e}")
+            lexical_chunks = []
 
-        # Perform vector similarity search using PostgreSQL
-        chunks = (
-            DocumentChunk.objects.filter(chat_id=chat_id)
-            .annotate(similarity=CosineDistance("embedding", query_embedding))
-            .order_by("similarity")[:4]
-        )  # Get top 4 most similar chunks
+        # Either list alone still gives a ranking if the other side failed
+        ranked_lists = [chunks for chunks in (vector_chunks, lexical_chunks) if chunks]
+        return reciprocal_rank_fusion(ranked_lists, k), query_embedding
 
-        # Convert back to LangChain Document format
+    def _neighbour_chunks(self, chunks, window):
+        """Chunks within window positions of any of chunks, in one query.
+
+        Each document's windows are merged into ranges, so the query is an OR
+        of (document, chunk_index range) conditions served by the
+        (document, chunk_index) index.
+        """
+        from .models import DocumentChunk
+
+        positions = defaultdict(set)
+        for chunk in chunks:
+            positions[chunk.document_id].add(chunk.chunk_index)
+        condition = Q()
+        for document_id, indices in positions.items():
+            start = end = None
+            for index in sorted(indices):
+                if start is not None and index - window <= end + 1:
+                    end = index + window
+                    continue
+                if start is not None:
+                    condition |= Q(
+                        document_id=document_id, chunk_index__range=(start, end)
+                    )
+                start, end = index - window, index + window
+            condition |= Q(document_id=document_id, chunk_index__range=(start, end))
+        return (
+            DocumentChunk.objects.filter(condition)
+            .exclude(pk__in=[chunk.pk for chunk in chunks])
+            .only("pk", "document_id", "chunk_index", "content", "metadata")
+        )
+
+    def _expand(self, chunks, window, token_budget):
+        """Hits widened with their neighbours (see expand_neighbours)"""
+        if not chunks:
+            return []
+        passages = expand_neighbours(
+            chunks, self._neighbour_chunks(chunks, window), window, token_budget
+        )
+        hit_documents = self._to_documents(chunks)
+        for passage in passages:
+            # The passage takes the metadata and scores of its best hit
+            best = hit_documents[passage.metadata["hit_ranks"][0]]
+            passage.metadata = {**best.metadata, **passage.metadata}
+        return passages
+
+    def _to_documents(self, chunks):
+        """Convert DocumentChunk rows to LangChain Documents"""
         documents = []
         for chunk in chunks:
-            doc = Document(
-                page_content=chunk.content,
-                metadata={
-                    "source": chunk.metadata.get("source", "unknown"),
-                    "chunk_index": chunk.chunk_index,
-                    "similarity_score": float(chunk.similarity),
-                    **chunk.metadata,
-                },
+            metadata = {
+                "source": chunk.metadata.get("source", "unknown"),
+                "chunk_index": chunk.chunk_index,
+                "chunk_id": str(chunk.pk),
+                **chunk.metadata,
+            }
+            # Lexical-only hits have no vector distance
+            if getattr(chunk, "similarity", None) is not None:
+                metadata["similarity_score"] = float(chunk.similarity)
+            if getattr(chunk, "rrf_score", None) is not None:
+                metadata["rrf_score"] = chunk.rrf_score
+            documents.append(Document(page_content=chunk.content, metadata=metadata))
+        return documents
+
+    def _lexical_search(self, chat_id, query, k=RAG_TOP_K):
+        """Return the k chunks of a chat ranked by full-text relevance.
+
+        Query terms are ORed so natural-language questions still match chunks
+        that contain only some of them; ts_rank favours chunks matching more.
+        """
+        from .models import DocumentChunk
+
+        search_query = _lexical_query(query)
+        if search_query is None:
+            return []
+        return list(
+            DocumentChunk.for_chat(chat_id)
+            .filter(search_vector=search_query)
+            .annotate(rank=SearchRank(F("search_vector"), search_query))
+            .order_by("-rank")[:k]
+        )
+
+    def _lexical_search_in_thread(self, chat_id, query, k):
+        try:
+            return self._lexical_search(chat_id, query, k)
+        finally:
+            # The worker thread has its own DB connection
+            connection.close()
+
+    def _vector_search(
+        self, chat_id, query_embedding, k=RAG_TOP_K, space=None, document_ids=None
+    ):
+        """Return the k chunks of a chat closest to query_embedding.
+
+        document_ids, when given, restricts the search to those documents (see
+        chat/routing.py).
+
+        Small chats are ranked in memory by the ChatMatrixCache (exact cosine
+        distance). Otherwise chats cut over to an EmbeddingSpace are searched
+        in its ChunkEmbedding rows, and the others in the column selected by
+        VECTOR_STORAGE. With VECTOR_BINARY_PREFILTER, candidates come from the
+        binary-quantised index (Hamming distance) and are re-ranked by exact
+        cosine distance.
+        On PostgreSQL the HNSW index settings are applied with SET LOCAL so they
+        only affect this query's transaction.
+        """
+        from .models import DocumentChunk
+
+        if VECTOR_MATRIX_CACHE:
+            hits = chat_matrix_cache.search(
+                chat_id,
+                query_embedding,
+                k,
+                space_id=space.pk if space else None,
+                document_ids=document_ids,
             )
-            documents.append(doc)
+            if hits is not None:
+                rows = DocumentChunk.objects.in_bulk([pk for pk, _distance in hits])
+                chunks = []
+                for pk, distance in hits:
+                    # Skip chunks deleted since the matrix was loaded
+                    if pk in rows:
+                        rows[pk].similarity = distance
+                        chunks.append(rows[pk])
+                return chunks
+
+        if space is not None:
+            return self._space_vector_search(chat_id, space, query_embedding, k)
+
+        column = DocumentChunk.vector_column()
+        query_vector = (
+            HalfVector(query_embedding)
+            if column == "embedding_half"
+            else query_embedding
+        )
+        chat_chunks = DocumentChunk.for_chat(chat_id)
+        if document_ids is not None:
+            chat_chunks = chat_chunks.filter(document_id__in=document_ids)
+
+        def nearest(queryset):
+            return queryset.annotate(
+                similarity=CosineDistance(column, query_vector)
+            ).order_by("similarity")[:k]
+
+        if connection.vendor != "postgresql":
+            return list(nearest(chat_chunks))
+
+        prefilter = VECTOR_BINARY_PREFILTER
+        candidates = max(BINARY_RERANK_CANDIDATES, k) if prefilter else k
+        with transaction.atomic():
+            _set_hnsw_search(candidates)
+            if prefilter:
+                candidate_ids = list(
+                    chat_chunks.annotate(
+                        hamming=HammingDistance(
+                            _binary_quantize(F(column)),
+                            _binary_quantize(
+                                Cast(
+                                    Value(Vector._to_db(query_embedding)),
+                                    VectorField(dimensions=EMBEDDING_DIMENSIONS),
+                                )
+                            ),
+                        )
+                    )
+                    .order_by("hamming")
+                    .values_list("pk", flat=True)[:candidates]
+                )
+                chunks = list(nearest(chat_chunks.filter(pk__in=candidate_ids)))
+            else:
+                chunks = list(nearest(chat_chunks))
 
-        return documents
+        # relaxed_order may return neighbours slightly out of order
+        chunks.sort(key=lambda chunk: chunk.similarity)
+        return chunks
+
+    def _space_vector_search(self, chat_id, space, query_embedding, k):
+        """The k chunks of a chat closest to query_embedding in an EmbeddingSpace"""
+        from .models import ChunkEmbedding, DocumentChunk
+
+        space_vectors = ChunkEmbedding.objects.filter(
+            space=space, chunk__in=DocumentChunk.for_chat(chat_id)
+        ).select_related("chunk")
+        if connection.vendor != "postgresql":
+            column = F("embedding")
+        else:
+            # The same expression as the space's partial HNSW index
+            column = Cast("embedding", VectorField(dimensions=space.dimensions))
+        nearest = space_vectors.annotate(
+            similarity=CosineDistance(column, query_embedding)
+        ).order_by("similarity")[:k]
+
+        if connection.vendor != "postgresql":
+            rows = list(nearest)
+        else:
+            with transaction.atomic():
+                _set_hnsw_search(k)
+                rows = list(nearest)
+
+        chunks = []
+        for row in rows:
+            row.chunk.similarity = row.similarity
+            chunks.append(row.chunk)
+        # relaxed_order may return neighbours slightly out of order
+        chunks.sort(key=lambda chunk: chunk.similarity)
+        return chunks
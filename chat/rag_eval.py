@@ -0,0 +1,273 @@
+# chat/rag_eval.py
+"""
+Offline evaluation of RAG retrieval quality and latency.
+
+The fixture corpus in chat/benchmark_data/rag holds a few topical documents
+and a labelled query set (queries.json). Each query lists the passages that
+answer it as (file, phrase) pairs: a retrieved chunk is relevant when it
+comes from that file and contains the phrase (case and whitespace ignored).
+Labels therefore survive changes to chunking, and a passage that a chunk
+boundary cuts in two simply stops being found, which is what a chunking
+change should be judged on.
+
+Documents marked "format": "pdf" are rendered to a text-only PDF at run time,
+so PDF extraction is exercised without binary fixtures. Optional distractor
+documents of random prose make the index larger and the ranking harder.
+
+Embeddings come from HashingEmbeddings, so results are the same on every
+machine and no network or model download is needed. Absolute quality is that
+of a bag-of-words model; the harness is meant for comparing configurations
+and catching regressions, not for judging the production embedding model.
+See the benchmark_rag management command.
+"""
+
+import json
+import os
+import random
+import statistics
+import textwrap
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+DATA_DIR = Path(__file__).resolve().parent / "benchmark_data" / "rag"
+
+# Retrieval configurations: the retrieve_docs mode plus chat.rag settings
+# patched for the run. The retrieval cache is always off, so every query is
+# actually retrieved. The -routed variants first route the query to the
+# closest documents (chat/routing.py).
+CONFIGURATIONS = {
+    "vector": {
+        "mode": "vector",
+        "settings": {"VECTOR_MATRIX_CACHE": False, "RAG_ROUTING_ENABLED": False},
+    },
+    "vector-memory": {
+        "mode": "vector",
+        "settings": {"VECTOR_MATRIX_CACHE": True, "RAG_ROUTING_ENABLED": False},
+    },
+    "vector-binary": {
+        "mode": "vector",
+        "settings": {
+            "VECTOR_MATRIX_CACHE": False,
+            "VECTOR_BINARY_PREFILTER": True,
+            "RAG_ROUTING_ENABLED": False,
+        },
+    },
+    "lexical": {"mode": "lexical", "settings": {}},
+    "hybrid": {
+        "mode": "hybrid",
+        "settings": {"VECTOR_MATRIX_CACHE": False, "RAG_ROUTING_ENABLED": False},
+    },
+    "hybrid-memory": {
+        "mode": "hybrid",
+        "settings": {"VECTOR_MATRIX_CACHE": True, "RAG_ROUTING_ENABLED": False},
+    },
+    "vector-routed": {
+        "mode": "vector",
+        "settings": {"VECTOR_MATRIX_CACHE": False, "RAG_ROUTING_ENABLED": True},
+    },
+    "vector-memory-routed": {
+        "mode": "vector",
+        "settings": {"VECTOR_MATRIX_CACHE": True, "RAG_ROUTING_ENABLED": True},
+    },
+    "hybrid-routed": {
+        "mode": "hybrid",
+        "settings": {"VECTOR_MATRIX_CACHE": False, "RAG_ROUTING_ENABLED": True},
+    },
+}
+
+# Configurations that need PostgreSQL (pgvector operators, full-text search).
+# The -memory ones rank vectors in NumPy, so vector-memory and
+# vector-memory-routed also run on SQLite.
+POSTGRES_ONLY = {
+    "vector",
+    "vector-binary",
+    "lexical",
+    "hybrid",
+    "hybrid-memory",
+    "vector-routed",
+    "hybrid-routed",
+}
+
+DISTRACTOR_WORDS = (
+    "system process model value table report market policy water energy "
+    "network cell light rate change level growth form method result theory "
+    "history city river music garden language engine signal memory surface "
+    "the a of and to in is that for with as on by this be are from was"
+).split()
+
+
+def normalise(text: str) -> str:
+    return " ".join(text.split()).casefold()
+
+
+def load_query_set(path=None) -> Dict:
+    """The manifest: {"documents": [...], "queries": [...]}"""
+    with open(path or DATA_DIR / "queries.json", encoding="utf-8") as fh:
+        return json.load(fh)
+
+
+def write_text_pdf(path, pages: List[List[str]]):
+    """Write a minimal, valid text-only PDF (Helvetica 10pt, one line per row)"""
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        None,  # page tree, filled in once the page ids are known
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    ]
+    page_ids = []
+    for lines in pages:
+        rows = []
+        for line_number, text in enumerate(lines):
+            text = text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+            rows.append(f"BT /F1 10 Tf 50 {780 - line_number * 16} Td ({text}) Tj ET")
+        stream = "\n".join(rows).encode("latin-1", errors="replace")
+        objects.append(
+            b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream"
+        )
+        content_id = len(objects)
+        objects.append(
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+            b"/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % content_id
+        )
+        page_ids.append(len(objects))
+    kids = " ".join(f"{page_id} 0 R" for page_id in page_ids).encode()
+    objects[1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (kids, len(pages))
+
+    with open(path, "wb") as fh:
+        fh.write(b"%PDF-1.4\n")
+        offsets = []
+        for number, body in enumerate(objects, start=1):
+            offsets.append(fh.tell())
+            fh.write(b"%d 0 obj\n" % number + body + b"\nendobj\n")
+        xref_offset = fh.tell()
+        fh.write(b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1))
+        for offset in offsets:
+            fh.write(b"%010d 00000 n \n" % offset)
+        fh.write(
+            b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n"
+            % (len(objects) + 1, xref_offset)
+        )
+
+
+def text_to_pdf(text: str, path, line_chars: int = 95, lines_per_page: int = 45):
+    """Render plain text to a PDF, wrapping paragraphs at line_chars"""
+    lines = []
+    for paragraph in text.split("\n\n"):
+        lines.extend(textwrap.wrap(" ".join(paragraph.split()), line_chars))
+        lines.append("")
+    pages = [
+        lines[start : start + lines_per_page]
+        for start in range(0, len(lines), lines_per_page)
+    ]
+    write_text_pdf(path, pages)
+
+
+def distractor_text(size: int, rng: random.Random) -> str:
+    paragraphs, length = [], 0
+    while length < size:
+        sentences = [
+            " ".join(rng.choices(DISTRACTOR_WORDS, k=rng.randint(6, 20))).capitalize()
+            + "."
+            for _ in range(rng.randint(3, 8))
+        ]
+        paragraphs.append(" ".join(sentences))
+        length += len(paragraphs[-1]) + 2
+    return "\n\n".join(paragraphs)
+
+
+def prepare_corpus(
+    query_set: Dict,
+    out_dir,
+    distractors: int = 0,
+    distractor_chars: int = 20000,
+    seed: int = 42,
+) -> List[Tuple[str, str, Optional[str]]]:
+    """Write the corpus files to out_dir.
+
+    Returns (path, file_type, manifest file name) per file; the manifest
+    name is None for distractors.
+    """
+    files = []
+    for document in query_set["documents"]:
+        name = document["file"]
+        with open(DATA_DIR / "documents" / name, encoding="utf-8") as fh:
+            text = fh.read()
+        if document.get("format") == "pdf":
+            path = os.path.join(out_dir, Path(name).stem + ".pdf")
+            text_to_pdf(text, path)
+            files.append((path, "pdf", name))
+        else:
+            path = os.path.join(out_dir, name)
+            with open(path, "w", encoding="utf-8") as fh:
+                fh.write(text)
+            files.append((path, "txt", name))
+
+    rng = random.Random(seed)
+    for number in range(distractors):
+        path = os.path.join(out_dir, f"distractor_{number:04d}.txt")
+        with open(path, "w", encoding="utf-8") as fh:
+            fh.write(distractor_text(distractor_chars, rng))
+        files.append((path, "txt", None))
+    return files
+
+
+def relevant_ranks(documents, relevant: List[Dict], source_of) -> List[Optional[int]]:
+    """1-based rank of the first document matching each relevant passage.
+
+    source_of maps a retrieved Document to its manifest file name.
+    """
+    ranks = []
+    for passage in relevant:
+        phrase = normalise(passage["text"])
+        rank = None
+        for position, doc in enumerate(documents, start=1):
+            if source_of(doc) == passage["file"] and phrase in normalise(
+                doc.page_content
+            ):
+                rank = position
+                break
+        ranks.append(rank)
+    return ranks
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def evaluate(retrieve, queries: List[Dict], source_of, repeat: int = 1) -> Dict:
+    """Run every query through retrieve(query) and score the results.
+
+    recall@k is the fraction of relevant passages found, averaged over
+    queries; MRR uses the rank of the first relevant result (0 if none).
+    Latencies cover every repetition; quality is scored on the first.
+    """
+    if repeat < 1:
+        raise ValueError(f"repeat must be at least 1, got {repeat}")
+    recalls, reciprocal_ranks, latencies = [], [], []
+    hits = 0
+    per_query = []
+    for item in queries:
+        for attempt in range(repeat):
+            started = time.perf_counter()
+            documents = retrieve(item["query"])
+            latencies.append((time.perf_counter() - started) * 1000)
+            if attempt == 0:
+                ranks = relevant_ranks(documents, item["relevant"], source_of)
+        found = [rank for rank in ranks if rank is not None]
+        recalls.append(len(found) / len(ranks))
+        reciprocal_ranks.append(1 / min(found) if found else 0.0)
+        hits += bool(found)
+        per_query.append({"query": item["query"], "ranks": ranks})
+
+    return {
+        "queries": len(queries),
+        "recall_at_k": round(statistics.mean(recalls), 4),
+        "mrr": round(statistics.mean(reciprocal_ranks), 4),
+        "hit_at_k": round(hits / len(queries), 4),
+        "p50_ms": round(statistics.median(latencies), 3),
+        "p95_ms": round(percentile(latencies, 95), 3),
+        "mean_ms": round(statistics.mean(latencies), 3),
+        "per_query": per_query,
+    }
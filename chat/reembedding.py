@@ -0,0 +1,317 @@
+# chat/reembedding.py
+"""
+Online migration of chunk embeddings to a new embedding model.
+
+An EmbeddingSpace is a versioned embedding model (name, model, dimensions).
+The embedding columns of DocumentChunk stay the configured model's space;
+vectors of any other space live in ChunkEmbedding, where each space can have
+its own dimensions. Moving to a new model is done while retrieval keeps
+serving:
+
+1. create_space registers the model and measures its dimensions. From then
+   on build_index also embeds new chunks into it (dual write).
+2. reembed walks the existing chunks in primary-key order, keyset-paginated,
+   and stores each batch's vectors together with the cursor, so the job can
+   be stopped and resumed at any time. A rate limit keeps it from starving
+   live traffic. When the walk reaches the end it sweeps once more from the
+   start for chunks inserted behind the cursor, then marks the space ready.
+3. cut_over points a chat at the space once every chunk of its documents
+   has a vector there. Until then the chat is searched in its old space;
+   revert sends chats back.
+
+The reembed_chunks management command drives and monitors these steps.
+"""
+
+import logging
+import threading
+import time
+from typing import Callable, Dict, Optional
+
+from django.db import transaction
+from django.db.models import Exists, F, OuterRef
+
+from .config import EMBEDDING_BACKEND, REEMBED_BATCH_ROWS, REEMBED_MAX_CHUNKS_PER_SECOND
+from .embeddings import get_embeddings
+from .indexing import EmbeddingPipeline
+
+logger = logging.getLogger(__name__)
+
+_clients: Dict[int, object] = {}
+_clients_lock = threading.Lock()
+
+
+def space_embeddings(space):
+    """The process-wide embeddings client of a space.
+
+    The embedding cache is not used: its rows have the built-in dimensions.
+    """
+    with _clients_lock:
+        client = _clients.get(space.pk)
+        if client is None:
+            client = get_embeddings(space.embedding_model, space.backend)
+            if client is None:
+                raise RuntimeError(
+                    f"No embeddings client for {space.embedding_model} "
+                    f"({space.backend})"
+                )
+            _clients[space.pk] = client
+        return client
+
+
+def create_space(name: str, embedding_model: str, backend: str = EMBEDDING_BACKEND):
+    """Register a new embedding space, measuring the model's dimensions"""
+    from .models import EmbeddingSpace
+
+    client = get_embeddings(embedding_model, backend)
+    if client is None:
+        raise RuntimeError(f"No embeddings client for {embedding_model} ({backend})")
+    dimensions = len(client.embed_query("dimension probe"))
+    space = EmbeddingSpace.objects.create(
+        name=name,
+        embedding_model=embedding_model,
+        backend=backend,
+        dimensions=dimensions,
+    )
+    with _clients_lock:
+        _clients[space.pk] = client
+    return space
+
+
+def live_spaces():
+    """Spaces new chunks are embedded into besides the built-in columns"""
+    from .models import EmbeddingSpace
+
+    return list(EmbeddingSpace.objects.exclude(status="retired"))
+
+
+def missing_chunks(space):
+    """DocumentChunk rows without a vector in the space"""
+    from .models import ChunkEmbedding, DocumentChunk
+
+    # An anti-join served by the (space, chunk) unique index
+    return DocumentChunk.objects.filter(
+        ~Exists(ChunkEmbedding.objects.filter(space=space, chunk_id=OuterRef("pk")))
+    )
+
+
+def check_dimensions(space, vectors):
+    """Refuse vectors of the wrong size, e.g. from a misconfigured client"""
+    for vector in vectors:
+        if len(vector) != space.dimensions:
+            raise ValueError(
+                f"{space.embedding_model} returned {len(vector)} dimensions, "
+                f"space {space.name} has {space.dimensions}"
+            )
+
+
+def store_space_vectors(space, chunk_ids, vectors) -> int:
+    """Store vectors of chunks that still exist; returns the number stored.
+
+    The chunks are locked so a concurrent delete cannot remove them between
+    the check and the insert.
+    """
+    from .models import ChunkEmbedding, DocumentChunk
+
+    check_dimensions(space, vectors)
+    with transaction.atomic():
+        live = set(
+            DocumentChunk.objects.select_for_update()
+            .filter(pk__in=chunk_ids)
+            .values_list("pk", flat=True)
+        )
+        rows = [
+            ChunkEmbedding(space=space, chunk_id=chunk_id, embedding=vector)
+            for chunk_id, vector in zip(chunk_ids, vectors)
+            if chunk_id in live
+        ]
+        ChunkEmbedding.objects.bulk_create(rows, ignore_conflicts=True)
+    return len(rows)
+
+
+def embed_document(space, document_id) -> int:
+    """Embed a document's chunks missing from the space; returns the number stored.
+
+    Used when a document whose chunks predate the space is attached to a chat
+    already cut over to it (see _chat_space in chat/rag.py). Afterwards the
+    version of every such chat moves forward, so it is searched in the space
+    again without serving cached fallback results.
+    """
+    from .models import ChatVectorIndex, EmbeddingSpace
+
+    pending = list(
+        missing_chunks(space)
+        .filter(document_id=document_id)
+        .order_by("pk")
+        .values_list("pk", "content")
+    )
+    if not pending:
+        return 0
+
+    stored = 0
+
+    def store_batch(rows, vectors):
+        nonlocal stored
+        stored += store_space_vectors(space, [pk for pk, _content in rows], vectors)
+
+    EmbeddingPipeline(space_embeddings(space)).run(
+        pending, text_of=lambda row: row[1], on_batch=store_batch
+    )
+    EmbeddingSpace.objects.filter(pk=space.pk).update(
+        chunks_embedded=F("chunks_embedded") + stored
+    )
+    for vector_index in ChatVectorIndex.objects.filter(
+        embedding_space=space, chat__rag_files__document_id=document_id
+    ):
+        vector_index.save(update_fields=["last_updated"])
+    logger.info(
+        f"Embedded {stored} chunk(s) of document {document_id} into space "
+        f"{space.name}"
+    )
+    return stored
+
+
+def reembed(
+    space,
+    batch_rows: int = REEMBED_BATCH_ROWS,
+    max_rate: float = REEMBED_MAX_CHUNKS_PER_SECOND,
+    max_batches: Optional[int] = None,
+    on_progress: Optional[Callable] = None,
+) -> int:
+    """Embed chunks missing from the space; returns the number embedded.
+
+    Each batch is the next batch_rows chunks after space.cursor that have no
+    vector in the space. Vectors and the advanced cursor are saved together,
+    so an interrupted run loses at most the batch in flight. max_rate caps
+    chunks per second (0 = no limit); max_batches stops early.
+    on_progress(space, embedded) is called after every batch.
+    """
+    from .models import EmbeddingSpace
+
+    pipeline = EmbeddingPipeline(space_embeddings(space))
+    batch_rows = max(1, batch_rows)
+    embedded = 0
+    batches = 0
+    while max_batches is None or batches < max_batches:
+        started = time.monotonic()
+        pending = missing_chunks(space).order_by("pk")
+        if space.cursor is not None:
+            pending = pending.filter(pk__gt=space.cursor)
+        batch = list(pending.values_list("pk", "content")[:batch_rows])
+
+        if not batch:
+            if space.cursor is None:
+                # A full pass found nothing missing
+                if space.status == "building":
+                    space.status = "ready"
+                    space.save(update_fields=["status", "updated_at"])
+                break
+            # Sweep again from the start for chunks inserted behind the cursor
+            space.cursor = None
+            space.save(update_fields=["cursor", "updated_at"])
+            continue
+
+        chunk_ids = [pk for pk, _content in batch]
+        by_id = {}
+        try:
+            pipeline.run(
+                batch,
+                text_of=lambda row: row[1],
+                on_batch=lambda rows, vectors: by_id.update(
+                    zip((pk for pk, _content in rows), vectors)
+                ),
+            )
+            check_dimensions(space, by_id.values())
+        except Exception as e:
+            EmbeddingSpace.objects.filter(pk=space.pk).update(last_error=str(e)[:1000])
+            raise
+
+        with transaction.atomic():
+            stored = store_space_vectors(
+                space, chunk_ids, [by_id[pk] for pk in chunk_ids]
+            )
+            space.cursor = chunk_ids[-1]
+            space.chunks_embedded = F("chunks_embedded") + stored
+            space.last_error = ""
+            space.save(
+                update_fields=["cursor", "chunks_embedded", "last_error", "updated_at"]
+            )
+        space.refresh_from_db(fields=["chunks_embedded", "status"])
+        embedded += stored
+        batches += 1
+        if on_progress is not None:
+            on_progress(space, embedded)
+
+        if space.status == "retired":
+            break
+        if max_rate > 0:
+            remaining = len(batch) / max_rate - (time.monotonic() - started)
+            if remaining > 0:
+                time.sleep(remaining)
+    return embedded
+
+
+def ready_indexes(space):
+    """ChatVectorIndex rows not on the space whose chunks all have a vector in it"""
+    from .models import ChatVectorIndex
+
+    incomplete = missing_chunks(space).filter(
+        document__attachments__chat_id=OuterRef("chat_id")
+    )
+    return (
+        ChatVectorIndex.objects.exclude(embedding_space=space)
+        .annotate(incomplete=Exists(incomplete))
+        .filter(incomplete=False)
+    )
+
+
+def cut_over(space, chat_ids=None) -> int:
+    """Move every ready chat (or the ready ones among chat_ids) to the space.
+
+    Each chat is re-checked under a lock on its index row just before it is
+    moved. A document attached afterwards whose chunks predate the space is
+    embedded into it in the background (embed_document); until then the chat
+    is searched in the built-in columns (new chunks are dual-written by
+    build_index, so they never need this). Saving the row moves the chat's index
+    version forward and drops its cached results. Returns the number of
+    chats moved.
+    """
+    from .models import ChatVectorIndex
+
+    candidates = ready_indexes(space)
+    if chat_ids is not None:
+        candidates = candidates.filter(chat_id__in=chat_ids)
+    moved = 0
+    for chat_id in candidates.values_list("chat_id", flat=True):
+        with transaction.atomic():
+            vector_index = (
+                ChatVectorIndex.objects.select_for_update()
+                .filter(chat_id=chat_id)
+                .first()
+            )
+            if vector_index is None:
+                continue
+            if not ready_indexes(space).filter(pk=vector_index.pk).exists():
+                continue
+            vector_index.embedding_space = space
+            vector_index.embedding_model = space.embedding_model
+            vector_index.save(
+                update_fields=["embedding_space", "embedding_model", "last_updated"]
+            )
+            moved += 1
+    logger.info(f"Cut {moved} chat(s) over to embedding space {space.name}")
+    return moved
+
+
+def revert(space, embedding_model: str) -> int:
+    """Send the space's chats back to the built-in columns (embedding_model)"""
+    from .models import ChatVectorIndex
+
+    moved = 0
+    for vector_index in ChatVectorIndex.objects.filter(embedding_space=space):
+        vector_index.embedding_space = None
+        vector_index.embedding_model = embedding_model
+        vector_index.save(
+            update_fields=["embedding_space", "embedding_model", "last_updated"]
+        )
+        moved += 1
+    return moved
@@ -0,0 +1,160 @@
+# chat/retrieval_cache.py
+"""
+Cache of retrieval results.
+
+Users often ask the same question again (or regenerate an answer) against an
+unchanged document set. Results of retrieve_docs and retrieve_context are
+cached under the chat, the version of its index, the embedding model, the
+retrieval parameters and the normalised query. The index version is
+ChatVectorIndex.last_updated, which every stored or deleted batch of chunks
+(see adjust_chunk_count in chat/ingest.py), every finished re-index and every
+attach or detach moves forward, so stale entries are never served, not even
+while a document is still being indexed. They simply age out.
+
+A small in-process LRU answers repeats within a worker; the Django cache
+shares entries between workers when it is a shared backend.
+"""
+
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, List, Optional
+
+from django.core.cache import cache
+
+from langchain.docstore.document import Document
+
+from .config import RETRIEVAL_CACHE_SHARED, RETRIEVAL_CACHE_SIZE, RETRIEVAL_CACHE_TTL
+from .embedding_cache import text_hash
+
+logger = logging.getLogger(__name__)
+
+
+def _copy(documents: List[Document]) -> List[Document]:
+    """Callers may edit metadata or content; never hand out cached objects"""
+    return [
+        Document(page_content=doc.page_content, metadata=dict(doc.metadata))
+        for doc in documents
+    ]
+
+
+class RetrievalCache:
+    """Two-tier cache of retrieved Documents, keyed by chat index version"""
+
+    def __init__(
+        self,
+        max_size: int = RETRIEVAL_CACHE_SIZE,
+        ttl: int = RETRIEVAL_CACHE_TTL,
+        use_shared_cache: bool = RETRIEVAL_CACHE_SHARED,
+    ):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.use_shared_cache = use_shared_cache
+        self.memory_hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def index_version(chat_id) -> Optional[str]:
+        """ChatVectorIndex.last_updated of the chat, or None if not indexed"""
+        from .models import ChatVectorIndex
+
+        last_updated = (
+            ChatVectorIndex.objects.filter(chat_id=chat_id)
+            .values_list("last_updated", flat=True)
+            .first()
+        )
+        return last_updated.isoformat() if last_updated else None
+
+    @staticmethod
+    def make_key(chat_id, version: str, params: tuple, query: str) -> str:
+        # Case is dropped too: the embedding model is uncased and full-text
+        # search folds case, so both retrieve the same chunks
+        params_part = ":".join(str(param) for param in params)
+        return (
+            f"rag_retrieval:{chat_id}:{version}:{params_part}:"
+            f"{text_hash(query.lower())}"
+        )
+
+    def get_or_retrieve(
+        self,
+        chat_id,
+        params: tuple,
+        query: str,
+        retrieve: Callable[[], List[Document]],
+    ) -> List[Document]:
+        """Cached documents for the query, or retrieve() and cache them.
+
+        params holds everything besides the query that changes the result
+        (embedding model, mode, k, token budget). Empty results are not
+        cached, since they usually mean the embedding backend failed.
+        """
+        version = self.index_version(chat_id)
+        if version is None:
+            return retrieve()
+
+        key = self.make_key(chat_id, version, params, query)
+        documents = self._get_local(key)
+        if documents is not None:
+            self.memory_hits += 1
+            return _copy(documents)
+
+        if self.use_shared_cache:
+            try:
+                documents = cache.get(key)
+            except Exception as e:
+                logger.warning(f"Shared retrieval cache unavailable: {e}")
+            if documents is not None:
+                self.shared_hits += 1
+                self._set_local(key, documents)
+                return _copy(documents)
+
+        self.misses += 1
+        documents = retrieve()
+        if documents:
+            self._set_local(key, _copy(documents))
+            if self.use_shared_cache:
+                try:
+                    cache.set(key, documents, timeout=self.ttl)
+                except Exception as e:
+                    logger.warning(f"Shared retrieval cache unavailable: {e}")
+        return documents
+
+    def _get_local(self, key: str) -> Optional[List[Document]]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, documents = entry
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return documents
+
+    def _set_local(self, key: str, documents: List[Document]):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, documents)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, chat_id=None):
+        """Drop in-process entries of one chat, or all of them.
+
+        Shared entries need no explicit removal: their keys carry an index
+        version that no longer matches once the chat's index changes.
+        """
+        with self._lock:
+            if chat_id is None:
+                self._entries.clear()
+                return
+            prefix = f"rag_retrieval:{chat_id}:"
+            for key in [key for key in self._entries if key.startswith(prefix)]:
+                del self._entries[key]
+
+
+retrieval_cache = RetrievalCache()
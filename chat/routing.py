@@ -0,0 +1,150 @@
+# chat/routing.py
+"""
+Document routing: the first stage of retrieval in chats with many documents.
+
+Every indexed UserDocument has a summary embedding, the normalised mean of
+its chunk embeddings (its centroid on the unit sphere), computed while the
+document is indexed. When a chat has more than RAG_ROUTING_MIN_DOCUMENTS
+documents, the query is first compared with their summaries and only the
+chunks of the RAG_ROUTING_TOP_DOCUMENTS closest documents are searched, so
+candidates from unrelated files no longer crowd out the relevant ones.
+Documents without a summary (not yet indexed) are always searched. Each
+chat's summaries are cached per process as one matrix, like the chunk
+matrices of chat/vector_cache.py.
+
+Summaries live in the built-in embedding space; chats cut over to another
+EmbeddingSpace are not routed.
+"""
+
+import threading
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+
+from .config import RAG_ROUTING_MIN_DOCUMENTS, RAG_ROUTING_TOP_DOCUMENTS
+from .vector_cache import as_array
+
+
+def _normalise(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.clip(norms, 1e-12, None)
+
+
+class SummaryAccumulator:
+    """Running sums of unit chunk vectors per document, for summary embeddings"""
+
+    def __init__(self):
+        self._sums: Dict[object, np.ndarray] = {}
+
+    def add(self, document_id, vectors: Iterable):
+        vectors = [as_array(vector) for vector in vectors]
+        if not vectors:
+            return
+        total = _normalise(np.stack(vectors)).sum(axis=0)
+        if document_id in self._sums:
+            self._sums[document_id] += total
+        else:
+            self._sums[document_id] = total
+
+    def summary(self, document_id) -> Optional[List[float]]:
+        """The document's summary embedding, or None if it had no vectors"""
+        total = self._sums.get(document_id)
+        if total is None or not np.any(total):
+            return None
+        return _normalise(total).tolist()
+
+
+def _rank(ids: List, matrix: np.ndarray, query_embedding) -> List:
+    """ids ordered by cosine similarity of their (unit) matrix row to the query"""
+    if not ids:
+        return []
+    scores = matrix @ _normalise(as_array(query_embedding))
+    return [ids[i] for i in np.argsort(-scores, kind="stable")]
+
+
+class _ChatSummaries:
+    __slots__ = ("version", "ids", "matrix", "unsummarised")
+
+    def __init__(self, version, ids, matrix, unsummarised):
+        self.version = version
+        self.ids = ids
+        self.matrix = matrix
+        self.unsummarised = unsummarised
+
+
+class SummaryCache:
+    """Per-process LRU of each chat's summary matrix.
+
+    An entry stays valid while ChatVectorIndex.last_updated is unchanged;
+    attaching, detaching and indexing documents all move it forward.
+    """
+
+    def __init__(self, max_chats: int = 256):
+        self.max_chats = max_chats
+        self._entries: "OrderedDict[str, _ChatSummaries]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, chat_id) -> Optional[_ChatSummaries]:
+        from .models import ChatVectorIndex, UserDocument
+
+        key = str(chat_id)
+        version = (
+            ChatVectorIndex.objects.filter(chat_id=chat_id)
+            .values_list("last_updated", flat=True)
+            .first()
+        )
+        if version is None:
+            self.invalidate(key)
+            return None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.version == version:
+                self._entries.move_to_end(key)
+                return entry
+
+        rows = list(
+            UserDocument.objects.filter(attachments__chat_id=chat_id).values_list(
+                "pk", "summary_embedding"
+            )
+        )
+        ids = [pk for pk, vector in rows if vector is not None]
+        matrix = (
+            _normalise(np.stack([as_array(v) for _pk, v in rows if v is not None]))
+            if ids
+            else None
+        )
+        unsummarised = [pk for pk, vector in rows if vector is None]
+        entry = _ChatSummaries(version, ids, matrix, unsummarised)
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_chats:
+                self._entries.popitem(last=False)
+        return entry
+
+    def invalidate(self, chat_id=None):
+        """Drop one chat's entry, or every entry"""
+        with self._lock:
+            if chat_id is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(str(chat_id), None)
+
+
+summary_cache = SummaryCache()
+
+
+def route(
+    chat_id,
+    query_embedding,
+    top: int = RAG_ROUTING_TOP_DOCUMENTS,
+    min_documents: int = RAG_ROUTING_MIN_DOCUMENTS,
+) -> Optional[List]:
+    """Ids of the documents to search for a query, or None to search them all"""
+    entry = summary_cache.get(chat_id)
+    if entry is None:
+        return None
+    if len(entry.ids) + len(entry.unsummarised) <= max(min_documents, top):
+        return None
+    return _rank(entry.ids, entry.matrix, query_embedding)[:top] + entry.unsummarised
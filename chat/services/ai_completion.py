@@ -7,10 +7,20 @@ from groq import Groq
 from langchain.prompts import PromptTemplate
 from langchain.prompts.example_selector import LengthBasedExampleSelector
 
-from ..config import get_default_model
-from ..rag import RAG_pipeline
+from ..config import (
+    HARD_MAX_TOKENS_API,
+    RAG_CONTEXT_TOKEN_BUDGET,
+    SAFETY_BUFFER,
+    get_default_model,
+)
+from ..context_packing import estimate_tokens, format_passage
+from ..query_condensation import build_retrieval_query
+from ..rag import get_rag_pipeline
 from .interfaces import AICompletionServiceInterface, RAGServiceInterface
 
+# Tokens of the instructions wrapped around the retrieved context
+CONTEXT_PREAMBLE_TOKENS = 60
+
 
 class AICompletionService(AICompletionServiceInterface):
     """Service for handling AI completion operations"""
@@ -129,6 +139,43 @@ class AICompletionService(AICompletionServiceInterface):
 
         return trimmed_messages
 
+    @staticmethod
+    def _estimate_prompt_tokens(messages: List[Dict]) -> int:
+        """Tokens of messages counted as enforce_token_limit does ("role: content")"""
+        return sum(
+            estimate_tokens(f"{msg['role']}: {msg['content']}") for msg in messages
+        )
+
+    def _trim_history_for_context(
+        self, messages: List[Dict], context_tokens: int
+    ) -> List[Dict]:
+        """Drop the oldest history turns until context_tokens of context fit.
+
+        The system messages and the last message (the current question) are
+        always kept.
+        """
+        room = HARD_MAX_TOKENS_API - SAFETY_BUFFER - CONTEXT_PREAMBLE_TOKENS
+        messages = list(messages)
+        dropped = 0
+        while self._estimate_prompt_tokens(messages) + context_tokens > room:
+            oldest = next(
+                (
+                    index
+                    for index, msg in enumerate(messages[:-1])
+                    if msg["role"] != "system"
+                ),
+                None,
+            )
+            if oldest is None:
+                break
+            del messages[oldest]
+            dropped += 1
+        if dropped:
+            self.logger.info(
+                f"Dropped {dropped} old messages to make room for RAG context"
+            )
+        return messages
+
     def _count_tokens(
         self, messages: List[Dict], prompt_template: PromptTemplate
     ) -> int:
@@ -182,7 +229,9 @@ class AICompletionService(AICompletionServiceInterface):
         context_str = ""
         rag_output = ""
         if await self.rag_service.get_files_rag(chat_id) and query:
-            retrieved_context_val = await sync_to_async(RAG_pipeline().retrieve_docs)(
+            # First use builds the shared pipeline, which may block; keep it off the loop
+            rag_pipeline = await sync_to_async(get_rag_pipeline)()
+            retrieved_context_val = await sync_to_async(rag_pipeline.retrieve_docs)(
                 query, chat_id=chat_id
             )
             rag_output = retrieved_context_val
@@ -253,13 +302,10 @@ class AICompletionService(AICompletionServiceInterface):
         current_messages_copy = [msg.copy() for msg in messages]
 
         if await self.rag_service.get_files_rag(chat_id) and query:
-            # Create a history string for better retrieval context
-            history_str = "\n".join(
-                [f"{m['role']}: {m['content']}" for m in current_messages_copy[:-1]]
-            )
-            # Combine history with the current query for a more informed search
-            full_query_for_retrieval = (
-                f"Conversation_history: {history_str}\n\nQuestion: {query}"
+            # The question plus what recent turns were about, within a token cap
+            # (an LLM rewrite with RAG_QUERY_REWRITE), not the whole history
+            full_query_for_retrieval = await sync_to_async(build_retrieval_query)(
+                query, current_messages_copy[:-1]
             )
 
             rag_files_debug = await self.rag_service.get_files_rag(chat_id)
@@ -267,12 +313,37 @@ class AICompletionService(AICompletionServiceInterface):
                 f"Files RAG From inside the services: {len(rag_files_debug)} files found"
             )
 
-            # Pass chat_id to retrieve_docs
+            # Pack the most relevant, non-redundant passages into the room the
+            # prompt has besides the system prompt and the user's message. The
+            # history is trimmed afterwards, and only for the context actually
+            # packed, so enforce_token_limit does not have to cut the context.
+            last = len(current_messages_copy) - 1
+            fixed_tokens = self._estimate_prompt_tokens(
+                [
+                    msg
+                    for index, msg in enumerate(current_messages_copy)
+                    if msg["role"] == "system" or index == last
+                ]
+            )
+            if not current_messages_copy or current_messages_copy[-1]["role"] != "user":
+                fixed_tokens += estimate_tokens(query)
+            token_budget = min(
+                RAG_CONTEXT_TOKEN_BUDGET,
+                HARD_MAX_TOKENS_API
+                - SAFETY_BUFFER
+                - fixed_tokens
+                - CONTEXT_PREAMBLE_TOKENS,
+            )
+
             try:
-                retrieved_docs = await sync_to_async(RAG_pipeline().retrieve_docs)(
-                    full_query_for_retrieval, chat_id=chat_id
+                rag_pipeline = await sync_to_async(get_rag_pipeline)()
+                retrieved_docs = await sync_to_async(rag_pipeline.retrieve_context)(
+                    full_query_for_retrieval, chat_id=chat_id, token_budget=token_budget
+                )
+                self.logger.info(
+                    f"RAG packed {len(retrieved_docs)} passages into a budget of "
+                    f"{token_budget} tokens"
                 )
-                self.logger.info(f"RAG retrieved {len(retrieved_docs)} documents")
 
                 if retrieved_docs:
                     # Log first document preview for debugging
@@ -285,7 +356,11 @@ class AICompletionService(AICompletionServiceInterface):
 
                     # Augment the prompt
                     context_str = "\n\n".join(
-                        [doc.page_content for doc in retrieved_docs]
+                        [format_passage(doc) for doc in retrieved_docs]
+                    )
+                    # The oldest turns give way to the packed context
+                    current_messages_copy = self._trim_history_for_context(
+                        current_messages_copy, estimate_tokens(context_str)
                     )
                     rag_info_source = (
                         f" from {attached_file_name}"
@@ -1,5 +1,6 @@
 # chat/services/container.py
-from typing import Any, Dict, Type, TypeVar, Union
+import threading
+from typing import Any, Callable, Dict, Type, TypeVar, Union
 
 T = TypeVar("T")
 
@@ -10,11 +11,26 @@ class ServiceContainer:
     def __init__(self):
         self._services: Dict[Union[str, Type], Any] = {}
         self._singletons: Dict[Union[str, Type], Any] = {}
+        self._factories: Dict[Union[str, Type], Callable[[], Any]] = {}
+        self._lock = threading.Lock()
 
     def register_singleton(self, interface: Union[str, Type], implementation: Any):
         """Register a singleton service"""
         self._singletons[interface] = implementation
 
+    def register_lazy_singleton(
+        self, interface: Union[str, Type], factory: Callable[[], Any]
+    ):
+        """Register a singleton built by factory on first use.
+
+        Construction happens once per process even when several threads ask
+        for the service at the same time. Registering an interface that is
+        already registered is a no-op.
+        """
+        with self._lock:
+            if interface not in self._singletons:
+                self._factories.setdefault(interface, factory)
+
     def register(self, interface: Union[str, Type], implementation: Any):
         """Register a service (new instance each time)"""
         self._services[interface] = implementation
@@ -25,6 +41,16 @@ class ServiceContainer:
         if interface in self._singletons:
             return self._singletons[interface]
 
+        # Build lazy singletons once, under the lock
+        if interface in self._factories:
+            with self._lock:
+                if interface not in self._singletons:
+                    # Drop the factory only once the instance exists, so other
+                    # threads keep finding the registration meanwhile
+                    self._singletons[interface] = self._factories[interface]()
+                    del self._factories[interface]
+            return self._singletons[interface]
+
         # Check regular services
         if interface in self._services:
             service_class = self._services[interface]
@@ -36,7 +62,11 @@ class ServiceContainer:
 
     def has(self, interface: Union[str, Type]) -> bool:
         """Check if a service is registered"""
-        return interface in self._services or interface in self._singletons
+        return (
+            interface in self._services
+            or interface in self._singletons
+            or interface in self._factories
+        )
 
 
 # Global container instance
@@ -6,8 +6,8 @@ from typing import Any, Dict, Optional
 
 from django.core.files.storage import default_storage
 
-from pdfminer.high_level import extract_text
-
+from ..config import INLINE_PDF_MAX_PAGES
+from ..extraction import extraction_service
 from .interfaces import FileProcessingServiceInterface
 
 
@@ -36,8 +36,17 @@ class FileProcessingService(FileProcessingServiceInterface):
         try:
             extracted_text_for_counting = ""
             if file_extension == ".pdf":
-                uploaded_file.seek(0)
-                raw_text = extract_text(uploaded_file.file)
+                # Extracted in the shared process pool, off the request thread.
+                # Large uploads are spooled to disk by Django; pass the path
+                # rather than pickling the bytes to the workers.
+                if hasattr(uploaded_file, "temporary_file_path"):
+                    source = uploaded_file.temporary_file_path()
+                else:
+                    uploaded_file.seek(0)
+                    source = uploaded_file.read()
+                raw_text = extraction_service.extract_pdf_text(
+                    source, max_pages=INLINE_PDF_MAX_PAGES
+                )
                 extracted_text_for_counting = raw_text.strip() if raw_text else ""
             elif file_extension == ".txt":
                 uploaded_file.seek(0)
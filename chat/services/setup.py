@@ -4,6 +4,7 @@ Service container setup and configuration.
 This module initializes and configures all services with proper dependency injection.
 """
 
+from ..rag import RAG_pipeline
 from .ai_completion import AICompletionService
 from .container import get_container
 from .diagram_service import DiagramService
@@ -36,6 +37,9 @@ def setup_services():
     container.register_singleton(YouTubeServiceInterface, YouTubeService())
     container.register_singleton(QuizServiceInterface, QuizService())
 
+    # One retrieval pipeline per process, built on first use (or at boot warm-up)
+    container.register_lazy_singleton(RAG_pipeline, RAG_pipeline)
+
     # AI Completion Service depends on RAG Service
     rag_service = container.get(RAGServiceInterface)
     container.register_singleton(
@@ -0,0 +1,34 @@
+# chat/signals.py
+"""
+Keep in-memory retrieval state in step with the chat's documents.
+
+Retrieval caches are keyed by ChatVectorIndex.last_updated. Deleting a
+ChatRAGFile detaches its document from the chat without re-indexing, so the
+index row is touched here to move the version forward. Index changes also drop this
+process's cached entries for the chat right away.
+"""
+
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .models import ChatRAGFile, ChatVectorIndex
+from .retrieval_cache import retrieval_cache
+from .vector_cache import chat_matrix_cache
+
+
+@receiver(post_delete, sender=ChatRAGFile)
+def touch_index_on_file_delete(sender, instance, **kwargs):
+    # update() skips auto_now, so set the timestamp explicitly
+    ChatVectorIndex.objects.filter(chat_id=instance.chat_id).update(
+        last_updated=timezone.now()
+    )
+    retrieval_cache.invalidate(instance.chat_id)
+    chat_matrix_cache.invalidate(instance.chat_id)
+
+
+@receiver(post_save, sender=ChatVectorIndex)
+@receiver(post_delete, sender=ChatVectorIndex)
+def drop_cached_retrieval(sender, instance, **kwargs):
+    retrieval_cache.invalidate(instance.chat_id)
+    chat_matrix_cache.invalidate(instance.chat_id)
@@ -2018,6 +2018,7 @@ document.addEventListener("DOMContentLoaded", function () {
           "rag-file-item flex items-center justify-between bg-gray-700 p-2 rounded-md text-sm hover:bg-gray-600/80 transition-colors";
         fileEl.innerHTML = `
           <span class=\"text-gray-200 truncate max-w-[80%]\" title=\"${file.name}\">${file.name}</span>
+          ${ragIndexStatusBadge(file)}
           <button class=\"delete-rag-file-btn p-1 text-red-400 hover:text-red-300 rounded-full focus:outline-none focus:ring-2 focus:ring-red-500 focus:ring-opacity-50\" data-file-id=\"${file.id}\" title=\"Remove from RAG context\">
             <svg xmlns=\"http://www.w3.org/2000/svg\" class=\"h-4 w-4\" fill=\"none\" viewBox=\"0 0 24 24\" stroke=\"currentColor\" stroke-width=\"2\">
               <path stroke-linecap=\"round\" stroke-linejoin=\"round\" d=\"M6 18L18 6M6 6l12 12\" />
@@ -2036,6 +2037,52 @@ document.addEventListener("DOMContentLoaded", function () {
     updateRAGFileLimitView();
   }
 
+  // Small badge describing background indexing progress of a RAG file
+  function ragIndexStatusBadge(file) {
+    if (!file.status || file.status === "done") return "";
+    if (file.status === "failed") {
+      const reason = file.error ? ` title="${file.error}"` : "";
+      return `<span class="text-xs text-red-400"${reason}>Failed</span>`;
+    }
+    let label = file.status === "queued" ? "Queued" : "Indexing";
+    if (file.chunks_total) {
+      label += ` ${file.chunks_indexed}/${file.chunks_total}`;
+    }
+    return `<span class="text-xs text-blue-400 animate-pulse">${label}</span>`;
+  }
+
+  // Poll the indexing status endpoint until the file is done or failed
+  async function pollRAGIndexingStatus(statusUrl, fileName) {
+    const POLL_INTERVAL_MS = 1500;
+    while (true) {
+      await new Promise((resolve) => setTimeout(resolve, POLL_INTERVAL_MS));
+      let status;
+      try {
+        const response = await fetch(statusUrl);
+        if (!response.ok) return; // File deleted or chat changed
+        status = await response.json();
+      } catch (error) {
+        console.error("Error polling RAG indexing status:", error);
+        return;
+      }
+      fetchRAGFiles();
+      if (status.status === "done") {
+        appendSystemNotification(
+          `'${fileName}' is indexed and ready to use.`,
+          "success",
+        );
+        return;
+      }
+      if (status.status === "failed") {
+        appendSystemNotification(
+          `Indexing '${fileName}' failed: ${status.error || "unknown error"}`,
+          "error",
+        );
+        return;
+      }
+    }
+  }
+
   function updateRAGFileLimitView() {
     if (
       !ragFileCountSpan ||
@@ -2208,10 +2255,13 @@ document.addEventListener("DOMContentLoaded", function () {
 
       if (data.success && data.file) {
         appendSystemNotification(
-          `Successfully added '${data.file.name}' to context.`,
-          "success",
+          `Uploaded '${data.file.name}', indexing in the background.`,
+          "info",
         );
         fetchRAGFiles(); // Refresh the list
+        if (data.status_url) {
+          pollRAGIndexingStatus(data.status_url, data.file.name);
+        }
       } else {
         throw new Error(
           data.error || "Upload completed but response format was unexpected.",
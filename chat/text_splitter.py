@@ -0,0 +1,221 @@
+# chat/text_splitter.py
+"""
+Recursive character text splitting over offsets.
+
+RecursiveTextSplitter produces the same chunks as LangChain's
+RecursiveCharacterTextSplitter with its defaults (separators kept at the start
+of the following piece, whitespace stripped from chunks). It tries the
+separators in order ("\\n\\n", then "\\n", then " ", then single characters),
+splitting pieces that are still too long with the next separator, and merges
+consecutive pieces into chunks of at most chunk_size characters that repeat up
+to chunk_overlap characters of the previous chunk.
+
+Pieces and chunks are (start, end) spans into the one input string. Because
+separators stay attached to the pieces, every chunk is a contiguous slice of
+the input, so no intermediate strings are built. Text is only copied when a
+caller slices out a chunk.
+"""
+
+from collections import deque
+from typing import Iterator, List, Optional, Sequence, Tuple
+
+DEFAULT_SEPARATORS = ("\n\n", "\n", " ", "")
+
+Span = Tuple[int, int]
+
+
+class RecursiveTextSplitter:
+    def __init__(
+        self,
+        chunk_size: int = 1000,
+        chunk_overlap: int = 100,
+        separators: Optional[Sequence[str]] = None,
+        strip_whitespace: bool = True,
+    ):
+        if chunk_overlap > chunk_size:
+            raise ValueError(
+                f"Got a larger chunk overlap ({chunk_overlap}) than chunk size "
+                f"({chunk_size}), should be smaller."
+            )
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        self.separators = tuple(separators or DEFAULT_SEPARATORS)
+        self.strip_whitespace = strip_whitespace
+
+    def split_text(self, text: str) -> List[str]:
+        """Chunks of text as strings"""
+        return [text[start:end] for start, end in self.iter_spans(text)]
+
+    def iter_spans(
+        self, text: str, start: int = 0, end: Optional[int] = None
+    ) -> Iterator[Span]:
+        """Lazily yield the (start, end) span of each chunk of text[start:end]"""
+        end = len(text) if end is None else end
+        return self._split(text, start, end, 0)
+
+    def _split(self, text: str, start: int, end: int, level: int) -> Iterator[Span]:
+        # The first separator (from level on) that occurs in the span; pieces
+        # that are still too long are split with the separators after it
+        separator = self.separators[-1]
+        next_level = None
+        for index in range(level, len(self.separators)):
+            candidate = self.separators[index]
+            if candidate == "":
+                separator = candidate
+                break
+            if text.find(candidate, start, end) != -1:
+                separator = candidate
+                next_level = index + 1
+                break
+
+        if len(separator) == 1:
+            yield from self._split_single(text, start, end, separator, next_level)
+            return
+
+        run = _ChunkMerger(text, self)
+        for piece_start, piece_end in _pieces(text, start, end, separator):
+            if piece_end - piece_start < self.chunk_size:
+                chunk = run.add(piece_start, piece_end)
+                if chunk is not None:
+                    yield chunk
+                continue
+            chunk = run.flush()
+            if chunk is not None:
+                yield chunk
+            yield from self._long_piece(text, piece_start, piece_end, next_level)
+        chunk = run.flush()
+        if chunk is not None:
+            yield chunk
+
+    def _long_piece(self, text, start, end, next_level) -> Iterator[Span]:
+        """A piece of at least chunk_size: split further, or kept as is"""
+        if next_level is None or next_level >= len(self.separators):
+            yield start, end
+        else:
+            yield from self._split(text, start, end, next_level)
+
+    def _split_single(
+        self, text: str, start: int, end: int, separator: str, next_level
+    ) -> Iterator[Span]:
+        """_split for a one-character separator, without visiting every piece.
+
+        Pieces start at the span start and at each separator. Rather than
+        adding pieces one by one, each chunk is extended straight to the last
+        piece boundary within chunk_size (rfind), and the overlap kept for the
+        next chunk starts at the first boundary that satisfies the merge rule
+        (find). A single character cannot overlap itself, so boundaries found
+        from either direction are the same ones a left-to-right split yields.
+        """
+        size = self.chunk_size
+        strip = self.strip_whitespace
+
+        def next_boundary(position):
+            found = text.find(separator, position + 1, end)
+            return end if found == -1 else found
+
+        current = None  # start of the pieces being merged, if any
+        position = start  # end of those pieces / start of the next one
+        while position < end:
+            if current is None:
+                following = next_boundary(position)
+                if following - position >= size:
+                    yield from self._long_piece(text, position, following, next_level)
+                else:
+                    current = position
+                position = following
+                continue
+
+            if end - current <= size:
+                position = end
+                break
+            # Last boundary that keeps the chunk within size. Pieces before it
+            # are all shorter than size, as they lie inside the window.
+            position = text.rfind(separator, position, current + size + 1)
+            following = next_boundary(position)
+
+            chunk = _strip(text, current, position, strip)
+            if chunk is not None:
+                yield chunk
+            if following - position >= size:
+                current = None
+                yield from self._long_piece(text, position, following, next_level)
+            else:
+                # Keep the trailing pieces that fit as overlap and leave room
+                # for the next piece
+                low = max(position - self.chunk_overlap, following - size, current + 1)
+                current = text.find(separator, low, position + 1)
+            position = following
+
+        if current is not None:
+            chunk = _strip(text, current, position, strip)
+            if chunk is not None:
+                yield chunk
+
+
+def _strip(text: str, start: int, end: int, strip_whitespace: bool) -> Optional[Span]:
+    """Span without surrounding whitespace, or None if nothing is left"""
+    if strip_whitespace:
+        while start < end and text[start].isspace():
+            start += 1
+        while end > start and text[end - 1].isspace():
+            end -= 1
+    return (start, end) if end > start else None
+
+
+def _pieces(text: str, start: int, end: int, separator: str) -> Iterator[Span]:
+    """Split a span before each occurrence of separator (or into characters)"""
+    if separator == "":
+        for offset in range(start, end):
+            yield offset, offset + 1
+        return
+
+    piece_start = start
+    position = text.find(separator, start, end)
+    while position != -1:
+        if position > piece_start:
+            yield piece_start, position
+        piece_start = position
+        position = text.find(separator, position + len(separator), end)
+    if end > piece_start:
+        yield piece_start, end
+
+
+class _ChunkMerger:
+    """Merge consecutive pieces into chunks with overlap (LangChain's
+    _merge_splits with an empty separator)"""
+
+    def __init__(self, text: str, splitter: RecursiveTextSplitter):
+        self.text = text
+        self.chunk_size = splitter.chunk_size
+        self.chunk_overlap = splitter.chunk_overlap
+        self.strip_whitespace = splitter.strip_whitespace
+        self.current = deque()
+        self.total = 0
+
+    def add(self, start: int, end: int) -> Optional[Span]:
+        """Add the next piece; returns the chunk it completed, if any"""
+        length = end - start
+        chunk = None
+        if self.total + length > self.chunk_size and self.current:
+            chunk = self._chunk()
+            # Drop pieces from the front until what is left fits as overlap
+            while self.total > self.chunk_overlap or (
+                self.total + length > self.chunk_size and self.total > 0
+            ):
+                first_start, first_end = self.current.popleft()
+                self.total -= first_end - first_start
+        self.current.append((start, end))
+        self.total += length
+        return chunk
+
+    def flush(self) -> Optional[Span]:
+        """The chunk of the pieces added so far, then start over"""
+        chunk = self._chunk() if self.current else None
+        self.current.clear()
+        self.total = 0
+        return chunk
+
+    def _chunk(self) -> Optional[Span]:
+        return _strip(
+            self.text, self.current[0][0], self.current[-1][1], self.strip_whitespace
+        )
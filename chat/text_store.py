@@ -0,0 +1,163 @@
+# chat/text_store.py
+"""
+Stored extracted text, so files are parsed once.
+
+Text extraction (pdfminer) is the most CPU-intensive step of indexing. Its
+output is kept in ExtractedText, keyed by the file's content hash: one JSON
+[page, text] line per page, zlib-compressed as a single stream. The next
+time the same file is indexed (a re-index, a chunk size or embedding model
+change, or the same file uploaded by someone else) the pages are read back
+and decompressed incrementally instead of extracted again.
+
+Text is recorded while the file is being extracted for indexing and saved
+only once every page has gone through. Rows are tied to the extractor and
+its settings (extractor_key), so changing those makes files extract afresh.
+The backfill_extracted_text management command stores text for files
+indexed before this existed and prunes rows no document uses; the
+reindex_documents command re-chunks and re-embeds documents from it after a
+chunking or embedding model change.
+"""
+
+import json
+import logging
+import zlib
+from typing import Callable, Iterable, Iterator, Optional, Tuple
+
+from django.db import IntegrityError
+
+from .config import (
+    EXTRACTED_TEXT_COMPRESSION_LEVEL,
+    EXTRACTED_TEXT_FILE_TYPES,
+    EXTRACTED_TEXT_STORE,
+    PDF_MAX_PAGES,
+)
+
+logger = logging.getLogger(__name__)
+
+# Bump when extraction changes in a way that alters its output
+EXTRACTOR_VERSION = 1
+
+# Compressed bytes fed to the decompressor at a time
+READ_SIZE = 64 * 1024
+
+Pages = Iterable[Tuple[Optional[int], str]]
+
+
+def extractor_key(file_type: str) -> str:
+    """The extractor and the settings that shape its output"""
+    if file_type == "pdf":
+        return f"pdfminer-v{EXTRACTOR_VERSION}-max{PDF_MAX_PAGES}"
+    return f"text-v{EXTRACTOR_VERSION}"
+
+
+def stores(file_type: str) -> bool:
+    return EXTRACTED_TEXT_STORE and file_type in EXTRACTED_TEXT_FILE_TYPES
+
+
+class PageEncoder:
+    """Compresses (page_number, text) pairs into one stream as they come"""
+
+    def __init__(self):
+        self._compressor = zlib.compressobj(EXTRACTED_TEXT_COMPRESSION_LEVEL)
+        self._parts = []
+        self.pages = 0
+        self.chars = 0
+
+    def add(self, page_number: Optional[int], text: str):
+        # json.dumps escapes newlines, so one page is one line
+        line = json.dumps([page_number, text], ensure_ascii=False) + "\n"
+        self._parts.append(self._compressor.compress(line.encode("utf-8")))
+        self.pages += 1
+        self.chars += len(text)
+
+    def finish(self) -> bytes:
+        self._parts.append(self._compressor.flush())
+        return b"".join(self._parts)
+
+
+def iter_stored_pages(data) -> Iterator[Tuple[Optional[int], str]]:
+    """Yield (page_number, text) from a PageEncoder stream, page by page"""
+    data = memoryview(data)
+    decompressor = zlib.decompressobj()
+    pending = b""
+    for offset in range(0, len(data), READ_SIZE):
+        pending += decompressor.decompress(data[offset : offset + READ_SIZE])
+        *lines, pending = pending.split(b"\n")
+        for line in lines:
+            page_number, text = json.loads(line)
+            yield page_number, text
+    pending += decompressor.flush()
+    for line in pending.split(b"\n"):
+        if line:
+            page_number, text = json.loads(line)
+            yield page_number, text
+
+
+def load(content_hash: str, file_type: str):
+    """The stored stream of a file, or None"""
+    from .models import ExtractedText
+
+    return (
+        ExtractedText.objects.filter(
+            content_hash=content_hash,
+            file_type=file_type,
+            extractor=extractor_key(file_type),
+        )
+        .values_list("data", flat=True)
+        .first()
+    )
+
+
+def is_stored(content_hash: str, file_type: str) -> bool:
+    """Whether the text of a file is stored and would be used"""
+    from .models import ExtractedText
+
+    return (
+        bool(content_hash)
+        and stores(file_type)
+        and ExtractedText.objects.filter(
+            content_hash=content_hash,
+            file_type=file_type,
+            extractor=extractor_key(file_type),
+        ).exists()
+    )
+
+
+def save(content_hash: str, file_type: str, data: bytes, pages: int, chars: int):
+    """Store a file's text; a concurrent save of the same file wins"""
+    from .models import ExtractedText
+
+    try:
+        ExtractedText.objects.get_or_create(
+            content_hash=content_hash,
+            file_type=file_type,
+            extractor=extractor_key(file_type),
+            defaults={"data": data, "pages": pages, "text_chars": chars},
+        )
+    except IntegrityError:
+        pass
+
+
+def _recording(pages: Pages, content_hash: str, file_type: str):
+    """Pass pages through, saving them once the last one has been read"""
+    encoder = PageEncoder()
+    for page_number, text in pages:
+        encoder.add(page_number, text)
+        yield page_number, text
+    try:
+        save(content_hash, file_type, encoder.finish(), encoder.pages, encoder.chars)
+    except Exception as e:
+        # Indexing goes on; the file is simply extracted again next time
+        logger.warning(f"Could not store extracted text of {content_hash}: {e}")
+
+
+def document_pages(
+    content_hash: Optional[str], file_type: str, extract: Callable[[], Pages]
+) -> Pages:
+    """Pages of a file: stored if available, else extract() (and store them)"""
+    if not content_hash or not stores(file_type):
+        return extract()
+    data = load(content_hash, file_type)
+    if data is not None:
+        return iter_stored_pages(data)
+    return _recording(extract(), content_hash, file_type)
@@ -0,0 +1,44 @@
+# chat/uploads.py
+"""
+Content fingerprints for uploaded files.
+
+HashingUploadHandler runs first in FILE_UPLOAD_HANDLERS and hashes each file
+as its chunks stream in, passing the data on unchanged to Django's memory or
+temporary-file handler. The digest and size end up in
+request.upload_fingerprints, keyed by form field name.
+"""
+
+import hashlib
+from typing import Tuple
+
+from django.core.files.uploadhandler import FileUploadHandler
+
+
+class HashingUploadHandler(FileUploadHandler):
+    """Compute the SHA-256 and size of each uploaded file while it is read"""
+
+    def new_file(self, field_name, *args, **kwargs):
+        super().new_file(field_name, *args, **kwargs)
+        self._digest = hashlib.sha256()
+
+    def receive_data_chunk(self, raw_data, start):
+        self._digest.update(raw_data)
+        return raw_data  # Let the next handler store the data
+
+    def file_complete(self, file_size):
+        if self.request is not None:
+            fingerprints = getattr(self.request, "upload_fingerprints", {})
+            fingerprints[self.field_name] = (self._digest.hexdigest(), file_size)
+            self.request.upload_fingerprints = fingerprints
+        return None  # The next handler returns the uploaded file
+
+
+def file_fingerprint(file_path, chunk_size: int = 1024 * 1024) -> Tuple[str, int]:
+    """(sha256 hex digest, size in bytes) of a file on disk"""
+    digest = hashlib.sha256()
+    size = 0
+    with open(file_path, "rb") as fh:
+        for block in iter(lambda: fh.read(chunk_size), b""):
+            digest.update(block)
+            size += len(block)
+    return digest.hexdigest(), size
@@ -5,13 +5,17 @@ from .views import (
     ChatRAGFilesView,
     ChatStreamView,
     ChatView,
+    attach_library_document,
     chat_quiz,
     clear_chat,
     create_chat,
+    delete_library_document,
     edit_message,
     generate_flashcards_view,
     get_quiz_html,
+    list_documents,
     list_rag_files,
+    rag_file_status,
     serve_diagram_image,
     study_hub_view,
     update_chat_title,
@@ -38,6 +42,22 @@ urlpatterns = [
         ChatRAGFilesView.as_view(),
         name="delete_rag_file",
     ),
+    path(
+        "<uuid:chat_id>/rag-files/<int:file_id>/status/",
+        rag_file_status,
+        name="rag_file_status",
+    ),
+    path(
+        "<uuid:chat_id>/rag-files/attach/<int:document_id>/",
+        attach_library_document,
+        name="attach_library_document",
+    ),
+    path("documents/", list_documents, name="list_documents"),
+    path(
+        "documents/<int:document_id>/delete/",
+        delete_library_document,
+        name="delete_library_document",
+    ),
     path(
         "<uuid:chat_id>/message/<int:message_id>/edit/",
         edit_message,
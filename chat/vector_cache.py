@@ -0,0 +1,216 @@
+# chat/vector_cache.py
+"""
+In-process vector search for chats with few chunks.
+
+Most chats hold a few hundred to a few thousand chunks. For those, a query
+against pgvector costs more in the round trip than in the search itself. The
+ChatMatrixCache keeps each chat's embeddings as a contiguous float32 matrix of
+unit rows and ranks them with a single matrix-vector product. An entry stays
+valid while ChatVectorIndex.last_updated is unchanged, so checking freshness
+costs one primary-key lookup per query. Chats above VECTOR_MATRIX_MAX_CHUNKS
+are left to pgvector.
+"""
+
+import logging
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from .config import (
+    EMBEDDING_DIMENSIONS,
+    VECTOR_MATRIX_CACHE_MB,
+    VECTOR_MATRIX_MAX_CHUNKS,
+)
+
+logger = logging.getLogger(__name__)
+
+
+def as_array(value) -> np.ndarray:
+    """float32 array from a VectorField (ndarray) or HalfVectorField value"""
+    if hasattr(value, "to_numpy"):
+        value = value.to_numpy()
+    return np.asarray(value, dtype=np.float32)
+
+
+class ChatMatrix:
+    """Unit-normalised embeddings of one chat and the chunk ids of their rows.
+
+    space_id is the EmbeddingSpace the vectors come from (None for the
+    built-in columns of DocumentChunk). document_ids holds the UserDocument
+    of each row, for searches restricted to some documents.
+    """
+
+    __slots__ = ("ids", "matrix", "version", "space_id", "document_ids")
+
+    def __init__(
+        self,
+        ids: List,
+        matrix: np.ndarray,
+        version,
+        space_id=None,
+        document_ids: Optional[np.ndarray] = None,
+    ):
+        self.ids = ids
+        self.matrix = matrix
+        self.version = version
+        self.space_id = space_id
+        self.document_ids = document_ids
+
+    @property
+    def nbytes(self) -> int:
+        return self.matrix.nbytes
+
+
+class ChatMatrixCache:
+    """Per-process LRU of ChatMatrix entries, bounded by total matrix size"""
+
+    def __init__(
+        self,
+        max_chunks: int = VECTOR_MATRIX_MAX_CHUNKS,
+        max_bytes: int = VECTOR_MATRIX_CACHE_MB * 1024 * 1024,
+    ):
+        self.max_chunks = max_chunks
+        self.max_bytes = max_bytes
+        self.loads = 0
+        self._entries: "OrderedDict[str, ChatMatrix]" = OrderedDict()
+        # Versions of chats found too large, so they are not recounted per query
+        self._too_large: Dict[str, object] = {}
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def search(
+        self, chat_id, query_embedding, k: int, space_id=None, document_ids=None
+    ) -> Optional[List[Tuple[object, float]]]:
+        """(chunk pk, cosine distance) of the k nearest chunks, best first.
+
+        document_ids, when given, limits the search to chunks of those
+        documents. space_id is the space the query was embedded for, which is
+        not always the chat's (see _chat_space in chat/rag.py). Returns None
+        when the chat is not served from memory (no index yet or more than
+        max_chunks chunks) and the caller should query the database.
+        """
+        entry = self.get(chat_id, space_id)
+        if entry is None:
+            return None
+        if not entry.ids or k <= 0:
+            return []
+
+        query = as_array(query_embedding)
+        norm = np.linalg.norm(query)
+        if norm:
+            query = query / norm
+        scores = entry.matrix @ query
+
+        allowed = len(entry.ids)
+        if document_ids is not None:
+            mask = np.isin(entry.document_ids, list(document_ids))
+            allowed = int(mask.sum())
+            if not allowed:
+                return []
+            scores = np.where(mask, scores, -np.inf)
+
+        k = min(k, allowed)
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(entry.ids[i], float(1.0 - scores[i])) for i in top]
+
+    def get(self, chat_id, space_id=None) -> Optional[ChatMatrix]:
+        """The chat's matrix in a space, (re)loaded if its index changed since caching"""
+        from .models import ChatVectorIndex
+
+        key = str(chat_id)
+        version = (
+            ChatVectorIndex.objects.filter(chat_id=chat_id)
+            .values_list("last_updated", flat=True)
+            .first()
+        )
+        if version is None:
+            self.invalidate(key)
+            return None
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if (
+                entry is not None
+                and entry.version == version
+                and entry.space_id == space_id
+            ):
+                self._entries.move_to_end(key)
+                return entry
+            if self._too_large.get(key) == (version, space_id):
+                return None
+
+        entry = self._load(chat_id, version, space_id)
+        with self._lock:
+            if entry is None:
+                self._too_large[key] = (version, space_id)
+                self._discard(key)
+            else:
+                self._store(key, entry)
+        return entry
+
+    def _load(self, chat_id, version, space_id=None) -> Optional[ChatMatrix]:
+        from .models import ChunkEmbedding, DocumentChunk
+
+        if space_id is None:
+            column = DocumentChunk.vector_column()
+            vectors = DocumentChunk.for_chat(chat_id).filter(
+                **{f"{column}__isnull": False}
+            )
+            fields = ("pk", column, "document_id")
+        else:
+            vectors = ChunkEmbedding.objects.filter(
+                space_id=space_id, chunk__in=DocumentChunk.for_chat(chat_id)
+            )
+            fields = ("chunk_id", "embedding", "chunk__document_id")
+        if vectors.count() > self.max_chunks:
+            return None
+
+        rows = list(vectors.values_list(*fields))
+        dimensions = len(rows[0][1]) if rows else EMBEDDING_DIMENSIONS
+        matrix = np.empty((len(rows), dimensions), dtype=np.float32)
+        for index, (_pk, vector, _document_id) in enumerate(rows):
+            matrix[index] = as_array(vector)
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        matrix /= np.clip(norms, 1e-12, None)
+
+        self.loads += 1
+        logger.debug(f"Loaded {len(rows)} embeddings of chat {chat_id} into memory")
+        return ChatMatrix(
+            [pk for pk, _vector, _document_id in rows],
+            matrix,
+            version,
+            space_id,
+            np.array([document_id for _pk, _vector, document_id in rows]),
+        )
+
+    def _store(self, key: str, entry: ChatMatrix):
+        self._discard(key)
+        self._too_large.pop(key, None)
+        self._entries[key] = entry
+        self._bytes += entry.nbytes
+        # Keep at least the entry just loaded, even if it alone is over budget
+        while self._bytes > self.max_bytes and len(self._entries) > 1:
+            _key, evicted = self._entries.popitem(last=False)
+            self._bytes -= evicted.nbytes
+
+    def _discard(self, key: str):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= entry.nbytes
+
+    def invalidate(self, chat_id=None):
+        """Drop one chat's entry, or every entry"""
+        with self._lock:
+            if chat_id is None:
+                self._entries.clear()
+                self._too_large.clear()
+                self._bytes = 0
+            else:
+                self._discard(str(chat_id))
+                self._too_large.pop(str(chat_id), None)
+
+
+chat_matrix_cache = ChatMatrixCache()
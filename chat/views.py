@@ -10,10 +10,11 @@ import time
 
 from django.conf import settings
 from django.contrib.auth.decorators import login_required
-from django.core.files.storage import default_storage
-from django.db import close_old_connections
+from django.db import IntegrityError, close_old_connections
+from django.db.models import Count
 from django.http import Http404, HttpResponse, JsonResponse, StreamingHttpResponse
 from django.shortcuts import get_object_or_404, redirect, render
+from django.urls import reverse
 from django.utils import timezone
 from django.utils.decorators import method_decorator
 from django.utils.safestring import mark_safe
@@ -29,17 +30,18 @@ from pydantic import BaseModel
 
 from .agent_system import ChatAgentSystem
 from .ai_models import AIService
-from .config import get_gemini_model
+from .config import MAX_RAG_FILES, get_gemini_model
+from .indexing import claim_document, indexing_worker
+from .ingest import attach_document, delete_document, detach_rag_file
 from .models import (
     Chat,
     ChatRAGFile,
     ChatVectorIndex,
     DiagramImage,
-    DocumentChunk,
     Message,
+    UserDocument,
 )
 from .preference_service import PreferenceService
-from .rag import RAG_pipeline
 from .services import (
     AICompletionServiceInterface,
     FileProcessingServiceInterface,
@@ -318,9 +320,13 @@ class ChatStreamView(View):
             llm_query_content = user_typed_prompt
 
             if uploaded_file:
-                file_info_for_llm = chat_service.extract_text_from_uploaded_file(
-                    uploaded_file
-                )
+                # PDF extraction waits on the process pool for up to
+                # PDF_EXTRACTION_TIMEOUT; keep it off the event loop. It does not
+                # touch the database, so it need not queue behind ORM calls.
+                file_info_for_llm = await sync_to_async(
+                    chat_service.extract_text_from_uploaded_file,
+                    thread_sensitive=False,
+                )(uploaded_file)
                 llm_query_content = (
                     f"{user_typed_prompt}\n\n"
                     f"Here is the complete text content extracted from the uploaded file '{file_info_for_llm['filename']}':\n\n"
@@ -1363,14 +1369,69 @@ def edit_message(request, chat_id, message_id):
         return JsonResponse({"error": f"Could not edit message: {str(e)}"}, status=500)
 
 
+def _document_status_data(document):
+    return {
+        "id": str(document.id),
+        "name": document.original_filename,
+        "status": document.index_status,
+        "chunks_indexed": document.chunks_indexed,
+        "chunks_total": document.chunks_total,
+        "error": document.index_error or None,
+    }
+
+
+def _rag_file_status_data(rag_file):
+    """Status of a chat attachment; indexing state lives on its document"""
+    return {
+        **_document_status_data(rag_file.document),
+        "id": str(rag_file.id),
+        "document_id": str(rag_file.document_id),
+        "name": rag_file.original_filename,
+    }
+
+
+def _attach_to_chat(chat, document):
+    """Attach a library document, re-queueing it unless it is done or running.
+
+    A failed document, or one whose indexing stopped (e.g. with a restart),
+    is claimed and queued again; one still being indexed is left to its job.
+    If the chat was cut over to an embedding space, chunks of the document
+    that predate the space are embedded into it in the background.
+    """
+    retry = document.index_status != "done" and claim_document(
+        document.pk, retry_failed=True
+    )
+    rag_file = attach_document(chat, document)
+    if retry:
+        indexing_worker.submit(document.id)
+    space_id = (
+        ChatVectorIndex.objects.filter(chat=chat)
+        .values_list("embedding_space_id", flat=True)
+        .first()
+    )
+    if space_id is not None:
+        indexing_worker.submit_space_vectors(space_id, document.id)
+    return rag_file
+
+
+def _rag_file_response(chat_id, rag_file, status):
+    return JsonResponse(
+        {
+            "success": True,
+            "job_id": str(rag_file.id),
+            "status_url": reverse("rag_file_status", args=[chat_id, rag_file.id]),
+            "file": _rag_file_status_data(rag_file),
+        },
+        status=status,
+    )
+
+
 def list_rag_files(request, chat_id):
+    indexing_worker.requeue_stale()
     try:
         chat = get_object_or_404(Chat, id=chat_id, user=request.user)
-        rag_files = chat.rag_files.all().order_by("-uploaded_at")
-        files_data = [
-            {"id": str(rag_file.id), "name": rag_file.original_filename}
-            for rag_file in rag_files
-        ]
+        rag_files = chat.rag_files.select_related("document").order_by("-uploaded_at")
+        files_data = [_rag_file_status_data(rag_file) for rag_file in rag_files]
         return JsonResponse(files_data, safe=False)
     except Chat.DoesNotExist:
         return JsonResponse({"error": "Chat not found"}, status=404)
@@ -1379,15 +1440,95 @@ def list_rag_files(request, chat_id):
         return JsonResponse({"error": "Could not retrieve RAG files."}, status=500)
 
 
+@login_required
+def rag_file_status(request, chat_id, file_id):
+    """Indexing progress of an uploaded RAG file, polled by the UI"""
+    indexing_worker.requeue_stale()
+    rag_file = get_object_or_404(
+        ChatRAGFile.objects.select_related("document"),
+        id=file_id,
+        chat_id=chat_id,
+        chat__user=request.user,
+    )
+    return JsonResponse(_rag_file_status_data(rag_file))
+
+
+@login_required
+def list_documents(request):
+    """The user's document library, with the number of chats using each file"""
+    indexing_worker.requeue_stale()
+    documents = request.user.documents.annotate(chats=Count("attachments"))
+    return JsonResponse(
+        [
+            {
+                **_document_status_data(document),
+                "size": document.file_size,
+                "uploaded_at": document.uploaded_at.isoformat(),
+                "chats": document.chats,
+            }
+            for document in documents
+        ],
+        safe=False,
+    )
+
+
+@login_required
+@require_POST
+def attach_library_document(request, chat_id, document_id):
+    """Attach a document from the user's library to a chat, without re-indexing"""
+    chat = get_object_or_404(Chat, id=chat_id, user=request.user)
+    document = get_object_or_404(UserDocument, id=document_id, user=request.user)
+
+    if chat.rag_files.count() >= MAX_RAG_FILES:
+        return JsonResponse(
+            {"error": f"RAG file limit ({MAX_RAG_FILES}) reached."}, status=400
+        )
+    existing = chat.rag_files.filter(document=document).first()
+    if existing:
+        return JsonResponse(
+            {
+                "error": f"This file is already attached to this chat as '{existing.original_filename}'.",
+                "duplicate": True,
+                "file": _rag_file_status_data(existing),
+            },
+            status=409,
+        )
+
+    try:
+        rag_file = _attach_to_chat(chat, document)
+    except IntegrityError:
+        return JsonResponse(
+            {
+                "error": f"This chat already has a file named '{document.original_filename}'."
+            },
+            status=409,
+        )
+    return _rag_file_response(chat_id, rag_file, status=201)
+
+
+@login_required
+@require_POST
+def delete_library_document(request, document_id):
+    """Delete a document from the library and from every chat it is attached to"""
+    document = get_object_or_404(UserDocument, id=document_id, user=request.user)
+    name = document.original_filename
+    removed = delete_document(document)
+    logger.info(
+        f"Deleted library document '{name}' (ID: {document_id}) and its {removed} chunks"
+    )
+    return JsonResponse({"success": True})
+
+
 # @method_decorator(login_required, name="dispatch")
 class ChatRAGFilesView(View):
     async def post(self, request, chat_id):
-        MAX_RAG_FILES = 10
         try:
             chat = await sync_to_async(get_object_or_404)(
                 Chat, id=chat_id, user=request.user
             )
 
+            # The limit counts attachments: a library document used by several
+            # chats counts once in each of them
             if await sync_to_async(chat.rag_files.count)() >= MAX_RAG_FILES:
                 return JsonResponse(
                     {"error": f"RAG file limit ({MAX_RAG_FILES}) reached."}, status=400
@@ -1406,55 +1547,60 @@ class ChatRAGFilesView(View):
                     status=400,
                 )
 
-            # Create and save the ChatRAGFile instance
-            rag_file = ChatRAGFile(
-                chat=chat,
+            # The upload was hashed while it streamed in (chat.uploads), so a
+            # duplicate is rejected, and a file already in the user's library
+            # is reused, before anything is written to media storage
+            content_hash, file_size = getattr(request, "upload_fingerprints", {}).get(
+                "file", ("", uploaded_file.size)
+            )
+            if content_hash:
+                duplicate = await sync_to_async(
+                    ChatRAGFile.objects.select_related("document")
+                    .filter(chat=chat, document__content_hash=content_hash)
+                    .first
+                )()
+                if duplicate:
+                    return JsonResponse(
+                        {
+                            "error": f"This file has already been uploaded to this chat as '{duplicate.original_filename}'.",
+                            "duplicate": True,
+                            "file": _rag_file_status_data(duplicate),
+                        },
+                        status=409,
+                    )
+
+                document = await sync_to_async(
+                    UserDocument.objects.filter(
+                        user=request.user, content_hash=content_hash
+                    ).first
+                )()
+                if document:
+                    # Stored, extracted and embedded already: attach by reference
+                    rag_file = await sync_to_async(_attach_to_chat)(chat, document)
+                    logger.info(
+                        f"Attached library document {document.id} to chat {chat_id}"
+                    )
+                    return _rag_file_response(chat_id, rag_file, status=201)
+
+            # A new file goes into the user's library first
+            document = UserDocument(
                 user=request.user,
                 file=uploaded_file,
                 original_filename=uploaded_file.name,
+                content_hash=content_hash,
+                file_size=file_size,
             )
-            files_rag_instance = RAG_pipeline()
-
             await sync_to_async(
-                rag_file.save
+                document.save
             )()  # This will call the upload_to logic in the model
+            rag_file = await sync_to_async(attach_document)(chat, document)
 
-            print("Rag file saved")
-            try:
-                print(f"files path {rag_file.file.path}")
-                print(f"files extension {file_extension}")
-
-                await sync_to_async(files_rag_instance.build_index)(
-                    file_paths_and_types=[
-                        (
-                            rag_file.file.path,
-                            file_extension[1:],
-                        )
-                    ],  # Pass the original filename
-                    chat_id=chat_id,
-                    rag_files_map={rag_file.file.path: rag_file},  # Pass the mapping
-                    incremental=True,  # Add new file without clearing existing ones
-                )
-
-                logger.info(f"Successfully built RAG index from file{rag_file.file}")
-            except Exception as e:
-                logger.error(
-                    f"Failed to build RAG index from persisted files: {e}",
-                    exc_info=True,
-                )
-
-            # Index has been built for the new file - no need to clear it
+            # Extraction, embedding and storage happen in the background; the
+            # client polls the status endpoint with the returned job id.
+            await sync_to_async(indexing_worker.submit)(document.id)
+            logger.info(f"Queued RAG indexing job for file {document.file}")
 
-            return JsonResponse(
-                {
-                    "success": True,
-                    "file": {
-                        "id": str(rag_file.id),
-                        "name": rag_file.original_filename,
-                    },
-                },
-                status=201,
-            )
+            return _rag_file_response(chat_id, rag_file, status=202)
 
         except (
             Chat.DoesNotExist
@@ -1490,40 +1636,15 @@ class ChatRAGFilesView(View):
                     {"error": "RAG file not found in this chat"}, status=404
                 )
 
-            # Delete the actual file from storage
-            if rag_file.file:
-                # Ensure the file exists before trying to delete
-                if await sync_to_async(default_storage.exists)(rag_file.file.name):
-                    await sync_to_async(default_storage.delete)(rag_file.file.name)
-                    logger.info(
-                        f"Successfully deleted file from storage: {rag_file.file.name}"
-                    )
-                else:
-                    logger.warning(
-                        f"File not found in storage for {rag_file.file.name}, attempting to delete DB record anyway."
-                    )
-
-            # Delete the ChatRAGFile model instance
+            # Detach the document from this chat. The document, its stored file
+            # and its chunks stay in the user's library for other chats; use
+            # delete_library_document to remove them.
             rag_file_name_for_log = rag_file.original_filename
-            await sync_to_async(rag_file.delete)()
+            removed = await sync_to_async(detach_rag_file)(rag_file)
             logger.info(
-                f"Successfully deleted ChatRAGFile record for '{rag_file_name_for_log}' (ID: {file_id}) from chat {chat_id}"
+                f"Detached '{rag_file_name_for_log}' (ID: {file_id}, {removed} chunks) from chat {chat_id}"
             )
 
-            # After file deletion, clear and rebuild vector index
-            try:
-                await sync_to_async(
-                    DocumentChunk.objects.filter(chat_id=chat_id).delete
-                )()
-                await sync_to_async(
-                    ChatVectorIndex.objects.filter(chat_id=chat_id).delete
-                )()
-                logger.info(
-                    f"Cleared vector index for chat {chat_id} after file deletion"
-                )
-            except Exception as e:
-                logger.error(f"Error clearing vector index after deletion: {e}")
-
             return JsonResponse(
                 {
                     "success": True,
@@ -201,6 +201,14 @@ AUTH_USER_MODEL = "users.CustomUser"
 MEDIA_URL = "/media/"
 MEDIA_ROOT = BASE_DIR / "media"
 
+# Uploads are hashed while they stream in, so duplicate RAG files can be
+# rejected before they are written to media storage
+FILE_UPLOAD_HANDLERS = [
+    "chat.uploads.HashingUploadHandler",
+    "django.core.files.uploadhandler.MemoryFileUploadHandler",
+    "django.core.files.uploadhandler.TemporaryFileUploadHandler",
+]
+
 
 STATIC_URL = "/static/"
 STATIC_ROOT = BASE_DIR / "staticfiles"
@@ -14,3 +14,12 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "chatgpt.settings")
 
 application = get_wsgi_application()
+
+# Build the shared RAG pipeline while the worker waits for its first request.
+# Runs per worker process (gunicorn is not started with --preload).
+from chat.config import RAG_WARMUP_ON_BOOT  # noqa: E402
+
+if RAG_WARMUP_ON_BOOT:
+    from chat.rag import warm_up_in_background
+
+    warm_up_in_background()